@@ -23,7 +23,10 @@ async def generate_music(
     style_prompt: Optional[str] = Form(None),
     style_audio: Optional[UploadFile] = File(None),
     precision: str = Form("fp16"),
-    batch_size: str = Form("1")  # 先接收字符串，然后转换
+    batch_size: str = Form("1"),  # 先接收字符串，然后转换
+    seed: Optional[str] = Form(None),
+    n_candidates: str = Form("1"),
+    draft: bool = Form(False)
 ) -> Dict:
     """生成音乐 - 立即返回 task_id，不等待任务执行"""
     
@@ -33,6 +36,14 @@ async def generate_music(
             batch_size_int = int(batch_size)
         except (ValueError, TypeError):
             batch_size_int = 1
+        try:
+            seed_int = int(seed) if seed not in (None, "") else None
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="seed must be an integer")
+        try:
+            n_candidates_int = int(n_candidates)
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="n_candidates must be an integer")
         # 验证输入
         try:
             request_data = GenerateRequest(
@@ -41,7 +52,10 @@ async def generate_music(
                 style_prompt=style_prompt,
                 style_audio_path=None,  # Will be set after file upload
                 precision=precision,
-                batch_size=batch_size_int
+                batch_size=batch_size_int,
+                seed=seed_int,
+                n_candidates=n_candidates_int,
+                draft=draft
             )
         except ValidationError as e:
             raise HTTPException(status_code=400, detail=f"Validation error: {e.errors()}")
@@ -58,7 +72,10 @@ async def generate_music(
             "style_prompt": request_data.style_prompt,
             "style_audio_path": None,  # Will be set after file upload
             "precision": request_data.precision,
-            "batch_size": batch_size_int
+            "batch_size": batch_size_int,
+            "seed": request_data.seed,
+            "n_candidates": request_data.n_candidates,
+            "draft": request_data.draft
         }
         
         # 如果有音频文件，保存它
@@ -82,6 +99,7 @@ async def generate_music(
         task_id = str(uuid.uuid4())
         task = Task(task_id, "generate", params)
         task_service.tasks[task_id] = task
+        task_service.save_task_state(task)
         
         # 在后台启动任务执行，不等待
         async def start_task_background():
@@ -113,6 +131,12 @@ async def generate_music(
                     max_duration=params.get("max_duration", 300),
                     progress_callback=progress_callback,
                     task_id=task_id,
+                    seed=params.get("seed"),
+                    n_candidates=params.get("n_candidates", 1),
+                    draft=params.get("draft", False),
+                    draft_callback=lambda result: task_service.set_partial_result(
+                        task_id, result, "Draft ready, refining..."
+                    ),
                 )
                 
                 if result.get("success"):
@@ -128,7 +152,11 @@ async def generate_music(
                     task.message = result.get("message", "Generation failed")
                     task.updated_at = datetime.now().isoformat()
                     logger.error(f"Task {task_id} failed: {task.error}")
+                task_service.clear_task_state(task_id)
             except asyncio.CancelledError:
+                # 服务关闭导致的取消保留持久化状态，重启后恢复
+                if task.status == TaskStatus.CANCELLED:
+                    task_service.clear_task_state(task_id)
                 task.status = TaskStatus.CANCELLED
                 task.message = "Task cancelled"
                 task.updated_at = datetime.now().isoformat()
@@ -139,6 +167,7 @@ async def generate_music(
                 task.message = f"Task failed: {str(e)}"
                 task.updated_at = datetime.now().isoformat()
                 logger.error(f"Task {task_id} failed: {e}", exc_info=True)
+                task_service.clear_task_state(task_id)
         
         # 在后台启动任务，不等待
         # 延迟启动任务，确保响应先返回
@@ -163,3 +192,42 @@ async def generate_music(
         logger.error(f"Error in generate_music: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+
+
+@router.post("/generate/{task_id}/reroll")
+async def reroll_music(
+    task_id: str,
+    from_block: Optional[int] = Form(None),
+    from_seconds: Optional[float] = Form(None),
+    seed: Optional[int] = Form(None),
+    sample_steps: Optional[int] = Form(None),
+    lyrics: Optional[str] = Form(None),
+    song_name: Optional[str] = Form(None),
+) -> Dict:
+    """从某块（或某秒）开始重新生成已完成的歌曲，之前的块复用快照 - 立即返回新的 task_id"""
+    if from_block is None and from_seconds is None:
+        raise HTTPException(status_code=400, detail="Either from_block or from_seconds is required")
+    if sample_steps is not None and not 1 <= sample_steps <= 128:
+        raise HTTPException(status_code=400, detail="sample_steps must be in [1, 128]")
+    
+    task_service = get_task_service()
+    source = task_service.tasks.get(task_id)
+    if source is None or source.status != TaskStatus.COMPLETED or not (source.result or {}).get("rerollable"):
+        raise HTTPException(status_code=404, detail=f"Task {task_id} is not rerollable")
+    
+    params = {
+        "source_task_id": task_id,
+        "from_block": from_block,
+        "from_seconds": from_seconds,
+        "seed": seed,
+        "sample_steps": sample_steps,
+        "lyrics": lyrics,
+        "song_name": song_name,
+    }
+    # 与生成任务一样经由 task_service 登记并持久化，重启后由 recover_tasks 重新排队
+    new_task_id = task_service.create_task("reroll", params)
+    return {
+        "task_id": new_task_id,
+        "source_task_id": task_id,
+        "message": "Reroll task created"
+    }
@@ -57,3 +57,13 @@ async def get_hardware_requirements(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+
+@router.get("/g2p-cache")
+async def get_g2p_cache_stats() -> Dict:
+    """获取歌词行 G2P 缓存的命中统计"""
+    from backend.services.inference_service import get_inference_service
+    stats = get_inference_service().get_g2p_cache_stats()
+    if stats is None:
+        return {"enabled": False}
+    return {"enabled": True, **stats}
@@ -0,0 +1,90 @@
+"""
+注意力微基准测试 - 对比不同 KV 长度下的注意力后端与掩码形式
+
+    sdpa+mask   : 显式全 True 掩码（旧路径）
+    sdpa        : 无掩码快速路径（FULL_ATTENTION）
+    eager       : 手写 softmax 注意力
+    flex+window : FlexAttention 块稀疏掩码（块因果 + 历史窗口，整序列前向）
+    sdpa+window : 同上的稠密掩码
+
+用法:
+    python -m backend.benchmarks.bench_attention --kv-lens 256 1024 4096
+"""
+import argparse
+
+import torch
+
+from backend.benchmarks.common import timeit
+from backend.diffrhythm2.backbones import attention_dispatch
+from backend.diffrhythm2.backbones.attention_dispatch import (
+    FLEX_ATTENTION_AVAILABLE,
+    FULL_ATTENTION,
+    block_causal_window_mask,
+    dispatch_attention,
+    set_attention_backend,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="attention backend microbenchmark")
+    parser.add_argument("--kv-lens", type=int, nargs="+", default=[256, 512, 1024, 2048, 4096])
+    parser.add_argument("--q-len", type=int, default=10, help="块大小（查询长度）")
+    parser.add_argument("--heads", type=int, default=16)
+    parser.add_argument("--head-dim", type=int, default=64)
+    parser.add_argument("--window", type=int, default=8, help="整序列测试的历史窗口块数")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16", "bfloat16"])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    dtype = getattr(torch, args.dtype)
+
+    def sync():
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+
+    print(f"device={device} dtype={dtype} q_len={args.q_len}")
+    print(f"{'kv_len':>8} {'sdpa+mask':>10} {'sdpa':>10} {'eager':>10}   (ms, block step)")
+    for kv_len in args.kv_lens:
+        q = torch.randn(1, args.heads, args.q_len, args.head_dim, device=device, dtype=dtype)
+        k = torch.randn(1, args.heads, kv_len, args.head_dim, device=device, dtype=dtype)
+        v = torch.randn_like(k)
+        full_mask = torch.ones(1, 1, args.q_len, kv_len, device=device, dtype=torch.bool)
+
+        results = []
+        for backend, mask in (("sdpa", full_mask), ("sdpa", FULL_ATTENTION), ("eager", FULL_ATTENTION)):
+            set_attention_backend(backend)
+
+            def run(mask=mask):
+                dispatch_attention(q, k, v, mask)
+                sync()
+            results.append(timeit(run, args.repeat) * 1000)
+        print(f"{kv_len:>8} " + " ".join(f"{ms:>10.3f}" for ms in results))
+
+    backends = ["sdpa"] + (["flex"] if FLEX_ATTENTION_AVAILABLE else [])
+    print(f"\n{'seq_len':>8} " + " ".join(f"{b + '+window':>12}" for b in backends) + "   (ms, full sequence)")
+    text_len = 256
+    for kv_len in args.kv_lens:
+        num_blocks = max(1, (kv_len - text_len) // args.q_len)
+        seq_len = text_len + num_blocks * args.q_len
+        q = torch.randn(1, args.heads, seq_len, args.head_dim, device=device, dtype=dtype)
+        k = torch.randn_like(q)
+        v = torch.randn_like(q)
+
+        results = []
+        for backend in backends:
+            set_attention_backend(backend)
+            mask = block_causal_window_mask(text_len, num_blocks, args.q_len, args.window, device=device)
+
+            def run(mask=mask):
+                dispatch_attention(q, k, v, mask)
+                sync()
+            results.append(timeit(run, args.repeat) * 1000)
+        print(f"{seq_len:>8} " + " ".join(f"{ms:>12.3f}" for ms in results))
+
+    attention_dispatch.set_attention_backend()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+多候选基准测试 - 一次 batch 生成 N 个候选与 N 次单独生成的耗时对比
+
+用法:
+    python -m backend.benchmarks.bench_candidates --duration 60 --steps 16 --candidates 1 2 4
+"""
+import argparse
+import time
+
+import torch
+
+from backend.benchmarks.common import CKPT_DIR, load_cfm
+
+
+def run_sampler(model, text, style_prompt, duration, steps, seed, n_candidates=1):
+    start = time.perf_counter()
+    with torch.inference_mode():
+        model.sample_block_cache(
+            text=text,
+            duration=duration,
+            style_prompt=style_prompt,
+            steps=steps,
+            cfg_strength=2.0,
+            seed=seed,
+            process_bar=False,
+            n_candidates=n_candidates,
+        )
+    if str(model.device).startswith("cuda"):
+        torch.cuda.synchronize()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="n_candidates batch vs sequential single runs")
+    parser.add_argument("--config", default=str(CKPT_DIR / "config.json"))
+    parser.add_argument("--ckpt", default=str(CKPT_DIR / "model.safetensors"))
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--duration", type=int, default=60, help="秒")
+    parser.add_argument("--steps", type=int, default=16)
+    parser.add_argument("--text-len", type=int, default=300)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    model = load_cfm(args.config, args.ckpt, device=args.device)
+    dtype = next(model.parameters()).dtype
+    text = torch.randint(1, 500, (1, args.text_len), device=args.device)
+    style_prompt = torch.randn(1, 512, device=args.device, dtype=dtype)
+    frames = args.duration * 5
+    # 预热
+    run_sampler(model, text, style_prompt, model.block_size, args.steps, 0)
+
+    print(f"duration={args.duration}s steps={args.steps}")
+    print(f"{'n':>4} {'batched s':>12} {'sequential s':>14} {'speedup':>9}")
+    for n in args.candidates:
+        batched = run_sampler(model, text, style_prompt, frames, args.steps, 0, n_candidates=n)
+        sequential = sum(run_sampler(model, text, style_prompt, frames, args.steps, i) for i in range(n))
+        print(f"{n:>4} {batched:>12.2f} {sequential:>14.2f} {sequential / batched:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+DiT 单步基准测试 - 对比 torch eager 与 ONNX Runtime 后端的一致性和速度
+
+用法:
+    python -m backend.benchmarks.bench_dit_step --text-len 300 --blocks 1 10 30
+"""
+import argparse
+import tempfile
+from pathlib import Path
+
+import torch
+
+from backend.benchmarks.common import CKPT_DIR, build_cache, load_cfm, step_inputs, timeit
+from backend.diffrhythm2.step_backends import OnnxDiTStep, TorchDiTStep, export_dit_step
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DiT step: torch vs onnxruntime")
+    parser.add_argument("--config", default=str(CKPT_DIR / "config.json"))
+    parser.add_argument("--ckpt", default=str(CKPT_DIR / "model.safetensors"))
+    parser.add_argument("--onnx", default=None, help="已导出的 ONNX 图，缺省时导出到临时目录")
+    parser.add_argument("--text-len", type=int, default=300)
+    parser.add_argument("--blocks", type=int, nargs="+", default=[1, 10, 30], help="历史块数")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    model = load_cfm(args.config, args.ckpt)
+    onnx_path = args.onnx
+    if onnx_path is None:
+        onnx_path = Path(tempfile.mkdtemp()) / "dit_step.onnx"
+        export_dit_step(model.transformer, onnx_path, block_size=model.block_size)
+    backends = {"torch": TorchDiTStep(model.transformer), "onnxruntime": OnnxDiTStep(onnx_path)}
+
+    print(f"{'history':>8} {'torch ms':>10} {'ort ms':>10} {'speedup':>8} {'max diff':>10}")
+    for num_blocks in args.blocks:
+        cache, style_prompt = build_cache(model, args.text_len, num_blocks)
+        inputs = step_inputs(model, args.text_len, num_blocks)
+        x = torch.randn(1, model.block_size, model.num_channels)
+        time = torch.full((1, model.block_size), 0.5)
+
+        preds, times = {}, {}
+        for name, backend in backends.items():
+            def run(backend=backend):
+                with torch.inference_mode():
+                    return backend(x=x, time=time, style_prompt=style_prompt, past_key_value=cache, **inputs)
+            preds[name] = run()
+            times[name] = timeit(run, args.repeat)
+
+        max_diff = (preds["torch"] - preds["onnxruntime"]).abs().max().item()
+        print(
+            f"{num_blocks:>8} {times['torch'] * 1000:>10.1f} {times['onnxruntime'] * 1000:>10.1f} "
+            f"{times['torch'] / times['onnxruntime']:>7.2f}x {max_diff:>10.2e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
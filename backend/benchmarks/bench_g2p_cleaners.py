@@ -0,0 +1,73 @@
+"""
+语言清洗基准测试 - 各语言的文本/音素改写函数：逐条替换的原实现与预编译实现的每字符吞吐对比
+
+用法:
+    python -m backend.benchmarks.bench_g2p_cleaners --lines 2000 --repeat 3
+    python -m backend.benchmarks.bench_g2p_cleaners --languages fr de
+"""
+import argparse
+import random
+import time
+
+from backend.tests.test_g2p_cleaners import (
+    random_lines,
+    reference_expand_abbreviations,
+    reference_special_map,
+    reference_text_normalize,
+)
+
+
+def throughput(convert, lines, repeat):
+    chars = sum(len(line) for line in lines) * repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for line in lines:
+            convert(line)
+    return chars / (time.perf_counter() - start)
+
+
+def cases(rng, count):
+    """(名称, 原实现, 预编译实现, 输入行)"""
+    from g2p.g2p import english, french, german
+
+    phones = sorted({p for rule in english._special_map for side in rule for p in side.split("|")})
+    phones += ["ə", "ɹ", "s", "oː", "æ", "ŋ", "ð"]
+    phone_lines = ["|".join(rng.choice(phones) for _ in range(rng.randint(1, 40))) for _ in range(count)]
+    yield "en", "special_map", lambda t: reference_special_map(english._special_map, t), english.special_map, phone_lines
+
+    words = [regex.pattern[2:-2] for regex, _ in english._abbreviations]
+    text_pieces = words + ["the ", "song ", "of ", "love ", "night ", ", ", ". "] * 4
+    yield "en", "expand_abbreviations", (
+        lambda t: reference_expand_abbreviations(english._abbreviations, t)
+    ), english.expand_abbreviations, random_lines(text_pieces, count, rng, 30)
+
+    for language, module, symbols in (
+        ("fr", french, [(";", ","), ("-", " "), (":", ","), ("&", " et ")]),
+        ("de", german, [(";", ","), ("-", " "), (":", ",")]),
+    ):
+        pieces = ["la ", "nuit ", "der ", "Mond ", "Mme. ", "schön ", "«", "»", "(", ")", "，", "！", "-", "…", " "]
+        yield language, "text_normalize", (
+            lambda t, module=module, symbols=symbols: reference_text_normalize(module, t, symbols)
+        ), module.text_normalize, random_lines(pieces * 3 + list(module.rep_map), count, rng, 30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="language cleaners: sequential rewrites vs precompiled tables")
+    parser.add_argument("--lines", type=int, default=2000, help="每个函数的输入行数")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--languages", nargs="*", help="只测这些语言（en fr de）")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(f"{'language':>8} {'function':>28} {'sequential/s':>14} {'compiled/s':>14} {'speedup':>8} {'diff':>5}")
+    for language, name, reference, compiled, lines in cases(rng, args.lines):
+        if args.languages and language not in args.languages:
+            continue
+        mismatches = sum(compiled(line) != reference(line) for line in lines)
+        sequential = throughput(reference, lines, args.repeat)
+        fast = throughput(compiled, lines, args.repeat)
+        print(f"{language:>8} {name:>28} {sequential:>14,.0f} {fast:>14,.0f} {fast / sequential:>7.1f}x {mismatches:>5}")
+
+
+if __name__ == "__main__":
+    main()
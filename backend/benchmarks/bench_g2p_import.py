@@ -0,0 +1,87 @@
+"""
+G2P 导入耗时基准测试 - 在新进程中测量导入 g2p 前端的耗时，超过预算时以非零状态退出
+
+各语言后端（espeak、jieba 词典、多音字模型、语种识别模型）都在第一次使用时才加载，
+导入本身应保持在固定预算内。--warm-up 额外测量同步预热中英文后端的耗时。
+
+用法:
+    python -m backend.benchmarks.bench_g2p_import --budget 1.5 --repeat 5
+    python -m backend.benchmarks.bench_g2p_import --importtime  # 列出最慢的模块
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+if {warm_up}:
+    {module}.warm_up(background=False)
+print(imported - start, time.perf_counter() - imported)
+"""
+
+
+def measure(module, warm_up):
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET.format(module=module, warm_up=warm_up)],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    import_s, warm_up_s = output.strip().splitlines()[-1].split()
+    return float(import_s), float(warm_up_s)
+
+
+def slowest_modules(module, top):
+    """python -X importtime 的输出中累计耗时最长的模块"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="g2p import time against a fixed budget")
+    parser.add_argument("--module", default="backend.g2p.g2p_generation")
+    parser.add_argument("--budget", type=float, default=1.5, help="导入耗时预算（秒，取中位数比较）")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warm-up", action="store_true", help="同时测量同步预热的耗时")
+    parser.add_argument("--importtime", action="store_true", help="列出累计导入耗时最长的模块")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    if args.importtime:
+        print(f"{'cumulative ms':>14}  module")
+        for cumulative, name in slowest_modules(args.module, args.top):
+            print(f"{cumulative / 1000:>14.1f}  {name}")
+        print()
+
+    runs = [measure(args.module, args.warm_up) for _ in range(args.repeat)]
+    import_s = statistics.median(run[0] for run in runs)
+    print(f"import {args.module}: median {import_s:.3f}s over {args.repeat} runs (budget {args.budget:.3f}s)")
+    if args.warm_up:
+        print(f"warm_up (zh, en): median {statistics.median(run[1] for run in runs):.3f}s")
+    if import_s > args.budget:
+        print("FAIL: import time over budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
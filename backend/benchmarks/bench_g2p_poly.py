@@ -0,0 +1,80 @@
+"""
+多音字模型基准测试 - 不同 ONNX Runtime 会话配置下的吞吐（句/秒），含并发请求下的会话池
+
+用法:
+    python -m backend.benchmarks.bench_g2p_poly --threads 0 2 4 --io-binding --quantized --pool 1 4 --workers 4
+"""
+import argparse
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from g2p.g2p.chinese_model_g2p import BertPolyPredict
+from g2p.g2p.onnx_session import configure_sessions, quantize_model, quantized_model_path
+
+MODEL_DIR = Path(__file__).parent.parent.parent / "g2p" / "sources" / "g2p_chinese_model"
+
+SENTENCES = [
+    "我们一起长大，看着长长的路",
+    "银行行长说这行不行",
+    "重新出发，重重的行李还在肩上",
+    "为了你我还会再为难自己",
+    "音乐响起，快乐的日子里我们都了解",
+]
+
+
+def load_polychars(model_dir):
+    with open(Path(model_dir) / "polychar.txt", encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def run(model, sentences, polychars, workers):
+    def predict(sentence):
+        return model.predict_positions(sentence, [i for i, c in enumerate(sentence) if c in polychars])
+
+    start = time.perf_counter()
+    if workers == 1:
+        for sentence in sentences:
+            predict(sentence)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(predict, sentences))
+    return len(sentences) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="polyphone model throughput per session config")
+    parser.add_argument("--model-dir", default=str(MODEL_DIR))
+    parser.add_argument("--threads", type=int, nargs="+", default=[0, 1, 2, 4], help="intra-op 线程数，0 为全部核心")
+    parser.add_argument("--pool", type=int, nargs="+", default=[1], help="会话池大小")
+    parser.add_argument("--workers", type=int, default=1, help="并发请求数")
+    parser.add_argument("--io-binding", action="store_true", help="同时测试 IO binding")
+    parser.add_argument("--quantized", action="store_true", help="同时测试 int8 模型（不存在时先量化）")
+    parser.add_argument("--repeat", type=int, default=40, help="每轮的句子数 = repeat * 样例句数")
+    args = parser.parse_args()
+
+    model_path = str(Path(args.model_dir) / "poly_bert_model.onnx")
+    if args.quantized and not Path(quantized_model_path(model_path)).exists():
+        print(f"quantizing {model_path}")
+        quantize_model(model_path)
+
+    sentences = SENTENCES * args.repeat
+    polychars = load_polychars(args.model_dir)
+    io_bindings = [False, True] if args.io_binding else [False]
+    quantized = [False, True] if args.quantized else [False]
+    jsonr = str(Path(args.model_dir) / "polydict_r.json")
+    json_file = str(Path(args.model_dir) / "polydict.json")
+
+    print(f"{'threads':>8} {'pool':>5} {'iobind':>7} {'int8':>5} {'sent/s':>10}")
+    for threads, pool, io_binding, int8 in itertools.product(args.threads, args.pool, io_bindings, quantized):
+        configure_sessions(intra_op_num_threads=threads, pool_size=pool, io_binding=io_binding, quantized=int8)
+        model = BertPolyPredict(args.model_dir, jsonr, json_file)
+        # 预热：每种句长各跑一次（IO binding 首次运行分配输出缓冲）
+        run(model, SENTENCES, polychars, 1)
+        throughput = run(model, sentences, polychars, args.workers)
+        print(f"{threads:>8} {pool:>5} {str(io_binding):>7} {str(int8):>5} {throughput:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+普通话 IPA 转写基准测试 - 逐条 re.sub 与单遍编译转写的每字符吞吐对比
+
+用法:
+    python -m backend.benchmarks.bench_g2p_translit --lines 2000 --syllables 12
+"""
+import argparse
+import random
+import time
+
+from g2p.g2p import mandarin
+from backend.tests.test_g2p_transliteration import compiled_to_ipa, reference_to_ipa, syllables
+
+
+def throughput(convert, lines, repeat):
+    chars = sum(len(line) for line in lines) * repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for line in lines:
+            convert(line)
+    return chars / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="bopomofo -> IPA: sequential re.sub vs one compiled scan")
+    parser.add_argument("--lines", type=int, default=2000, help="歌词行数")
+    parser.add_argument("--syllables", type=int, default=12, help="每行音节数")
+    parser.add_argument("--latin-ratio", type=float, default=0.05, help="夹杂单个字母的比例")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    inventory = syllables()
+    letters = [regex.pattern for regex, _ in mandarin._latin_to_bopomofo]
+    lines = [
+        "|".join(
+            rng.choice(letters).upper() if rng.random() < args.latin_ratio else rng.choice(inventory)
+            for _ in range(args.syllables)
+        )
+        for _ in range(args.lines)
+    ]
+    mismatches = sum(compiled_to_ipa(line) != reference_to_ipa(line) for line in lines)
+
+    print(f"{'':>12} {'chars/s':>14}")
+    sequential = throughput(reference_to_ipa, lines, args.repeat)
+    compiled = throughput(compiled_to_ipa, lines, args.repeat)
+    print(f"{'sequential':>12} {sequential:>14,.0f}")
+    print(f"{'compiled':>12} {compiled:>14,.0f}")
+    print(f"speedup {compiled / sequential:.1f}x, mismatching lines: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
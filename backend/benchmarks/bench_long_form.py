@@ -0,0 +1,55 @@
+"""
+长歌曲基准测试 - 逐块生成时单块延迟与 KV 显存随歌曲长度的变化，对比开启/关闭滑动历史窗口
+
+用法:
+    python -m backend.benchmarks.bench_long_form --blocks 600 --window 0 16
+"""
+import argparse
+
+import torch
+
+from backend.benchmarks.common import CKPT_DIR, build_cache, load_cfm, step_inputs, timeit
+from backend.diffrhythm2.step_backends import TorchDiTStep
+
+
+def main():
+    parser = argparse.ArgumentParser(description="per-block latency vs song length")
+    parser.add_argument("--config", default=str(CKPT_DIR / "config.json"))
+    parser.add_argument("--ckpt", default=str(CKPT_DIR / "model.safetensors"))
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--text-len", type=int, default=300)
+    parser.add_argument("--blocks", type=int, default=600, help="歌曲总块数")
+    parser.add_argument("--report-every", type=int, default=100)
+    parser.add_argument("--window", type=int, nargs="+", default=[0, 16], help="历史窗口块数，0 表示不开启")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    def sync():
+        if args.device.startswith("cuda"):
+            torch.cuda.synchronize()
+
+    for window in args.window:
+        model = load_cfm(args.config, args.ckpt, device=args.device, num_history_block=window)
+        dtype = next(model.parameters()).dtype
+        step = TorchDiTStep(model.transformer)
+        cache, style_prompt = build_cache(model, args.text_len, 0)
+        x = torch.randn(1, model.block_size, model.num_channels, device=args.device, dtype=dtype)
+        time = torch.full((1, model.block_size), 0.5, device=args.device, dtype=dtype)
+
+        print(f"\nwindow={model.num_history_block or 'off'}")
+        print(f"{'block':>8} {'step ms':>10} {'kv MiB':>10}")
+        for bid in range(args.blocks + 1):
+            inputs = step_inputs(model, args.text_len, bid)
+            if bid % args.report_every == 0:
+                def run():
+                    with torch.inference_mode():
+                        step(x=x, time=time, style_prompt=style_prompt, past_key_value=cache, **inputs)
+                    sync()
+                ms = timeit(run, args.repeat) * 1000
+                print(f"{bid:>8} {ms:>10.2f} {cache.nbytes() / 2 ** 20:>10.1f}")
+            with torch.inference_mode():
+                step.commit(x=x, time=torch.ones_like(time), style_prompt=style_prompt, past_key_value=cache, **inputs)
+
+
+if __name__ == "__main__":
+    main()
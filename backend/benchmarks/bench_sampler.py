@@ -0,0 +1,66 @@
+"""
+采样器基准测试 - 对比不同 DiT 单步后端下 sample_block_cache 的端到端耗时
+
+用法:
+    python -m backend.benchmarks.bench_sampler --duration 60 --steps 16 --backends torch compiled
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+
+from backend.benchmarks.common import CKPT_DIR, load_cfm
+from backend.utils.inference_utils import prepare_dit_step_backend
+
+
+def run_sampler(model, text, style_prompt, duration, steps):
+    start = time.perf_counter()
+    with torch.inference_mode():
+        model.sample_block_cache(
+            text=text,
+            duration=duration,
+            style_prompt=style_prompt,
+            steps=steps,
+            cfg_strength=2.0,
+            process_bar=False,
+        )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sample_block_cache across DiT step backends")
+    parser.add_argument("--config", default=str(CKPT_DIR / "config.json"))
+    parser.add_argument("--ckpt", default=str(CKPT_DIR / "model.safetensors"))
+    parser.add_argument("--cache-dir", default=None, help="编译/导出缓存目录，缺省为临时目录")
+    parser.add_argument("--duration", type=int, default=60, help="秒")
+    parser.add_argument("--steps", type=int, default=16)
+    parser.add_argument("--text-len", type=int, default=300)
+    parser.add_argument("--backends", nargs="+", default=["torch", "compiled"])
+    args = parser.parse_args()
+
+    cache_dir = Path(args.cache_dir or tempfile.mkdtemp())
+    model = load_cfm(args.config, args.ckpt)
+    text = torch.randint(1, 500, (1, args.text_len))
+    style_prompt = torch.randn(1, 512)
+    frames = args.duration * 5
+
+    print(f"duration={args.duration}s steps={args.steps} threads={torch.get_num_threads()}")
+    results = {}
+    for backend in args.backends:
+        prepare_dit_step_backend(model, cache_dir, backend)
+        # 第一次运行包含编译/导出开销，第二次为稳态
+        cold = run_sampler(model, text, style_prompt, frames, args.steps)
+        warm = run_sampler(model, text, style_prompt, frames, args.steps)
+        results[backend] = warm
+        print(f"{backend:>12}: cold {cold:8.2f}s  warm {warm:8.2f}s")
+
+    baseline = results.get("torch")
+    if baseline:
+        for backend, warm in results.items():
+            print(f"{backend:>12}: {baseline / warm:.2f}x vs torch")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+声码器基准测试 - 对比 eager BigVGAN 与冻结 TorchScript 图的解码速度
+
+用法:
+    python -m backend.benchmarks.bench_vocoder --frames 600 --repeat 3
+"""
+import argparse
+import time
+from pathlib import Path
+
+import torch
+
+from backend.benchmarks.common import timeit
+from backend.bigvgan.model import Generator
+from backend.utils.inference_utils import DECODE_CHUNK_SIZE, DECODE_OVERLAP
+
+
+def main():
+    ckpt_dir = Path(__file__).parent.parent.parent / "Build" / "models" / "ckpt"
+    parser = argparse.ArgumentParser(description="BigVGAN eager vs frozen benchmark")
+    parser.add_argument("--config", default=str(ckpt_dir / "decoder.json"))
+    parser.add_argument("--ckpt", default=str(ckpt_dir / "decoder.bin"))
+    parser.add_argument("--frames", type=int, default=600, help="latent 帧数（5 帧/秒）")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    decoder = Generator(args.config, args.ckpt).to(device)
+    latents = torch.randn(1, decoder.h.in_channels, args.frames, device=device)
+
+    def decode():
+        with torch.inference_mode():
+            return decoder.decode_audio(latents, overlap=DECODE_OVERLAP, chunk_size=DECODE_CHUNK_SIZE)
+
+    eager_audio = decode()
+    eager_time = timeit(decode, args.repeat)
+
+    start = time.perf_counter()
+    decoder.freeze(chunk_size=DECODE_CHUNK_SIZE)
+    freeze_time = time.perf_counter() - start
+    frozen_audio = decode()
+    frozen_time = timeit(decode, args.repeat)
+
+    max_diff = (eager_audio - frozen_audio).abs().max().item()
+    print(f"frames={args.frames} device={device}")
+    print(f"eager : {eager_time:.3f}s")
+    print(f"frozen: {frozen_time:.3f}s (freeze {freeze_time:.1f}s, speedup {eager_time / frozen_time:.2f}x)")
+    print(f"max abs diff: {max_diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
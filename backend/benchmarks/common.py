@@ -0,0 +1,104 @@
+"""
+基准测试公共工具 - 构建 CFM 模型与预填充的 KV cache
+"""
+import json
+import time
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+import torch
+
+from backend.diffrhythm2.backbones.dit import DiT
+from backend.diffrhythm2.cache_utils import BlockFlowMatchingCache
+from backend.diffrhythm2.cfm import CFM
+from backend.diffrhythm2.step_backends import TorchDiTStep
+
+CKPT_DIR = Path(__file__).parent.parent.parent / "Build" / "models" / "ckpt"
+
+
+def load_cfm(
+    config_path: Path = CKPT_DIR / "config.json",
+    ckpt_path: Optional[Path] = CKPT_DIR / "model.safetensors",
+    device: str = "cpu",
+    num_history_block: Optional[int] = None,
+    kv_cache_dtype: Optional[str] = None,
+) -> CFM:
+    """按 config.json 构建 CFM，权重文件不存在时使用随机权重（只影响数值，不影响速度）"""
+    with open(config_path) as f:
+        model_config = json.load(f)
+    model_config["use_flex_attn"] = False
+    model = CFM(
+        transformer=DiT(**model_config),
+        num_channels=model_config["mel_dim"],
+        block_size=model_config["block_size"],
+        num_history_block=num_history_block,
+        kv_cache_dtype=kv_cache_dtype,
+    )
+    if ckpt_path is not None and Path(ckpt_path).exists():
+        from safetensors.torch import load_file
+        model.load_state_dict(load_file(str(ckpt_path)))
+    return model.to(device).eval()
+
+
+@torch.no_grad()
+def build_cache(
+    model: CFM,
+    text_len: int,
+    num_blocks: int,
+    batch: int = 1,
+) -> Tuple[BlockFlowMatchingCache, torch.Tensor]:
+    """预填充文本和 num_blocks 个随机历史块，返回 (cache, style_prompt)"""
+    device = model.device
+    dtype = next(model.parameters()).dtype
+    text = torch.randint(1, 500, (batch, text_len), device=device)
+    style_prompt = torch.randn(batch, 512, device=device, dtype=dtype)
+    cache = BlockFlowMatchingCache(
+        text_lengths=torch.LongTensor([text_len]).to(device),
+        block_size=model.block_size,
+        num_history_block=model.num_history_block,
+        kv_cache_dtype=model.kv_cache_dtype,
+    )
+    text_emb = model.transformer.text_embed(text)
+    with cache.cache_text():
+        model.transformer(
+            x=text_emb,
+            time=torch.full((batch, text_len), -1.0, device=device, dtype=dtype),
+            attn_mask=torch.ones(batch, 1, text_len, text_len, device=device).bool(),
+            position_ids=torch.arange(text_len, device=device)[None, :].repeat(batch, 1),
+            style_prompt=style_prompt,
+            use_cache=True,
+            past_key_value=cache,
+        )
+    step = TorchDiTStep(model.transformer)
+    for bid in range(num_blocks):
+        block_inputs = step_inputs(model, text_len, bid, batch)
+        step.commit(
+            x=torch.randn(batch, model.block_size, model.num_channels, device=device, dtype=dtype),
+            time=torch.ones(batch, model.block_size, device=device, dtype=dtype),
+            style_prompt=style_prompt,
+            past_key_value=cache,
+            **block_inputs,
+        )
+    return cache, style_prompt
+
+
+def step_inputs(model: CFM, text_len: int, block_idx: int, batch: int = 1, history_len: Optional[int] = None):
+    """生成第 block_idx 个块的 attn_mask 与 position_ids"""
+    device = model.device
+    block_size = model.block_size
+    clean_len = block_idx * block_size if history_len is None else history_len
+    if model.num_history_block is not None:
+        clean_len = min(clean_len, model.num_history_block * block_size)
+    attn_mask = torch.ones(batch, 1, block_size, text_len + clean_len + block_size, device=device).bool()
+    position_ids = torch.arange(block_idx * block_size, (block_idx + 1) * block_size, device=device)
+    return {"attn_mask": attn_mask, "position_ids": position_ids[None, :].repeat(batch, 1)}
+
+
+def timeit(fn: Callable, repeat: int = 5, warmup: int = 1) -> float:
+    """返回 fn 的平均耗时（秒）"""
+    for _ in range(warmup):
+        fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
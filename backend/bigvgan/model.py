@@ -481,12 +481,19 @@ class BigVGAN(
         return model
 
 
+def save_frozen(frozen, save_path, checkpoint_id=None):
+    """Save a frozen graph together with the id of the checkpoint whose weights it contains."""
+    Path(save_path).parent.mkdir(parents=True, exist_ok=True)
+    torch.jit.save(frozen, str(save_path), _extra_files={"checkpoint_id": checkpoint_id or ""})
+
+
 class Generator(torch.nn.Module):
     def __init__(self, config_file, ckpt_path):
         super().__init__()
         with open(config_file) as f:
             json_config = json.load(f)
         self.h = AttrDict(json_config)
+        self.ckpt_path = ckpt_path
         self.decoder = BigVGAN(self.h)
         if ckpt_path.endswith(".safetensors"):
             checkpoint_dict = load_file(ckpt_path)
@@ -495,6 +502,73 @@ class Generator(torch.nn.Module):
         self.decoder.load_state_dict(checkpoint_dict["generator"])
         self.decoder.remove_weight_norm()
         self.decoder.eval()
+        # frozen, shape-specialized graph of self.decoder (see `freeze`)
+        self.frozen_decoder = None
+        self.frozen_shape = None
+        # input shapes already reported as falling back to the eager decoder
+        self._eager_shapes = set()
+
+    @torch.no_grad()
+    def freeze(self, chunk_size=20, batch_size=1, save_path=None, checkpoint_id=None):
+        """
+        Trace the vocoder for a fixed [batch_size, in_channels, chunk_size] input and freeze it with
+        TorchScript, so the `ups`/`resblocks` loops are unrolled and conv/activation ops can be fused.
+        Must be called after the final `.to()`/`.half()`, weights are baked into the graph.
+        `checkpoint_id` is stored with the saved graph and checked by `load_frozen`.
+        """
+        param = next(self.decoder.parameters())
+        example = torch.randn(
+            batch_size, self.h.in_channels, chunk_size, device=param.device, dtype=param.dtype
+        )
+        traced = torch.jit.trace(self.decoder.eval(), example, check_trace=False)
+        frozen = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+        if save_path is not None:
+            save_frozen(frozen, save_path, checkpoint_id)
+        self._set_frozen(frozen, example)
+        return frozen
+
+    def load_frozen(self, path, chunk_size=20, batch_size=1, checkpoint_id=None):
+        """
+        Load a graph produced by `freeze(save_path=...)`, returns False if it is unusable or was
+        frozen from a different checkpoint than `checkpoint_id`.
+        """
+        param = next(self.decoder.parameters())
+        try:
+            extra_files = {"checkpoint_id": ""}
+            frozen = torch.jit.load(str(path), map_location=param.device, _extra_files=extra_files)
+            if checkpoint_id is not None and extra_files["checkpoint_id"] != checkpoint_id:
+                print(f"[INFO] Frozen vocoder {path} was built from another checkpoint, ignoring it")
+                return False
+            example = torch.zeros(
+                batch_size, self.h.in_channels, chunk_size, device=param.device, dtype=param.dtype
+            )
+            with torch.no_grad():
+                frozen(example)
+        except Exception as e:
+            print(f"[INFO] Failed to load frozen vocoder from {path}: {e}")
+            return False
+        self._set_frozen(frozen, example)
+        return True
+
+    def _set_frozen(self, frozen, example):
+        # keep the graph out of the module tree so `.to()`/`state_dict()` never touch it
+        self.__dict__["frozen_decoder"] = frozen
+        self.frozen_shape = (tuple(example.shape), example.dtype, example.device)
+
+    def _decode_chunk(self, x_chunk):
+        if (
+            self.frozen_decoder is not None
+            and (tuple(x_chunk.shape), x_chunk.dtype, x_chunk.device) == self.frozen_shape
+        ):
+            return self.frozen_decoder(x_chunk)
+        if self.frozen_decoder is not None and tuple(x_chunk.shape) not in self._eager_shapes:
+            # e.g. several candidates decoded together: the graph is specialized to frozen_shape
+            self._eager_shapes.add(tuple(x_chunk.shape))
+            print(
+                f"[INFO] Vocoder input {tuple(x_chunk.shape)} does not match the frozen graph "
+                f"{self.frozen_shape[0]}, decoding with the eager model"
+            )
+        return self.decoder(x_chunk)
 
     def decode_audio(self, latents, overlap=5, chunk_size=20):
         # chunked decoding
@@ -519,7 +593,7 @@ class Generator(torch.nn.Module):
         for i in range(num_chunks):
             x_chunk = chunks[i,:]
             # decode the chunk
-            y_chunk = self.decoder(x_chunk)
+            y_chunk = self._decode_chunk(x_chunk)
             # figure out where to put the audio along the time domain
             if i == num_chunks-1:
                 # final chunk always goes at the end
@@ -0,0 +1,80 @@
+# Post-training int8 quantization of the BigVGAN Conv1d/ConvTranspose1d stack.
+#   Snake/SnakeBeta and the anti-aliased resamplers stay in float, every conv is wrapped
+#   in its own quant/dequant pair and calibrated with static activation observers.
+
+import copy
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import torch.ao.quantization as tq
+
+
+DEFAULT_STFT_RESOLUTIONS = ((512, 128, 512), (1024, 256, 1024), (2048, 512, 2048))
+
+
+def _default_engine():
+    engines = torch.backends.quantized.supported_engines
+    for engine in ("x86", "fbgemm", "qnnpack"):
+        if engine in engines:
+            return engine
+    raise RuntimeError(f"No int8 quantization engine available, got {engines}")
+
+
+def _wrap_convs(module, conv_qconfig, transpose_qconfig):
+    for name, child in module.named_children():
+        if isinstance(child, (nn.Conv1d, nn.ConvTranspose1d)):
+            wrapped = nn.Sequential(tq.QuantStub(), child, tq.DeQuantStub())
+            # quantized ConvTranspose1d only supports per-tensor weights
+            wrapped.qconfig = transpose_qconfig if isinstance(child, nn.ConvTranspose1d) else conv_qconfig
+            setattr(module, name, wrapped)
+        else:
+            _wrap_convs(child, conv_qconfig, transpose_qconfig)
+
+
+@torch.no_grad()
+def quantize_bigvgan(model, calibration_chunks, engine=None):
+    """
+    Return an int8 copy of `model` (a BigVGAN without weight norm), calibrated on
+    `calibration_chunks`, an iterable of [B, in_channels, T] latent tensors.
+    The result runs on CPU only.
+    """
+    engine = engine or _default_engine()
+    torch.backends.quantized.engine = engine
+
+    conv_qconfig = tq.get_default_qconfig(engine)
+    transpose_qconfig = tq.QConfig(activation=conv_qconfig.activation, weight=tq.default_weight_observer)
+
+    qmodel = copy.deepcopy(model).float().cpu().eval()
+    _wrap_convs(qmodel, conv_qconfig, transpose_qconfig)
+    tq.prepare(qmodel, inplace=True)
+    num_chunks = 0
+    for chunk in calibration_chunks:
+        qmodel(chunk.float().cpu())
+        num_chunks += 1
+    if num_chunks == 0:
+        raise ValueError("At least one calibration chunk is required")
+    tq.convert(qmodel, inplace=True)
+    return qmodel
+
+
+def multi_resolution_stft_distance(reference, estimate, resolutions=DEFAULT_STFT_RESOLUTIONS):
+    """
+    Spectral convergence + log-magnitude L1, averaged over STFT resolutions
+    given as (n_fft, hop_length, win_length). Inputs are [..., T] waveforms.
+    """
+    reference = reference.float().reshape(-1, reference.shape[-1])
+    estimate = estimate.float().reshape(-1, estimate.shape[-1])
+    distance = 0.0
+    for n_fft, hop_length, win_length in resolutions:
+        window = torch.hann_window(win_length, device=reference.device)
+        ref_mag = torch.stft(
+            reference, n_fft, hop_length, win_length, window, return_complex=True
+        ).abs().clamp_min(1e-7)
+        est_mag = torch.stft(
+            estimate, n_fft, hop_length, win_length, window, return_complex=True
+        ).abs().clamp_min(1e-7)
+        spectral_convergence = torch.linalg.norm(ref_mag - est_mag) / torch.linalg.norm(ref_mag)
+        log_magnitude = F.l1_loss(ref_mag.log(), est_mag.log())
+        distance += (spectral_convergence + log_magnitude).item()
+    return distance / len(resolutions)
@@ -0,0 +1,196 @@
+# Copyright 2025 ASLP Lab and Xiaomi Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Attention backend dispatch for the NAR Llama layers.
+
+An attention mask reaching `dispatch_attention` is one of
+    FULL_ATTENTION: every query sees every key, maskless SDPA fast path
+    None:           causal when q_len > 1 (the original Llama SDPA default)
+    BlockMask:      FlexAttention block-sparse mask, run with flex_attention
+    torch.Tensor:   dense bool / additive mask of shape [b, 1, q, kv], run with SDPA / eager
+`prepare_attention_mask` turns an all-true dense mask into FULL_ATTENTION once per DiT
+forward, instead of every layer re-applying it. Dense masks are never converted to a
+BlockMask per forward; callers that want FlexAttention build the BlockMask once (see
+`block_causal_window_mask`).
+"""
+
+import math
+
+import torch
+import torch.nn.functional as F
+
+try:
+    from torch.nn.attention.flex_attention import BlockMask, create_block_mask
+    from .flex_attention import flex_attention_forward
+    FLEX_ATTENTION_AVAILABLE = True
+except ImportError:
+    BlockMask = None
+    FLEX_ATTENTION_AVAILABLE = False
+
+ATTENTION_BACKENDS = ("sdpa", "flex", "eager")
+
+_attention_backend = None
+
+
+class _FullAttention:
+    """Sentinel mask: no masking at all, every query attends to every key."""
+
+    def __repr__(self):
+        return "FULL_ATTENTION"
+
+
+FULL_ATTENTION = _FullAttention()
+
+
+def default_attention_backend():
+    """FlexAttention on CUDA hosts that have it, SDPA everywhere else."""
+    if FLEX_ATTENTION_AVAILABLE and torch.cuda.is_available():
+        return "flex"
+    return "sdpa"
+
+
+def set_attention_backend(backend=None):
+    """Select the attention backend for this process ("auto"/None picks per host)."""
+    global _attention_backend
+    if backend in (None, "auto"):
+        backend = default_attention_backend()
+    if backend not in ATTENTION_BACKENDS:
+        raise ValueError(f"Unknown attention backend {backend}, expected one of {ATTENTION_BACKENDS}")
+    if backend == "flex" and not FLEX_ATTENTION_AVAILABLE:
+        raise RuntimeError("FlexAttention requires torch>=2.5")
+    _attention_backend = backend
+    return backend
+
+
+def get_attention_backend():
+    if _attention_backend is None:
+        set_attention_backend()
+    return _attention_backend
+
+
+def is_block_mask(mask):
+    return BlockMask is not None and isinstance(mask, BlockMask)
+
+
+def is_full_attention_mask(mask):
+    return mask is FULL_ATTENTION or (
+        isinstance(mask, torch.Tensor) and mask.dtype == torch.bool and bool(mask.all())
+    )
+
+
+def _is_compiling():
+    # torch.compiler.is_compiling is torch>=2.3, older releases only have the dynamo one
+    is_compiling = getattr(getattr(torch, "compiler", None), "is_compiling", None)
+    if is_compiling is None:
+        try:
+            from torch._dynamo import is_compiling
+        except ImportError:
+            return False
+    return is_compiling()
+
+
+def prepare_attention_mask(mask):
+    """Normalize a caller mask once per forward, see module docstring."""
+    if mask is None or mask is FULL_ATTENTION or is_block_mask(mask):
+        return mask
+    if torch.jit.is_tracing() or _is_compiling():
+        # data dependent checks would break the graph, keep the dense mask
+        return mask
+    if is_full_attention_mask(mask):
+        return FULL_ATTENTION
+    return mask
+
+
+def block_causal_window_mask(text_len, num_blocks, block_size, num_history_block=None, batch=1, device=None):
+    """
+    Mask for one full-sequence pass over [text | block_0 ... block_{n-1}] that reproduces the
+    block-by-block cache: text sees text, block j sees text, itself and the previous
+    `num_history_block` blocks (all previous blocks if None).
+    Returns a BlockMask with the flex backend, otherwise a dense [b, 1, L, L] bool mask.
+    """
+    seq_len = text_len + num_blocks * block_size
+    window = num_blocks if num_history_block is None else num_history_block
+
+    def mask_mod(batch_idx, head_idx, q_idx, kv_idx):
+        q_block = (q_idx - text_len) // block_size
+        kv_block = (kv_idx - text_len) // block_size
+        kv_is_text = kv_idx < text_len
+        q_is_text = q_idx < text_len
+        in_window = (kv_block <= q_block) & (kv_block >= q_block - window)
+        return kv_is_text | (~q_is_text & ~kv_is_text & in_window)
+
+    if get_attention_backend() == "flex":
+        return create_block_mask(mask_mod, B=None, H=None, Q_LEN=seq_len, KV_LEN=seq_len, device=device)
+
+    idx = torch.arange(seq_len, device=device)
+    mask = mask_mod(None, None, idx[:, None], idx[None, :])
+    return mask[None, None].expand(batch, 1, seq_len, seq_len)
+
+
+def _eager_attention(query, key, value, attention_mask, dropout_p, training, is_causal=False):
+    attn_weights = torch.matmul(query, key.transpose(2, 3)) / math.sqrt(query.shape[-1])
+    if is_causal:
+        # same alignment as SDPA's is_causal
+        attention_mask = torch.ones(
+            query.shape[-2], key.shape[-2], dtype=torch.bool, device=query.device
+        ).tril()
+    if attention_mask is not None:
+        if attention_mask.dtype == torch.bool:
+            attn_weights = attn_weights.masked_fill(~attention_mask, float("-inf"))
+        else:
+            attn_weights = attn_weights + attention_mask
+    attn_weights = F.softmax(attn_weights, dim=-1, dtype=torch.float32).to(query.dtype)
+    attn_weights = F.dropout(attn_weights, p=dropout_p, training=training)
+    return torch.matmul(attn_weights, value)
+
+
+def dispatch_attention(query, key, value, attention_mask=None, dropout_p=0.0, training=False):
+    """
+    query: [b, h, q, d], key/value: [b, h, kv, d] (kv heads already repeated)
+    attention_mask: FULL_ATTENTION, None (causal), a BlockMask or a dense mask, see module docstring.
+    Returns the attention output as [b, q, h, d].
+    """
+    if is_block_mask(attention_mask):
+        attn_output, _ = flex_attention_forward(query, key, value, attention_mask, training=training)
+        return attn_output
+
+    is_causal = False
+    if attention_mask is FULL_ATTENTION:
+        attention_mask = None
+    elif attention_mask is None:
+        is_causal = query.shape[-2] > 1
+    else:
+        attention_mask = attention_mask[:, :, :, : key.shape[-2]]
+        # SDPA with memory-efficient backend is currently (torch==2.1.2) bugged with non-contiguous inputs with custom attn_mask,
+        # Reference: https://github.com/pytorch/pytorch/issues/112577.
+        if query.device.type == "cuda":
+            query = query.contiguous()
+            key = key.contiguous()
+            value = value.contiguous()
+
+    if get_attention_backend() == "eager":
+        attn_output = _eager_attention(
+            query, key, value, attention_mask, dropout_p if training else 0.0, training, is_causal=is_causal
+        )
+    else:
+        attn_output = F.scaled_dot_product_attention(
+            query,
+            key,
+            value,
+            attn_mask=attention_mask,
+            dropout_p=dropout_p if training else 0.0,
+            is_causal=is_causal,
+        )
+    return attn_output.transpose(1, 2)
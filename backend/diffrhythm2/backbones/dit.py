@@ -21,6 +21,7 @@ from torch import nn
 
 from transformers.models.llama.modeling_llama import LlamaRotaryEmbedding, LlamaConfig
 from .llama_nar import LlamaNARDecoderLayer
+from .attention_dispatch import prepare_attention_mask
 
 class TextEmbedding(nn.Module):
     def __init__(self, text_num_embeds, text_dim, conv_layers=0, conv_mult=2):
@@ -39,7 +40,7 @@ class InputEmbedding(nn.Module):
         self.proj_2 = nn.Linear(cond_dim, out_dim)
 
     def forward(self, x, style_emb, time_emb):  # noqa: F722
-        style_emb = style_emb.unsqueeze(1).repeat(1, x.shape[1], 1)
+        style_emb = style_emb.unsqueeze(1).expand(-1, x.shape[1], -1)
         x_orig = x
         x = x + style_emb + time_emb
         x = self.proj(x) + x_orig
@@ -178,7 +179,8 @@ class DiT(nn.Module):
         time: [b, n, 1]
         position_ids: [b, n]
         style_prompt: [b, 512]
-        attn_mask: [b, 1, n, n]
+        attn_mask: [b, 1, n, n], FULL_ATTENTION, None (causal) or a FlexAttention BlockMask
+            (see attention_dispatch)
         """
         batch, seq_len = x.shape[0], x.shape[1]
         t = self.time_embed(time)
@@ -190,6 +192,7 @@ class DiT(nn.Module):
             residual = x
 
         position_embeddings = self.rotary_embed(x, position_ids)
+        attn_mask = prepare_attention_mask(attn_mask)
 
         attn_weights = []
         if not use_cache:
@@ -19,12 +19,53 @@ from typing import Optional, List, Tuple, Dict, Any
 from transformers.cache_utils import Cache
 from contextlib import contextmanager
 
+
+# storage dtype and largest representable magnitude of the quantized KV formats
+KV_CACHE_DTYPES = {
+    "int8": (torch.int8, 127.0),
+    "fp8": (getattr(torch, "float8_e4m3fn", None), 448.0),
+}
+
+
+def resolve_kv_cache_dtype(kv_cache_dtype: Optional[str]) -> Optional[str]:
+    """Validates a quantized KV format name, None / "none" keeps the model dtype."""
+    if kv_cache_dtype in (None, "none", "auto"):
+        return None
+    if kv_cache_dtype not in KV_CACHE_DTYPES:
+        raise ValueError(f"Unknown kv_cache_dtype {kv_cache_dtype}, expected one of {list(KV_CACHE_DTYPES)}")
+    if KV_CACHE_DTYPES[kv_cache_dtype][0] is None:
+        raise RuntimeError(f"kv_cache_dtype {kv_cache_dtype} is not supported by torch {torch.__version__}")
+    return kv_cache_dtype
+
+
+def quantize_per_head(states: torch.Tensor, kv_cache_dtype: str) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Quantizes [b, h, n, d] states with one scale per (batch, head).
+    Returns the quantized states and the [b, h, 1, 1] scales.
+    """
+    storage_dtype, max_value = KV_CACHE_DTYPES[kv_cache_dtype]
+    scale = states.abs().amax(dim=(-2, -1), keepdim=True).float().clamp(min=1e-8) / max_value
+    quantized = states.float() / scale
+    if not storage_dtype.is_floating_point:
+        quantized = quantized.round_().clamp_(-max_value, max_value)
+    return quantized.to(storage_dtype), scale.to(states.dtype)
+
+
+def dequantize_into(out: torch.Tensor, quantized: torch.Tensor, scale: Optional[torch.Tensor]) -> torch.Tensor:
+    """Writes the dequantized states straight into `out` (a slice of the attention KV buffer)."""
+    out.copy_(quantized)
+    if scale is not None:
+        out.mul_(scale)
+    return out
+
+
 class BlockFlowMatchingCache(Cache):
     def __init__(
             self, 
             text_lengths: Optional[torch.Tensor] = None, 
             block_size: Optional[int] = None, 
-            num_history_block: Optional[int] = None
+            num_history_block: Optional[int] = None,
+            kv_cache_dtype: Optional[str] = None
         ) -> None:
         super().__init__()
         self._seen_tokens = 0 
@@ -35,6 +76,15 @@ class BlockFlowMatchingCache(Cache):
         self.text_lengths = text_lengths
         self.block_size = block_size
         self.num_history_block = num_history_block
+        # quantized storage of the text and history KV (see KV_CACHE_DTYPES), the per-head
+        # scales live next to the caches and are applied while building the attention KV
+        self.kv_cache_dtype = resolve_kv_cache_dtype(kv_cache_dtype)
+        self.text_key_scale: List[torch.Tensor] = []
+        self.text_value_scale: List[torch.Tensor] = []
+        self.key_scale: List[torch.Tensor] = []
+        self.value_scale: List[torch.Tensor] = []
+        self._packed_text_len = None
+        self._text_packed = True
         self.is_cache_text = False
         self.is_storage_cache = False
         assert (
@@ -88,6 +138,12 @@ class BlockFlowMatchingCache(Cache):
         if self.is_cache_text:
             if self.text_lengths is None:
                 self.text_lengths = torch.LongTensor([key_states.shape[-2]] * key_states.shape[0])
+            if self.kv_cache_dtype is not None:
+                self._append_quantized(
+                    key_states, value_states,
+                    self.text_key_cache, self.text_value_cache, self.text_key_scale, self.text_value_scale,
+                )
+                return key_states, value_states
             self.text_key_cache.append(key_states)
             self.text_value_cache.append(value_states)
             return self.text_key_cache[layer_idx], self.text_value_cache[layer_idx]
@@ -96,6 +152,9 @@ class BlockFlowMatchingCache(Cache):
         if layer_idx == 0:
             self._seen_tokens += key_states.shape[-2]
 
+        if self.kv_cache_dtype is not None:
+            return self._update_quantized(key_states, value_states, layer_idx)
+
         # Update the cache
         if key_states is not None:
             if len(self.key_cache) <= layer_idx:
@@ -129,6 +188,14 @@ class BlockFlowMatchingCache(Cache):
             if len(self.text_value_cache) > layer_idx 
             else torch.zeros(value_states.shape[0], value_states.shape[1], 0, value_states.shape[3], device=value_states.device, dtype=value_states.dtype)
         )
+        text_len = text_key_cache.shape[-2]
+        if text_len == 0 or self._text_is_packed(text_len):
+            # a text prefix cached once for several candidates (batch 1) is broadcast, not copied
+            batch = key_states.shape[0]
+            k_s = torch.cat([text_key_cache.expand(batch, -1, -1, -1), key_states], dim=-2)
+            v_s = torch.cat([text_value_cache.expand(batch, -1, -1, -1), value_states], dim=-2)
+            return k_s, v_s
+
         for b in range(self.text_lengths.shape[0]):
             k_s.append(torch.cat([text_key_cache[b][:, :self.text_lengths[b], :], key_states[b]], dim=-2))
             v_s.append(torch.cat([text_value_cache[b][:, :self.text_lengths[b], :], value_states[b]], dim=-2))
@@ -137,6 +204,146 @@ class BlockFlowMatchingCache(Cache):
 
         return k_s, v_s
 
+    def _history_length(self) -> Optional[int]:
+        if self.num_history_block is None:
+            return None
+        return self.block_size * (self.num_history_block + 1)
+
+    def _append_quantized(self, key_states, value_states, key_cache, value_cache, key_scale, value_scale):
+        for states, cache, scales in ((key_states, key_cache, key_scale), (value_states, value_cache, value_scale)):
+            quantized, scale = quantize_per_head(states, self.kv_cache_dtype)
+            cache.append(quantized)
+            scales.append(scale)
+
+    def _update_quantized(self, key_states, value_states, layer_idx):
+        for _ in range(len(self.key_cache), layer_idx + 1):
+            self.key_cache.append([])
+            self.value_cache.append([])
+            self.key_scale.append([])
+            self.value_scale.append([])
+
+        history_length = self._history_length()
+        if self.is_storage_cache:
+            # the finished block joins the quantized history and is read back from it
+            for states, cache, scales in (
+                (key_states, self.key_cache, self.key_scale),
+                (value_states, self.value_cache, self.value_scale),
+            ):
+                quantized, scale = quantize_per_head(states, self.kv_cache_dtype)
+                # one scale per head and block, kept per token so trimming stays a slice
+                scale = scale.expand(-1, -1, states.shape[-2], -1).contiguous()
+                if len(cache[layer_idx]) != 0:
+                    quantized = torch.cat([cache[layer_idx], quantized], dim=-2)
+                    scale = torch.cat([scales[layer_idx], scale], dim=-2)
+                if history_length is not None:
+                    quantized = quantized[:, :, -history_length:, :]
+                    scale = scale[:, :, -history_length:, :]
+                cache[layer_idx] = quantized
+                scales[layer_idx] = scale
+            k_s = self._read_kv(layer_idx, "key", None, None, like=key_states)
+            v_s = self._read_kv(layer_idx, "value", None, None, like=value_states)
+            return k_s, v_s
+
+        history_keep = None if history_length is None else max(history_length - key_states.shape[-2], 0)
+        k_s = self._read_kv(layer_idx, "key", key_states, history_keep, like=key_states)
+        v_s = self._read_kv(layer_idx, "value", value_states, history_keep, like=value_states)
+        return k_s, v_s
+
+    def _read_kv(self, layer_idx, kind, current_states, history_keep, like):
+        """text | history | current for one of key / value, dequantized in place into a single buffer."""
+        if kind == "key":
+            text_cache, text_scale, cache, scales = self.text_key_cache, self.text_key_scale, self.key_cache, self.key_scale
+        else:
+            text_cache, text_scale, cache, scales = self.text_value_cache, self.text_value_scale, self.value_cache, self.value_scale
+        text = text_cache[layer_idx] if len(text_cache) > layer_idx else None
+        history = cache[layer_idx] if len(cache[layer_idx]) != 0 else None
+        history_scale = scales[layer_idx] if history is not None else None
+        if history is not None and history_keep is not None:
+            start = max(history.shape[-2] - history_keep, 0)
+            history = history[:, :, start:, :]
+            history_scale = history_scale[:, :, start:, :]
+
+        text_len = 0 if text is None else text.shape[-2]
+        history_len = 0 if history is None else history.shape[-2]
+        current_len = 0 if current_states is None else current_states.shape[-2]
+        batch, heads, _, head_dim = like.shape
+        out = torch.empty(
+            batch, heads, text_len + history_len + current_len, head_dim, device=like.device, dtype=like.dtype
+        )
+        if text is not None:
+            # broadcasts a batch 1 text prefix over all candidates
+            dequantize_into(out[:, :, :text_len], text, text_scale[layer_idx])
+        if history is not None:
+            dequantize_into(out[:, :, text_len:text_len + history_len], history, history_scale)
+        if current_states is not None:
+            out[:, :, text_len + history_len:].copy_(current_states)
+
+        if text_len != 0 and not self._text_is_packed(text_len):
+            # shorter text prefixes are packed and right padded, as in `update`
+            rest = out[:, :, text_len:]
+            out = torch.nn.utils.rnn.pad_sequence(
+                [torch.cat([out[b, :, :self.text_lengths[b]], rest[b]], dim=-2).transpose(0, 1) for b in range(batch)],
+                batch_first=True,
+            ).transpose(1, 2)
+        return out
+
+    def _text_is_packed(self, text_len) -> bool:
+        if self._packed_text_len != text_len:
+            self._text_packed = bool((self.text_lengths == text_len).all())
+            self._packed_text_len = text_len
+        return self._text_packed
+
+    def read_text_kv(self, layer_idx: int, key_out: torch.Tensor, value_out: torch.Tensor) -> None:
+        """Writes the (dequantized) text KV of `layer_idx` into `key_out` / `value_out`."""
+        quantized = self.kv_cache_dtype is not None
+        dequantize_into(key_out, self.text_key_cache[layer_idx], self.text_key_scale[layer_idx] if quantized else None)
+        dequantize_into(value_out, self.text_value_cache[layer_idx], self.text_value_scale[layer_idx] if quantized else None)
+
+    def read_history_kv(self, layer_idx: int, key_out: torch.Tensor, value_out: torch.Tensor) -> None:
+        """Writes the (dequantized) history KV of `layer_idx` into `key_out` / `value_out`."""
+        quantized = self.kv_cache_dtype is not None
+        dequantize_into(key_out, self.key_cache[layer_idx], self.key_scale[layer_idx] if quantized else None)
+        dequantize_into(value_out, self.value_cache[layer_idx], self.value_scale[layer_idx] if quantized else None)
+
+    def fork(self, history_length: Optional[int] = None) -> "BlockFlowMatchingCache":
+        """
+        Copy of the cache that shares its tensors (they are replaced on update, never written in
+        place). `history_length` keeps only the first tokens of the history.
+        """
+        other = BlockFlowMatchingCache(
+            text_lengths=self.text_lengths,
+            block_size=self.block_size,
+            num_history_block=self.num_history_block,
+            kv_cache_dtype=self.kv_cache_dtype,
+        )
+        other.text_key_cache = list(self.text_key_cache)
+        other.text_value_cache = list(self.text_value_cache)
+        other.text_key_scale = list(self.text_key_scale)
+        other.text_value_scale = list(self.text_value_scale)
+        for name in ("key_cache", "value_cache", "key_scale", "value_scale"):
+            layers = getattr(self, name)
+            if history_length is not None:
+                layers = [
+                    layer[:, :, :history_length] if isinstance(layer, torch.Tensor) and history_length != 0 else []
+                    for layer in layers
+                ]
+            setattr(other, name, list(layers))
+        other._seen_tokens = self._seen_tokens if history_length is None else history_length
+        return other
+
+    def nbytes(self) -> int:
+        """Bytes held by the text and history KV, including quantization scales."""
+        tensors = (
+            self.text_key_cache + self.text_value_cache + self.key_cache + self.value_cache
+            + self.text_key_scale + self.text_value_scale + self.key_scale + self.value_scale
+        )
+        return sum(t.numel() * t.element_size() for t in tensors if isinstance(t, torch.Tensor))
+
+    def store_block(self, key_states: torch.Tensor, value_states: torch.Tensor, layer_idx: int) -> None:
+        """Appends the KV of a finished block for `layer_idx`, as `update` does inside `cache_context`."""
+        with self.cache_context():
+            self.update(key_states, value_states, layer_idx)
+
     def get_seq_length(self, layer_idx: Optional[int] = 0) -> int:
         """Returns the sequence length of the cached states. A layer index can be optionally passed."""
         # TODO: deprecate this function in favor of `cache_position`
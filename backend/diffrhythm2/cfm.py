@@ -19,7 +19,29 @@ from tqdm import tqdm
 
 from torchdiffeq import odeint
 from .backbones.dit import DiT
-from .cache_utils import BlockFlowMatchingCache
+from .cache_utils import BlockFlowMatchingCache, resolve_kv_cache_dtype
+from .backbones.attention_dispatch import FULL_ATTENTION, block_causal_window_mask
+from .sampling_state import KVCapture, SamplingRecord, block_noise, derive_block_seeds
+from .step_backends import TorchDiTStep
+
+
+def eos_distance(frames):
+    """MSE of latent frames [..., C] to the all-ones EOS frame."""
+    return (frames - 1).pow(2).mean(dim=-1)
+
+
+def is_eos(frames, threshold=0.05):
+    """[..., C] -> [...] bool, frames close enough to the all-ones EOS frame."""
+    return eos_distance(frames) <= threshold
+
+
+def last_non_eos(block, offset):
+    """
+    Per candidate of a block [b, n, C] starting at frame `offset`: index of its last non-EOS
+    frame, -1 when the whole block is EOS.
+    """
+    frame_idx = torch.arange(offset, offset + block.shape[1], device=block.device)
+    return torch.where(is_eos(block), -1, frame_idx).amax(dim=1)
 
 
 class CFM(nn.Module):
@@ -38,7 +60,9 @@ class CFM(nn.Module):
         ),
         num_channels=None,
         block_size=None,
-        num_history_block=None
+        num_history_block=None,
+        kv_cache_dtype=None,
+        eos_early_exit_from=None
     ):
         super().__init__()
 
@@ -64,52 +88,48 @@ class CFM(nn.Module):
 
         print(f"block_size: {self.block_size}; num_history_block: {self.num_history_block}")
 
+        # quantized storage of the text / history KV cache ("int8", "fp8"), None keeps the model dtype
+        self.kv_cache_dtype = resolve_kv_cache_dtype(kv_cache_dtype)
+
+        # from this t on (euler only) the x1 estimate x + (1 - t) * v is checked after every step, a
+        # block that is all EOS frames for every candidate skips its remaining steps; None disables
+        self.eos_early_exit_from = eos_early_exit_from
+
+        # backend evaluating one DiT step (see step_backends), None means the eager transformer
+        self.step_backend = None
+
     @property
     def device(self):
         return next(self.parameters()).device
     
-    @torch.no_grad()
-    def sample_block_cache(
-        self,
-        text,
-        duration,  # noqa: F821
-        style_prompt,
-        steps=32,
-        cfg_strength=1.0,
-        seed: int | None = None,
-        process_bar = True
-        
-    ):
-        self.eval()
+    def _new_caches(self, text_lens):
+        return tuple(
+            BlockFlowMatchingCache(
+                text_lengths=text_lens, block_size=self.block_size, num_history_block=self.num_history_block,
+                kv_cache_dtype=self.kv_cache_dtype
+            )
+            for _ in range(2)
+        )
 
+    def _cache_text(self, text, style_prompt, kv_cache, cfg_kv_cache):
+        """Prefills the text KV of the conditional and the unconditional (cfg) cache."""
         batch = text.shape[0]
         device = self.device
-        num_blocks = duration // self.block_size + (duration % self.block_size > 0)
-
         text_emb = self.transformer.text_embed(text)
         cfg_text_emb = self.transformer.text_embed(torch.zeros_like(text))
         text_lens = torch.LongTensor([text_emb.shape[1]]).to(device)
-        clean_emb_stream = torch.zeros(batch, 0, self.num_channels, device=device, dtype=text_emb.dtype)
-        noisy_lens = torch.LongTensor([self.block_size]).to(device)
-        block_iterator = range(num_blocks)
-        if process_bar:
-            block_iterator = tqdm(block_iterator)
+        kv_cache.text_lengths = text_lens
+        cfg_kv_cache.text_lengths = text_lens
 
-        # create cache
-        kv_cache = BlockFlowMatchingCache(text_lengths=text_lens, num_history_block=self.num_history_block)
-        cfg_kv_cache = BlockFlowMatchingCache(text_lengths=text_lens, num_history_block=self.num_history_block)
         # 确保时间张量的 dtype 与模型参数一致
         model_dtype = next(self.transformer.parameters()).dtype
-        cache_time = torch.tensor([1], device=device, dtype=model_dtype)[:, None].repeat(batch, self.block_size)
-        
-        # generate text cache
         text_time = torch.tensor([-1], device=device, dtype=model_dtype)[:, None].repeat(batch, text_emb.shape[1])
         text_position_ids = torch.arange(0, text_emb.shape[1], device=device)[None, :].repeat(batch, 1)
         text_attn_mask = torch.ones(batch, 1, text_emb.shape[1], text_emb.shape[1], device=device).bool()
         
         if text_emb.shape[1] != 0: 
             with kv_cache.cache_text():
-                _, _, kv_cache = self.transformer(
+                self.transformer(
                     x = text_emb,
                     time=text_time,
                     attn_mask=text_attn_mask,
@@ -119,7 +139,7 @@ class CFM(nn.Module):
                     past_key_value = kv_cache
                 )
             with cfg_kv_cache.cache_text():
-                _, _, cfg_kv_cache = self.transformer(
+                self.transformer(
                     x = cfg_text_emb,
                     time=text_time,
                     attn_mask=text_attn_mask,
@@ -128,107 +148,377 @@ class CFM(nn.Module):
                     use_cache=True,
                     past_key_value = cfg_kv_cache
                 )
+        return text_lens
 
-        end_pos = 0
-        for bid in block_iterator:
-            clean_lens = torch.LongTensor([clean_emb_stream.shape[1]]).to(device)
-            #print(text_lens, clean_lens, noisy_lens, clean_emb_stream.shape, flush=True)
+    @torch.no_grad()
+    def sample_block_cache(
+        self,
+        text,
+        duration,  # noqa: F821
+        style_prompt,
+        steps=32,
+        cfg_strength=1.0,
+        seed: int | None = None,
+        process_bar = True,
+        return_record = False,
+        block_callback = None,
+        n_candidates = 1,
+        return_lengths = False,
+        solver = None,
+        cfg_cutoff = 1.0,
+        step_controller = None
+        
+    ):
+        """
+        Samples `duration` latent frames block by block.
+        Each block's noise is drawn from its own seed derived from `seed`. With `return_record`
+        the sampler state at every block boundary is returned as well (see sampling_state),
+        for `resample_from_block`. `block_callback(bid, clean_emb_stream, block_seeds, end_pos)` is
+        called after every finished block, e.g. to checkpoint for `resume_sampling`.
+        `n_candidates` > 1 samples that many noise streams for a single text / style as one batch;
+        the text caches are computed once and broadcast. Candidates stop at different frames,
+        `return_lengths` also returns the per-candidate number of frames.
+        `solver` overrides the odeint method and guidance is only applied while t <= `cfg_cutoff`,
+        both for cheap drafts that keep the noise (and so the song) of a full run with the same seed.
+        With a `step_controller` (see step_control) each block picks its own step sizes within the
+        song's NFE budget instead of the fixed `steps` schedule.
+        """
+        self.eval()
 
-            # all one mask
-            attn_mask = torch.ones(batch, 1, noisy_lens.max(), (text_lens + clean_lens + noisy_lens).max(), device=device).bool() # [B, 1, Q, KV]
+        num_blocks = duration // self.block_size + (duration % self.block_size > 0)
+        block_seeds = derive_block_seeds(seed, num_blocks)
+        if n_candidates > 1 and text.shape[0] != 1:
+            raise ValueError("n_candidates > 1 needs a single text / style_prompt")
 
-            # generate position id
-            position_ids = torch.arange(0, (clean_lens + noisy_lens).max(), device=device)[None, :].repeat(batch, 1)
-            position_ids = position_ids[:, -noisy_lens.max():]
+        # create cache
+        kv_cache, cfg_kv_cache = self._new_caches(None)
+        self._cache_text(text, style_prompt, kv_cache, cfg_kv_cache)
+        clean_emb_stream = torch.zeros(
+            text.shape[0] * n_candidates, 0, self.num_channels, device=self.device, dtype=style_prompt.dtype
+        )
 
-            # core sample fn
-            def fn(t, x):
-                noisy_embed = self.transformer.latent_embed(x)
+        record = None
+        if return_record:
+            record = SamplingRecord(text, style_prompt, duration, steps, cfg_strength, block_seeds)
+        clean_emb_stream, lengths = self._sample_blocks(
+            clean_emb_stream, kv_cache, cfg_kv_cache, style_prompt, block_seeds, 0,
+            steps, cfg_strength, process_bar, record, block_callback, solver, cfg_cutoff, step_controller
+        )
+        return self._outputs(clean_emb_stream, lengths, record, return_lengths)
 
-                if t.ndim == 0:
-                    t = t.repeat(batch)
-                time = t[:, None].repeat(1, noisy_lens.max())
+    @staticmethod
+    def _outputs(clean_emb_stream, lengths, record, return_lengths):
+        outputs = [clean_emb_stream]
+        if return_lengths:
+            outputs.append(lengths)
+        if record is not None:
+            outputs.append(record)
+        return outputs[0] if len(outputs) == 1 else tuple(outputs)
 
-                pred, *_ = self.transformer(
-                    x=noisy_embed, 
-                    time=time, 
-                    attn_mask=attn_mask,
-                    position_ids=position_ids,
-                    style_prompt=style_prompt, 
-                    use_cache=True,
-                    past_key_value = kv_cache
-                )
-                if cfg_strength < 1e-5:
-                    return pred
-
-                null_pred, *_ = self.transformer(
-                    x=noisy_embed, 
-                    time=time, 
-                    attn_mask=attn_mask,
-                    position_ids=position_ids,
-                    style_prompt=torch.zeros_like(style_prompt), 
-                    use_cache=True,
-                    past_key_value = cfg_kv_cache
-                )
+    @torch.no_grad()
+    def resample_from_block(
+        self,
+        record: SamplingRecord,
+        block: int,
+        text=None,
+        style_prompt=None,
+        duration=None,
+        steps=None,
+        cfg_strength=None,
+        seed: int | None = None,
+        process_bar = True,
+        return_lengths = False
+    ):
+        """
+        Re-samples a recorded song from `block` on, keeping blocks [0, block) as they are.
+        `seed` re-draws the noise of the re-sampled blocks (the recorded seeds are reused
+        otherwise); `steps`, `cfg_strength`, `duration`, `style_prompt` and `text` default to
+        the recorded ones. New `text` only conditions the re-sampled blocks, the kept blocks
+        were generated with the recorded lyrics.
+        Returns (clean_emb_stream, [lengths,] record) like `sample_block_cache(..., return_record=True)`.
+        """
+        self.eval()
+
+        text = record.text if text is None else text
+        style_prompt = record.style_prompt if style_prompt is None else style_prompt
+        duration = record.duration if duration is None else duration
+        steps = record.steps if steps is None else steps
+        cfg_strength = record.cfg_strength if cfg_strength is None else cfg_strength
 
-                return pred + (pred - null_pred) * cfg_strength
+        clean_emb_stream, kv_cache, cfg_kv_cache = record.restore(block)
+        if text is not record.text or style_prompt is not record.style_prompt:
+            # new lyrics / style: only the text prefix is recomputed, the history is kept
+            kv_cache, cfg_kv_cache = (cache.fork() for cache in (kv_cache, cfg_kv_cache))
+            for cache in (kv_cache, cfg_kv_cache):
+                cache.text_key_cache, cache.text_value_cache = [], []
+                cache.text_key_scale, cache.text_value_scale = [], []
+            self._cache_text(text, style_prompt, kv_cache, cfg_kv_cache)
+
+        num_blocks = duration // self.block_size + (duration % self.block_size > 0)
+        block_seeds = (record.block_seeds + derive_block_seeds(None, num_blocks))[:num_blocks]
+        if seed is not None:
+            block_seeds[block:] = derive_block_seeds(seed, num_blocks)[block:]
+
+        new_record = SamplingRecord(text, style_prompt, duration, steps, cfg_strength, block_seeds)
+        new_record.snapshots = {bid: snapshot for bid, snapshot in record.snapshots.items() if bid < block}
+        clean_emb_stream, lengths = self._sample_blocks(
+            clean_emb_stream, kv_cache, cfg_kv_cache, style_prompt, block_seeds, block,
+            steps, cfg_strength, process_bar, new_record
+        )
+        return self._outputs(clean_emb_stream, lengths, new_record, return_lengths)
+
+    @torch.no_grad()
+    def rebuild_caches(self, text, style_prompt, clean_emb_stream):
+        """
+        Rebuilds the caches `sample_block_cache` would hold after sampling `clean_emb_stream`,
+        with one block-causal pass over text + clean blocks per cache instead of replaying the
+        sampler (see attention_dispatch.block_causal_window_mask).
+        """
+        kv_cache, cfg_kv_cache = self._new_caches(None)
+        self._cache_text(text, style_prompt, kv_cache, cfg_kv_cache)
+        num_blocks = clean_emb_stream.shape[1] // self.block_size
+        if num_blocks == 0:
+            return kv_cache, cfg_kv_cache
+
+        batch = clean_emb_stream.shape[0]
+        device = self.device
+        text_len = text.shape[1]
+        clean_len = num_blocks * self.block_size
+        model_dtype = next(self.transformer.parameters()).dtype
+        latent_emb = self.transformer.latent_embed(clean_emb_stream[:, :clean_len])
+        time = torch.cat([
+            torch.full((batch, text_len), -1, device=device, dtype=model_dtype),
+            torch.ones(batch, clean_len, device=device, dtype=model_dtype),
+        ], dim=1)
+        position_ids = torch.cat([
+            torch.arange(text_len, device=device), torch.arange(clean_len, device=device)
+        ])[None, :].repeat(batch, 1)
+        attn_mask = block_causal_window_mask(
+            text_len, num_blocks, self.block_size, self.num_history_block, batch=batch, device=device
+        )
+
+        for cache, text_in, style in (
+            (kv_cache, text, style_prompt),
+            (cfg_kv_cache, torch.zeros_like(text), torch.zeros_like(style_prompt)),
+        ):
+            capture = KVCapture()
+            self.transformer(
+                x=torch.cat([self.transformer.text_embed(text_in).expand(batch, -1, -1), latent_emb], dim=1),
+                time=time,
+                attn_mask=attn_mask,
+                position_ids=position_ids,
+                style_prompt=style.expand(batch, -1),
+                use_cache=True,
+                past_key_value=capture,
+            )
+            for layer_idx, (keys, values) in enumerate(zip(capture.keys, capture.values)):
+                # block by block, so quantized caches get their per-block scales and trimming
+                for bid in range(num_blocks):
+                    start = text_len + bid * self.block_size
+                    cache.store_block(
+                        keys[:, :, start:start + self.block_size],
+                        values[:, :, start:start + self.block_size],
+                        layer_idx,
+                    )
+        return kv_cache, cfg_kv_cache
+
+    @torch.no_grad()
+    def resume_sampling(
+        self,
+        text,
+        duration,
+        style_prompt,
+        clean_emb_stream,
+        block_seeds,
+        steps=32,
+        cfg_strength=1.0,
+        process_bar = True,
+        block_callback = None,
+        return_lengths = False,
+        step_controller = None,
+        end_pos = None,
+        solver = None,
+        cfg_cutoff = 1.0
+    ):
+        """
+        Continues an interrupted `sample_block_cache` run from its finished blocks
+        (`clean_emb_stream`, a multiple of block_size frames, one row per candidate), its
+        `block_seeds` and the `end_pos` the block callback saw (candidates that already ended;
+        None when nothing had ended). `solver`, `cfg_cutoff` and the state of `step_controller`
+        must be those of the interrupted run for the remaining blocks to be sampled the same way.
+        """
+        self.eval()
+
+        num_blocks = duration // self.block_size + (duration % self.block_size > 0)
+        block_seeds = list(block_seeds)[:num_blocks]
+        start_block = clean_emb_stream.shape[1] // self.block_size
+        clean_emb_stream = clean_emb_stream[:, :start_block * self.block_size].to(self.device, style_prompt.dtype)
+        kv_cache, cfg_kv_cache = self.rebuild_caches(text, style_prompt, clean_emb_stream)
+        clean_emb_stream, lengths = self._sample_blocks(
+            clean_emb_stream, kv_cache, cfg_kv_cache, style_prompt, block_seeds, start_block,
+            steps, cfg_strength, process_bar, None, block_callback, solver, cfg_cutoff,
+            step_controller=step_controller, end_pos=end_pos
+        )
+        return self._outputs(clean_emb_stream, lengths, None, return_lengths)
+
+    def _sample_blocks(
+        self,
+        clean_emb_stream,
+        kv_cache,
+        cfg_kv_cache,
+        style_prompt,
+        block_seeds,
+        start_block,
+        steps,
+        cfg_strength,
+        process_bar,
+        record=None,
+        block_callback=None,
+        solver=None,
+        cfg_cutoff=1.0,
+        step_controller=None,
+        end_pos=None
+    ):
+        batch = clean_emb_stream.shape[0]
+        device = self.device
+        # one style (and text cache) shared by all candidates
+        style_prompt = style_prompt.expand(batch, -1)
+        null_style_prompt = torch.zeros_like(style_prompt)
+        step_backend = self.step_backend or TorchDiTStep(self.transformer)
+        odeint_kwargs = self.odeint_kwargs if solver is None else {**self.odeint_kwargs, "method": solver}
+        block_iterator = range(start_block, len(block_seeds))
+        if process_bar:
+            block_iterator = tqdm(block_iterator)
+
+        # the latent stream, time and position ids are allocated once and written in place; a
+        # sampling step only allocates inside the DiT (see tests/test_sampler_allocations.py)
+        stream = clean_emb_stream.new_empty(batch, len(block_seeds) * self.block_size, self.num_channels)
+        stream_len = clean_emb_stream.shape[1]
+        stream[:, :stream_len].copy_(clean_emb_stream)
+        # 确保时间张量的 dtype 与模型参数一致
+        model_dtype = next(self.transformer.parameters()).dtype
+        time = torch.empty(batch, self.block_size, device=device, dtype=model_dtype)
+        cache_time = torch.ones(batch, self.block_size, device=device, dtype=model_dtype)
+        block_positions = torch.arange(self.block_size, device=device)[None, :].expand(batch, -1)
+        position_ids = torch.empty(batch, self.block_size, device=device, dtype=torch.long)
+        # fixed euler grid, t and dt as python floats so the step loop does not touch the device
+        t_grid = torch.linspace(0, 1, steps).to(model_dtype).tolist()
+
+        # core sample fn, t is a python float or a (0-dim / [b]) tensor from odeint
+        def fn(t, x):
+            if torch.is_tensor(t):
+                time.copy_(t.reshape(-1, 1))
+            else:
+                time.fill_(t)
+
+            pred = step_backend(
+                x=x, 
+                time=time, 
+                attn_mask=FULL_ATTENTION,
+                position_ids=position_ids,
+                style_prompt=style_prompt, 
+                past_key_value=kv_cache
+            )
+            # compare the python-side step time, reading `time` back would sync with the device every
+            # step; odeint passes device tensors, but its fixed-grid loop syncs on the grid anyway
+            if cfg_strength < 1e-5 or (
+                cfg_cutoff < 1.0 and (float(t.reshape(-1)[0]) if torch.is_tensor(t) else t) > cfg_cutoff
+            ):
+                return pred
+
+            null_pred = step_backend(
+                x=x, 
+                time=time, 
+                attn_mask=FULL_ATTENTION,
+                position_ids=position_ids,
+                style_prompt=null_style_prompt, 
+                past_key_value=cfg_kv_cache
+            )
+
+            # pred + (pred - null_pred) * cfg_strength, in place: step outputs are fresh tensors
+            return null_pred.lerp_(pred, 1 + cfg_strength)
+
+        # frame each candidate ends at, -1 while it has not reached EOS; the stream is cut after the
+        # last non-EOS frame, which is tracked block by block instead of rescanning the stream
+        if end_pos is None:
+            end_pos = torch.full((batch,), -1, dtype=torch.long)
+        else:
+            end_pos = torch.as_tensor(end_pos, dtype=torch.long).clone()
+        last_frame = last_non_eos(clean_emb_stream, 0) if stream_len else torch.full((batch,), -1, device=device)
+        for bid in block_iterator:
+            if record is not None:
+                record.snapshot(bid, stream_len, kv_cache, cfg_kv_cache)
+            # every query sees the whole text + history kept by the cache, so no mask is needed;
+            # positions continue after the clean frames
+            torch.add(block_positions, stream_len, out=position_ids)
 
             # generate time
-            noisy_emb = torch.randn(batch, self.block_size, self.num_channels, device=device, dtype=style_prompt.dtype)
-            t_start = 0
-            t_set = torch.linspace(t_start, 1, steps, device=device, dtype=noisy_emb.dtype)
-            
-            # sampling
-            outputs = odeint(fn, noisy_emb, t_set, **self.odeint_kwargs)
-            sampled = outputs[-1]
+            noisy_emb = block_noise(block_seeds[bid], (batch, self.block_size, self.num_channels), device, style_prompt.dtype)
+            if step_controller is not None:
+                sampled = step_controller.integrate(fn, noisy_emb, bid, len(block_seeds))
+            elif odeint_kwargs.get("method") == "euler":
+                # same update as odeint's euler, in place on the block's own noise tensor
+                sampled = noisy_emb
+                for t0, t1 in zip(t_grid[:-1], t_grid[1:]):
+                    velocity = fn(t0, sampled)
+                    if self.eos_early_exit_from is not None and t0 >= self.eos_early_exit_from:
+                        # flow matching moves in straight lines, x1 ~ x_t + (1 - t) * v
+                        x1 = torch.add(sampled, velocity, alpha=1 - t0)
+                        # candidates that already ended do not hold the others back
+                        if bool((is_eos(x1).all(dim=1).cpu() | (end_pos >= 0)).all()):
+                            sampled = x1
+                            break
+                    sampled.add_(velocity, alpha=t1 - t0)
+            else:
+                t_set = torch.tensor(t_grid, device=device, dtype=noisy_emb.dtype)
+
+                # sampling
+                outputs = odeint(fn, noisy_emb, t_set, **odeint_kwargs)
+                sampled = outputs[-1]
 
             # generate next kv cache
-            cache_embed = self.transformer.latent_embed(sampled)
-            with kv_cache.cache_context():
-                _, _, kv_cache = self.transformer(
-                    x = cache_embed,
-                    time=cache_time,
-                    attn_mask=attn_mask,
-                    position_ids=position_ids,
-                    style_prompt=style_prompt, 
-                    use_cache=True,
-                    past_key_value = kv_cache
-                )
-            with cfg_kv_cache.cache_context():
-                _, _, cfg_kv_cache = self.transformer(
-                    x = cache_embed,
-                    time=cache_time,
-                    attn_mask=attn_mask,
-                    position_ids=position_ids,
-                    style_prompt=torch.zeros_like(style_prompt), 
-                    use_cache=True,
-                    past_key_value = cfg_kv_cache
-                )
+            step_backend.commit(
+                x=sampled,
+                time=cache_time,
+                attn_mask=FULL_ATTENTION,
+                position_ids=position_ids,
+                style_prompt=style_prompt, 
+                past_key_value=kv_cache
+            )
+            step_backend.commit(
+                x=sampled,
+                time=cache_time,
+                attn_mask=FULL_ATTENTION,
+                position_ids=position_ids,
+                style_prompt=null_style_prompt, 
+                past_key_value=cfg_kv_cache
+            )
 
             # push new block
-            clean_emb_stream = torch.cat([clean_emb_stream, sampled], dim=1)
+            stream[:, stream_len:stream_len + self.block_size].copy_(sampled)
+            stream_len += self.block_size
+            clean_emb_stream = stream[:, :stream_len]
             
-            pos = -1
-            curr_frame = clean_emb_stream[:, pos, :]
-            eos = torch.ones_like(curr_frame)
-            last_kl = torch.nn.functional.mse_loss(
-                curr_frame, 
-                eos
-            )
-            if last_kl.abs() <= 0.05:
-                while last_kl.abs() <= 0.05 and abs(pos) < clean_emb_stream.shape[1]:
-                    pos -= 1
-                    curr_frame = clean_emb_stream[:, pos, :]
-                    last_kl = torch.nn.functional.mse_loss(
-                        curr_frame, 
-                        eos
-                    )
-                end_pos = clean_emb_stream.shape[1] + pos
+            # a candidate ends once its last frame is the all-ones EOS frame, the trailing EOS
+            # run is cut off; sampling stops when every candidate has ended
+            block_last = last_non_eos(sampled, stream_len - self.block_size)
+            last_frame = torch.maximum(last_frame, block_last)
+            newly_ended = (block_last < stream_len - 1).cpu() & (end_pos < 0)
+            if newly_ended.any():
+                end_pos[newly_ended] = last_frame.cpu()[newly_ended].clamp(min=0)
+            # after the EOS check, so a checkpoint carries the ends up to and including this block
+            if block_callback is not None:
+                block_callback(bid, clean_emb_stream, block_seeds, end_pos)
+            if newly_ended.any() and bool((end_pos >= 0).all()):
                 break
-            else:
-                end_pos = clean_emb_stream.shape[1]
-                
-        clean_emb_stream = clean_emb_stream[:, :end_pos, :]
 
-        return clean_emb_stream
+        clean_emb_stream = stream[:, :stream_len]
+        end_pos[end_pos < 0] = clean_emb_stream.shape[1]
+        if record is not None:
+            record.clean_emb_stream = clean_emb_stream
+            record.kv_cache = kv_cache
+            record.cfg_kv_cache = cfg_kv_cache
+        clean_emb_stream = clean_emb_stream[:, :int(end_pos.max()), :]
+
+        return clean_emb_stream, end_pos
 
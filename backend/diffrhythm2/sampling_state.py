@@ -0,0 +1,118 @@
+# Copyright 2025 ASLP Lab and Xiaomi Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Per-block seeds and block-boundary snapshots of `CFM.sample_block_cache`.
+
+A block only depends on the text / style, the clean blocks before it and its own noise,
+so keeping the sampler state at block boundaries lets `CFM.resample_from_block` re-roll
+the tail of a song without redoing the DiT work of the blocks before it.
+"""
+
+from __future__ import annotations
+
+import torch
+
+from .cache_utils import BlockFlowMatchingCache
+
+_SEED_MASK = (1 << 63) - 1
+
+
+def derive_block_seeds(seed: int | None, num_blocks: int) -> list[int]:
+    """
+    One seed per block, derived from `seed` so that any block's noise can be drawn on its
+    own. Without a seed the base seed comes from the global torch RNG, which keeps
+    `torch.manual_seed` based reproducibility.
+    """
+    if seed is None:
+        seed = int(torch.randint(0, 2**31 - 1, (1,)).item())
+    return [(seed * 6364136223846793005 + 1442695040888963407 * (bid + 1)) & _SEED_MASK for bid in range(num_blocks)]
+
+
+def block_noise(seed: int, shape, device, dtype) -> torch.Tensor:
+    """
+    Initial noise [b, n, c] of one block; drawn on the CPU so a seed gives the same noise on
+    every device. Row i uses `seed + i`, so candidate 0 of a batch matches a single-candidate run.
+    """
+    noise = torch.stack([
+        torch.randn(shape[1:], generator=torch.Generator().manual_seed((seed + i) & _SEED_MASK))
+        for i in range(shape[0])
+    ])
+    return noise.to(device=device, dtype=dtype)
+
+
+class KVCapture:
+    """Cache stand-in collecting the KV of a plain forward pass, used to rebuild a cache."""
+
+    def __init__(self):
+        self.keys = []
+        self.values = []
+
+    def update(self, key_states, value_states, layer_idx, cache_kwargs=None):
+        self.keys.append(key_states)
+        self.values.append(value_states)
+        return key_states, value_states
+
+
+class BlockSnapshot:
+    """Sampler state at the start of block `block`."""
+
+    def __init__(self, block: int, stream_len: int, kv_cache=None, cfg_kv_cache=None):
+        self.block = block
+        self.stream_len = stream_len
+        # None when the cache keeps the full history: the state is then a prefix of the final
+        # cache and is sliced out of it on demand instead of being held for every block
+        self.kv_cache = kv_cache
+        self.cfg_kv_cache = cfg_kv_cache
+
+
+class SamplingRecord:
+    """
+    Everything needed to resume a `sample_block_cache` run from one of its block boundaries.
+    Cache tensors are replaced, never written in place, so snapshots share them with the live
+    caches instead of copying.
+    """
+
+    def __init__(self, text, style_prompt, duration, steps, cfg_strength, block_seeds):
+        self.text = text
+        self.style_prompt = style_prompt
+        self.duration = duration
+        self.steps = steps
+        self.cfg_strength = cfg_strength
+        self.block_seeds = list(block_seeds)
+        self.snapshots: dict[int, BlockSnapshot] = {}
+        self.kv_cache: BlockFlowMatchingCache | None = None
+        self.cfg_kv_cache: BlockFlowMatchingCache | None = None
+        # clean latents of every sampled block, before the EOS trim
+        self.clean_emb_stream: torch.Tensor | None = None
+
+    def snapshot(self, block: int, stream_len: int, kv_cache: BlockFlowMatchingCache, cfg_kv_cache: BlockFlowMatchingCache):
+        if kv_cache.num_history_block is None:
+            self.snapshots[block] = BlockSnapshot(block, stream_len)
+        else:
+            self.snapshots[block] = BlockSnapshot(block, stream_len, kv_cache.fork(), cfg_kv_cache.fork())
+
+    def restore(self, block: int):
+        """Returns (clean_emb_stream, kv_cache, cfg_kv_cache) as they were when `block` started."""
+        if block not in self.snapshots:
+            raise ValueError(f"No snapshot for block {block}, available: 0..{len(self.snapshots) - 1}")
+        snapshot = self.snapshots[block]
+        clean_emb_stream = self.clean_emb_stream[:, :snapshot.stream_len]
+        if snapshot.kv_cache is None:
+            return clean_emb_stream, self.kv_cache.fork(snapshot.stream_len), self.cfg_kv_cache.fork(snapshot.stream_len)
+        return clean_emb_stream, snapshot.kv_cache.fork(), snapshot.cfg_kv_cache.fork()
+
+    @property
+    def num_sampled_blocks(self) -> int:
+        return len(self.snapshots)
@@ -0,0 +1,331 @@
+# Copyright 2025 ASLP Lab and Xiaomi Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Backends evaluating one DiT denoising step against a `BlockFlowMatchingCache`.
+
+`CFM.sample_block_cache` only talks to a step backend through `__call__` (one ODE
+evaluation, cache untouched) and `commit` (append a finished block to the cache), so
+the eager transformer and an exported ONNX Runtime graph are interchangeable.
+"""
+
+from __future__ import annotations
+
+import torch
+from torch import nn
+
+from .backbones.attention_dispatch import FULL_ATTENTION
+from .backbones.dit import DiT
+from .cache_utils import BlockFlowMatchingCache
+
+
+class TorchDiTStep:
+    def __init__(self, transformer: DiT):
+        self.transformer = transformer
+
+    def __call__(self, x, time, attn_mask, position_ids, style_prompt, past_key_value):
+        pred, *_ = self.transformer(
+            x=self.transformer.latent_embed(x),
+            time=time,
+            attn_mask=attn_mask,
+            position_ids=position_ids,
+            style_prompt=style_prompt,
+            use_cache=True,
+            past_key_value=past_key_value,
+        )
+        return pred
+
+    def commit(self, x, time, attn_mask, position_ids, style_prompt, past_key_value):
+        with past_key_value.cache_context():
+            self(x, time, attn_mask, position_ids, style_prompt, past_key_value)
+
+
+class ExplicitKVCache:
+    """
+    Stateless stand-in for `BlockFlowMatchingCache`: text and history KV come in as
+    per-layer tensors and the KV of the current block is collected as outputs.
+    """
+
+    def __init__(self, text_keys, text_values, history_keys, history_values):
+        self.text_keys = text_keys
+        self.text_values = text_values
+        self.history_keys = history_keys
+        self.history_values = history_values
+        self.present_keys = []
+        self.present_values = []
+
+    def update(self, key_states, value_states, layer_idx, cache_kwargs=None):
+        self.present_keys.append(key_states)
+        self.present_values.append(value_states)
+        key_states = torch.cat([self.text_keys[layer_idx], self.history_keys[layer_idx], key_states], dim=-2)
+        value_states = torch.cat([self.text_values[layer_idx], self.history_values[layer_idx], value_states], dim=-2)
+        return key_states, value_states
+
+
+class DiTStepModule(nn.Module):
+    """
+    Export wrapper of one DiT step.
+
+    Inputs:
+        x: [b, n, mel_dim] latent of the current block
+        time: [b, n]
+        position_ids: [b, n]
+        style_prompt: [b, 512]
+        text_keys / text_values: [layers, b, heads, nt, head_dim]
+        history_keys / history_values: [layers, b, heads, nh, head_dim]
+        kv_mask: optional [b, nt + nh + n] bool, False marks padded KV positions
+    Outputs:
+        pred: [b, n, mel_dim]
+        present_keys / present_values: [layers, b, heads, n, head_dim]
+    """
+
+    def __init__(self, transformer: DiT):
+        super().__init__()
+        self.transformer = transformer
+
+    def forward(
+        self, x, time, position_ids, style_prompt, text_keys, text_values, history_keys, history_values, kv_mask=None
+    ):
+        cache = ExplicitKVCache(
+            text_keys.unbind(0), text_values.unbind(0), history_keys.unbind(0), history_values.unbind(0)
+        )
+        # no kv_mask: every position is visible, take the maskless attention path
+        attn_mask = FULL_ATTENTION if kv_mask is None else kv_mask[:, None, None, :].expand(-1, 1, x.shape[1], -1)
+        pred, *_ = self.transformer(
+            x=self.transformer.latent_embed(x),
+            time=time,
+            attn_mask=attn_mask,
+            position_ids=position_ids,
+            style_prompt=style_prompt,
+            use_cache=True,
+            past_key_value=cache,
+        )
+        return pred, torch.stack(cache.present_keys), torch.stack(cache.present_values)
+
+
+# Bump whenever DiTStepModule, the I/O layout below or export_dit_step change, so graphs
+# exported by older code are not reused.
+DIT_STEP_EXPORT_VERSION = 1
+
+DIT_STEP_INPUTS = [
+    "x", "time", "position_ids", "style_prompt",
+    "text_keys", "text_values", "history_keys", "history_values",
+]
+DIT_STEP_OUTPUTS = ["pred", "present_keys", "present_values"]
+
+
+def _kv_layout(transformer: DiT):
+    attn = transformer.transformer_blocks[0].self_attn
+    return transformer.depth, attn.num_key_value_heads, attn.head_dim
+
+
+@torch.no_grad()
+def export_dit_step(transformer: DiT, onnx_path, block_size, text_len=16, opset_version=17):
+    """Export `DiTStepModule(transformer)` to ONNX with dynamic batch / text / history lengths."""
+    transformer = transformer.eval()
+    param = next(transformer.parameters())
+    device, dtype = param.device, param.dtype
+    depth, heads, head_dim = _kv_layout(transformer)
+    mel_dim = transformer.proj_out.out_features
+    batch, history_len = 1, block_size
+
+    args = (
+        torch.randn(batch, block_size, mel_dim, device=device, dtype=dtype),
+        torch.rand(batch, block_size, device=device, dtype=dtype),
+        torch.arange(history_len, history_len + block_size, device=device)[None, :].repeat(batch, 1),
+        torch.randn(batch, 512, device=device, dtype=dtype),
+        torch.randn(depth, batch, heads, text_len, head_dim, device=device, dtype=dtype),
+        torch.randn(depth, batch, heads, text_len, head_dim, device=device, dtype=dtype),
+        torch.randn(depth, batch, heads, history_len, head_dim, device=device, dtype=dtype),
+        torch.randn(depth, batch, heads, history_len, head_dim, device=device, dtype=dtype),
+    )
+    dynamic_axes = {
+        "x": {0: "batch", 1: "block_len"},
+        "time": {0: "batch", 1: "block_len"},
+        "position_ids": {0: "batch", 1: "block_len"},
+        "style_prompt": {0: "batch"},
+        "text_keys": {1: "batch", 3: "text_len"},
+        "text_values": {1: "batch", 3: "text_len"},
+        "history_keys": {1: "batch", 3: "history_len"},
+        "history_values": {1: "batch", 3: "history_len"},
+        "pred": {0: "batch", 1: "block_len"},
+        "present_keys": {1: "batch", 3: "block_len"},
+        "present_values": {1: "batch", 3: "block_len"},
+    }
+    torch.onnx.export(
+        DiTStepModule(transformer).eval(),
+        args,
+        str(onnx_path),
+        input_names=DIT_STEP_INPUTS,
+        output_names=DIT_STEP_OUTPUTS,
+        dynamic_axes=dynamic_axes,
+        opset_version=opset_version,
+    )
+    return onnx_path
+
+
+class OnnxDiTStep:
+    """ONNX Runtime backend for a graph produced by `export_dit_step` (CPU, fp32)."""
+
+    def __init__(self, onnx_path, session_options=None, providers=None):
+        import onnxruntime
+
+        self.session = onnxruntime.InferenceSession(
+            str(onnx_path),
+            sess_options=session_options,
+            providers=providers or ["CPUExecutionProvider"],
+        )
+        depth, _, heads, _, head_dim = self.session.get_inputs()[DIT_STEP_INPUTS.index("text_keys")].shape
+        self.kv_layout = (depth, heads, head_dim)
+        self._kv_feeds = {}
+
+    def _stack(self, read_kv, length, batch):
+        depth, heads, head_dim = self.kv_layout
+        keys = torch.zeros(depth, batch, heads, length, head_dim)
+        values = torch.zeros_like(keys)
+        if length != 0:
+            for i in range(depth):
+                read_kv(i, keys[i], values[i])
+        return keys.numpy(), values.numpy()
+
+    def _cache_feeds(self, cache: BlockFlowMatchingCache, batch):
+        # text KV never changes and history only changes on commit, so the stacked arrays are reused
+        # for every ODE step of a block
+        version = cache.key_cache[0] if len(cache.key_cache) != 0 else None
+        memo = self._kv_feeds.get(id(cache))
+        if memo is not None and memo[0] is cache and memo[1] is version:
+            return memo[2]
+        text_len = cache.text_key_cache[0].shape[-2] if len(cache.text_key_cache) != 0 else 0
+        feeds = {}
+        feeds["text_keys"], feeds["text_values"] = self._stack(cache.read_text_kv, text_len, batch)
+        feeds["history_keys"], feeds["history_values"] = self._stack(
+            cache.read_history_kv, cache.get_seq_length(), batch
+        )
+        if len(self._kv_feeds) >= 2 and id(cache) not in self._kv_feeds:
+            self._kv_feeds.pop(next(iter(self._kv_feeds)))
+        self._kv_feeds[id(cache)] = (cache, version, feeds)
+        return feeds
+
+    def run(self, x, time, position_ids, style_prompt, past_key_value):
+        feeds = {
+            "x": x.float().cpu().numpy(),
+            "time": time.float().cpu().numpy(),
+            "position_ids": position_ids.long().cpu().numpy(),
+            "style_prompt": style_prompt.float().cpu().numpy(),
+        }
+        feeds.update(self._cache_feeds(past_key_value, x.shape[0]))
+        return self.session.run(DIT_STEP_OUTPUTS, feeds)
+
+    def __call__(self, x, time, attn_mask, position_ids, style_prompt, past_key_value):
+        pred, _, _ = self.run(x, time, position_ids, style_prompt, past_key_value)
+        return torch.from_numpy(pred).to(device=x.device, dtype=x.dtype)
+
+    def commit(self, x, time, attn_mask, position_ids, style_prompt, past_key_value):
+        _, present_keys, present_values = self.run(x, time, position_ids, style_prompt, past_key_value)
+        for layer_idx in range(present_keys.shape[0]):
+            past_key_value.store_block(
+                torch.from_numpy(present_keys[layer_idx]),
+                torch.from_numpy(present_values[layer_idx]),
+                layer_idx,
+            )
+
+
+# prefix (text + history) KV lengths are padded up to one of these, so the compiled step
+# only ever sees a handful of shapes; longer prefixes round up to a multiple of the last one
+DEFAULT_KV_BUCKETS = (256, 512, 768, 1024, 1536, 2048, 3072, 4096)
+
+
+def kv_bucket(length, buckets=DEFAULT_KV_BUCKETS):
+    for bucket in buckets:
+        if length <= bucket:
+            return bucket
+    return -(-length // buckets[-1]) * buckets[-1]
+
+
+class CompiledDiTStep:
+    """
+    `torch.compile`d DiT step. The text + history KV prefix is padded to a length bucket
+    and masked, so the step compiles once per bucket instead of once per block.
+    `on_compile` is called after a new bucket has been compiled (e.g. to persist the cache).
+    """
+
+    def __init__(self, transformer: DiT, buckets=DEFAULT_KV_BUCKETS, on_compile=None, **compile_kwargs):
+        import torch._dynamo
+
+        self.buckets = tuple(sorted(buckets))
+        self.on_compile = on_compile
+        self.compiled_shapes = set()
+        compile_kwargs.setdefault("dynamic", False)
+        self.step = torch.compile(DiTStepModule(transformer).eval(), **compile_kwargs)
+        # every bucket is a distinct static graph
+        torch._dynamo.config.cache_size_limit = max(
+            torch._dynamo.config.cache_size_limit, 2 * len(self.buckets) + 8
+        )
+        depth, heads, head_dim = _kv_layout(transformer)
+        self.kv_layout = (depth, heads, head_dim)
+        self._prefix_feeds = {}
+
+    def _prefix(self, cache: BlockFlowMatchingCache, batch, device, dtype):
+        version = cache.key_cache[0] if len(cache.key_cache) != 0 else None
+        memo = self._prefix_feeds.get(id(cache))
+        if memo is not None and memo[0] is cache and memo[1] is version:
+            return memo[2]
+
+        depth, heads, head_dim = self.kv_layout
+        text_len = cache.text_key_cache[0].shape[-2] if len(cache.text_key_cache) != 0 else 0
+        length = text_len + cache.get_seq_length()
+        bucket = kv_bucket(length, self.buckets)
+
+        prefix_keys = torch.zeros(depth, batch, heads, bucket, head_dim, device=device, dtype=dtype)
+        prefix_values = torch.zeros_like(prefix_keys)
+        for i in range(depth):
+            if text_len != 0:
+                cache.read_text_kv(i, prefix_keys[i, :, :, :text_len], prefix_values[i, :, :, :text_len])
+            if length != text_len:
+                cache.read_history_kv(
+                    i, prefix_keys[i, :, :, text_len:length], prefix_values[i, :, :, text_len:length]
+                )
+        prefix_mask = torch.zeros(batch, bucket, device=device, dtype=torch.bool)
+        prefix_mask[:, :length] = True
+        empty = torch.zeros(depth, batch, heads, 0, head_dim, device=device, dtype=dtype)
+
+        feeds = (empty, prefix_keys, prefix_values, prefix_mask)
+        if len(self._prefix_feeds) >= 2 and id(cache) not in self._prefix_feeds:
+            self._prefix_feeds.pop(next(iter(self._prefix_feeds)))
+        self._prefix_feeds[id(cache)] = (cache, version, feeds)
+        return feeds
+
+    def run(self, x, time, position_ids, style_prompt, past_key_value):
+        empty, prefix_keys, prefix_values, prefix_mask = self._prefix(
+            past_key_value, x.shape[0], x.device, x.dtype
+        )
+        kv_mask = torch.cat([prefix_mask, prefix_mask.new_ones(x.shape[0], x.shape[1])], dim=1)
+        shape = (tuple(x.shape), prefix_keys.shape[3])
+        outputs = self.step(
+            x, time, position_ids, style_prompt, empty, empty, prefix_keys, prefix_values, kv_mask
+        )
+        if shape not in self.compiled_shapes:
+            self.compiled_shapes.add(shape)
+            if self.on_compile is not None:
+                self.on_compile()
+        return outputs
+
+    def __call__(self, x, time, attn_mask, position_ids, style_prompt, past_key_value):
+        pred, _, _ = self.run(x, time, position_ids, style_prompt, past_key_value)
+        return pred
+
+    def commit(self, x, time, attn_mask, position_ids, style_prompt, past_key_value):
+        _, present_keys, present_values = self.run(x, time, position_ids, style_prompt, past_key_value)
+        for layer_idx in range(present_keys.shape[0]):
+            past_key_value.store_block(present_keys[layer_idx], present_values[layer_idx], layer_idx)
@@ -0,0 +1,121 @@
+# Copyright 2025 ASLP Lab and Xiaomi Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Adaptive per-block step sizes for `CFM.sample_block_cache`.
+
+Blocks are integrated with Euler steps. The velocity at the end of a step is needed
+for the next step anyway. The difference between the Euler update and the Heun update
+built from it, h / 2 * (v_next - v), is therefore an embedded first-order error
+estimate that costs no extra evaluation. Steps grow while that error stays under
+`tol` and shrink when it does not.
+
+The song has an NFE budget. Each block may use its share of what is left, so NFEs
+saved on quiet blocks go to the dense ones later on.
+"""
+
+from __future__ import annotations
+
+import torch
+
+
+class AdaptiveStepController:
+    """
+    nfe_per_block: average NFEs (velocity evaluations, cfg pairs count once) per block,
+        the song budget is nfe_per_block * num_blocks
+    tol: target RMS of the embedded error estimate per step
+    min_steps: fewest Euler steps a block takes (steps are capped at 1 / min_steps), also
+        the smallest NFE budget a block gets
+    """
+
+    def __init__(
+        self,
+        nfe_per_block: int,
+        tol: float = 0.02,
+        min_steps: int = 4,
+        max_steps: int = 64,
+        safety: float = 0.9,
+        max_dt: float = 0.5,
+    ):
+        self.nfe_per_block = nfe_per_block
+        self.tol = tol
+        self.min_steps = min_steps
+        self.max_steps = max_steps
+        self.safety = safety
+        self.max_dt = max_dt
+        self.nfe_budget = None
+        self.nfe_used = 0
+        # block id -> number of Euler steps taken
+        self.block_steps: dict[int, int] = {}
+
+    def block_budget(self, block: int, num_blocks: int) -> int:
+        """NFEs block `block` may use: an even share of what is left of the song budget."""
+        if self.nfe_budget is None:
+            self.nfe_budget = self.nfe_per_block * num_blocks
+        remaining = self.nfe_budget - self.nfe_used
+        share = remaining // max(num_blocks - block, 1)
+        return max(self.min_steps, min(self.max_steps, share))
+
+    def integrate(self, fn, x: torch.Tensor, block: int, num_blocks: int) -> torch.Tensor:
+        """
+        Integrates dx/dt = fn(t, x) (t a python float) from t=0 to 1 within the block's budget,
+        updating `x` in place.
+        """
+        budget = self.block_budget(block, num_blocks)
+        # budget >= min_steps, so the cap never conflicts with reaching t = 1 within it
+        max_dt = min(self.max_dt, 1.0 / self.min_steps)
+        t = 0.0
+        h = 1.0 / budget
+        v = fn(t, x)
+        nfe = 1
+        steps = 0
+        while True:
+            # never take a step so small that the rest of the budget cannot reach t = 1
+            h = min(max(min(h, max_dt), (1.0 - t) / (budget - nfe + 1)), 1.0 - t)
+            x.add_(v, alpha=h)
+            t += h
+            steps += 1
+            if t >= 1.0 - 1e-6:
+                break
+            v_next = fn(t, x)
+            nfe += 1
+            # Heun - Euler, the worst item of the batch decides the shared step size
+            err = (0.5 * h * (v_next - v)).float().pow(2).flatten(1).mean(dim=1).sqrt().max()
+            err = float(err)
+            v = v_next
+            h = h * min(2.0, max(0.5, self.safety * (self.tol / max(err, 1e-12)) ** 0.5))
+        self.nfe_used += nfe
+        self.block_steps[block] = steps
+        return x
+
+    def state_dict(self) -> dict:
+        """Budget bookkeeping of the blocks done so far, saved with sampler checkpoints."""
+        return {
+            "nfe_budget": self.nfe_budget,
+            "nfe_used": self.nfe_used,
+            "block_steps": dict(self.block_steps),
+        }
+
+    def load_state_dict(self, state: dict) -> None:
+        """Continues the song budget of a resumed run where its checkpoint left off."""
+        self.nfe_budget = state["nfe_budget"]
+        self.nfe_used = state["nfe_used"]
+        self.block_steps = dict(state["block_steps"])
+
+    def stats(self) -> dict:
+        return {
+            "nfe": self.nfe_used,
+            "nfe_budget": self.nfe_budget,
+            "block_steps": [self.block_steps[bid] for bid in sorted(self.block_steps)],
+        }
@@ -140,6 +140,17 @@ app.include_router(generate.router)
 app.include_router(upload.router)
 
 
+@app.on_event("startup")
+async def recover_unfinished_tasks():
+    """Requeue generation tasks interrupted by a crash or restart (they resume from their checkpoints)"""
+    from backend.services.task_service import get_task_service
+    
+    try:
+        get_task_service().recover_tasks()
+    except Exception as e:
+        logger.error(f"Failed to recover tasks: {e}", exc_info=True)
+
+
 # WebSocket for progress updates
 @app.websocket("/api/tasks/{task_id}/progress")
 async def websocket_progress(websocket: WebSocket, task_id: str):
@@ -41,6 +41,41 @@ class ConfigService:
                 "default_batch_size": 1,
                 "max_duration": 300  # seconds
             },
+            "inference": {
+                "vocoder_graph": "torchscript",  # torchscript, eager
+                "vocoder_int8": False,  # 需先运行 backend.utils.vocoder_quant 并通过质量门控
+                "vocoder_int8_max_stft_distance": 0.15,
+                "save_calibration_latents": False,
+                "dit_backend": "torch",  # torch, compiled, onnxruntime（仅 CPU）
+                "attention_backend": "auto",  # auto（按主机选择）, sdpa, flex, eager
+                "num_history_block": 0,  # 长歌曲滑动历史窗口（块数），0 表示保留全部历史
+                "kv_cache_dtype": "none",  # none, int8, fp8（KV cache 量化存储，见 bench_kv_cache）
+                "reroll_records": 2,  # 保留最近几个任务的块快照以支持从某块重新生成，0 关闭
+                "checkpoint_every_blocks": 4,  # 每隔几个块写一次采样检查点（Build/cache/checkpoints），0 关闭
+                "result_cache": True,  # 固定 seed 的请求命中结果缓存时直接返回已有文件
+                "draft_steps": 8,  # 草稿模式：先用少量步数快速出可播放的草稿，再后台按完整步数精修
+                "draft_solver": "euler",
+                "draft_cfg_cutoff": 0.5,  # 草稿只在 t <= 0.5 时做 CFG
+                "adaptive_steps": False,  # 按嵌入式误差估计逐块选择步数（总 NFE 预算不变，简单的块省下的给复杂的块）
+                "adaptive_step_tol": 0.02,
+                "adaptive_nfe_per_block": 0,  # 每块平均 NFE 预算，0 表示与固定步数相同（sample_steps - 1）
+                "eos_early_exit_from": 0  # 设为如 0.75 时，t >= 0.75 起整块都是结束帧即提前结束该块；0 关闭（默认）
+            },
+            "g2p": {
+                # 多音字模型的 ONNX Runtime 会话（见 g2p/g2p/onnx_session.py 与 bench_g2p_poly）
+                "ort_intra_op_threads": 2,  # 0 表示使用全部核心（会与 torch 争抢 CPU）
+                "ort_inter_op_threads": 1,
+                "ort_execution_mode": "sequential",  # sequential, parallel
+                "ort_cpu_mem_arena": True,
+                "ort_io_binding": False,
+                "ort_quantized": False,  # 使用 poly_bert_model.int8.onnx（需先用 quantize_model 生成）
+                "ort_pool_size": 1,  # 并发请求共享的会话数
+                "line_cache_size": 4096,  # 歌词行 G2P 结果的内存缓存行数，0 关闭
+                "line_cache_persistent": True,  # 同时缓存到 Build/cache/g2p_lines.sqlite，多个 worker 共享
+                "espeak_njobs": 1,  # 整份歌词批量音素化时 espeak 的并行进程数
+                "workers": 0,  # G2P 进程池的 worker 数（各自持有 espeak/jieba/ONNX 实例），0 表示在事件循环线程中处理
+                "warm_up": True  # 加载模型后在后台线程中初始化中英文 G2P 后端，否则在第一次请求时初始化
+            },
             "hardware": {
                 "auto_optimize": True,
                 "preferred_device": "auto"  # auto, cuda, cpu
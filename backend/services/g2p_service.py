@@ -0,0 +1,99 @@
+"""
+G2P 服务 - 在进程池中并行做歌词 G2P
+
+g2p 前端的状态是全局且非线程安全的（g2p_generation 中的 text_tokenizer、共享的 espeak 后端），
+在事件循环线程上只能串行处理。每个 worker 进程持有
+自己的 espeak 后端、jieba 和多音字 ONNX 会话；一份歌词的缓存未命中行被分成若干组
+分发到各 worker，多个请求的歌词也可以同时处理。行缓存仍在主进程中。
+"""
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from backend.utils.g2p_cache import G2PLineCache, normalize_line
+
+logger = logging.getLogger(__name__)
+
+# worker 进程内的 G2P 函数（chn_eng_g2p_many），由 _init_worker 加载
+_worker_g2p = None
+_worker_njobs = 1
+
+
+def _init_worker(session_options: Dict[str, Any], espeak_njobs: int):
+    """worker 初始化：先配置 ONNX 会话，再加载 g2p 前端"""
+    global _worker_g2p, _worker_njobs
+    from g2p.g2p.onnx_session import configure_sessions
+    configure_sessions(**session_options)
+    from backend.g2p.g2p_generation import chn_eng_g2p_many, warm_up
+    # 各语言后端延迟加载，在 worker 启动时完成，而不是在第一份歌词上
+    warm_up(background=False)
+    _worker_g2p = chn_eng_g2p_many
+    _worker_njobs = espeak_njobs
+
+
+def _encode_lines(lines: List[str]) -> List[List[int]]:
+    # token 偏移与 CNENTokenizer.encode 一致
+    return [[x + 1 for x in token] for _, token in _worker_g2p(lines, njobs=_worker_njobs)]
+
+
+class G2PService:
+    """进程池 G2P 服务"""
+
+    def __init__(
+        self,
+        num_workers: int,
+        cache: Optional[G2PLineCache] = None,
+        session_options: Optional[Dict[str, Any]] = None,
+        espeak_njobs: int = 1,
+    ):
+        """
+        num_workers: worker 进程数
+        cache: 主进程中的行缓存（通常与 CNENTokenizer 共享）
+        session_options: 传给 worker 中 configure_sessions 的 ONNX 会话选项
+        """
+        self.num_workers = max(int(num_workers), 1)
+        self.cache = cache
+        # spawn：worker 不继承父进程中已加载的模型和 CUDA 上下文
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(session_options or {}, espeak_njobs),
+        )
+
+    async def encode_many(self, lines: List[str]) -> List[List[int]]:
+        """批量编码歌词行，结果与 CNENTokenizer.encode_many 相同"""
+        # 规范化后的行只作缓存键，G2P 用原文计算
+        keys = [normalize_line(line) for line in lines] if self.cache is not None else lines
+        tokens: List[Optional[List[int]]] = [None] * len(lines)
+        missing: Dict[str, List[int]] = {}
+        for i, key in enumerate(keys):
+            if self.cache is not None and key not in missing:
+                tokens[i] = self.cache.get(key)
+            if tokens[i] is None:
+                missing.setdefault(key, []).append(i)
+        if not missing:
+            return tokens
+
+        # 连续分组，每组在一个 worker 中批量音素化
+        pending = list(missing)
+        size = -(-len(pending) // self.num_workers)
+        chunks = [pending[i:i + size] for i in range(0, len(pending), size)]
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*[
+            loop.run_in_executor(self._executor, _encode_lines, [lines[missing[key][0]] for key in chunk])
+            for chunk in chunks
+        ])
+        for chunk, encoded in zip(chunks, results):
+            for key, token in zip(chunk, encoded):
+                if self.cache is not None:
+                    self.cache.put(key, token)
+                for i in missing[key]:
+                    tokens[i] = list(token)
+        return tokens
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        logger.info("G2P worker pool shut down")
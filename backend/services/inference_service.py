@@ -1,7 +1,9 @@
 """
 推理服务 - 封装 inference.py 逻辑
 """
+import asyncio
 import logging
+from collections import OrderedDict
 from typing import Dict, Optional, Any, Callable
 from pathlib import Path
 import torch
@@ -19,6 +21,17 @@ from backend.utils.path_utils import get_debug_log_path
 logger = logging.getLogger(__name__)
 
 
+def _scaled_progress(
+    progress_callback: Optional[Callable[[float, str], None]], start: float, end: float
+) -> Optional[Callable[[float, str], None]]:
+    """把 _generate 的进度区间 [0.5, 1.0] 映射到 [start, end]，用于草稿 + 精修两段生成"""
+    if progress_callback is None:
+        return None
+    def callback(progress: float, message: str):
+        progress_callback(start + (progress - 0.5) / 0.5 * (end - start), message)
+    return callback
+
+
 class InferenceService:
     """推理服务 - 封装 DiffRhythm2 推理逻辑"""
     
@@ -33,10 +46,20 @@ class InferenceService:
         self._loaded_model = None
         self._device = None
         self._precision = None
+        # 实际使用的声码器图与 DiT 单步后端（回退后的结果），进入结果缓存键
+        self._vocoder_mode = "eager"
+        self._dit_backend = "torch"
         self._mulan = None
         self._decoder = None
         self._tokenizer = None
+        # 进程池 G2P 服务（g2p.workers > 0 时在加载模型后启动）
+        self._g2p_service = None
         self._repo_id = "ASLP-lab/DiffRhythm2"
+        # 最近任务的采样记录（各块边界快照），用于从某块开始重新生成
+        self._sampling_records: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # 采样在线程中执行（事件循环保持响应，草稿结果可被轮询到），同一时间只跑一个；
+        # 锁在第一次采样时于事件循环内创建（Python 3.9 的 asyncio.Lock 构造时绑定当前事件循环）
+        self._sampling_lock: Optional[asyncio.Lock] = None
     
     async def prepare_model(
         self,
@@ -64,15 +87,31 @@ class InferenceService:
             
             self._device = torch.device(device)
             self._precision = precision
+            self._sampling_records.clear()
             
             # 加载所有模型
             from backend.utils.inference_utils import prepare_models
+            from backend.services.config_service import get_config_service
             device_torch = torch.device(device)
+            config_service = get_config_service()
+            self._configure_g2p_sessions()
             self._loaded_model, self._mulan, self._tokenizer, self._decoder = prepare_models(
                 repo_id=self._repo_id,
                 ckpt_dir=self.model_dir,
-                device=device_torch
+                device=device_torch,
+                num_history_block=config_service.get_config("inference.num_history_block"),
+                kv_cache_dtype=config_service.get_config("inference.kv_cache_dtype"),
+                eos_early_exit_from=config_service.get_config("inference.eos_early_exit_from"),
+                g2p_cache_size=config_service.get_config("g2p.line_cache_size") or 0,
+                g2p_cache_db=(
+                    self.base_dir / "cache" / "g2p_lines.sqlite"
+                    if config_service.get_config("g2p.line_cache_persistent") else None
+                ),
+                espeak_njobs=config_service.get_config("g2p.espeak_njobs") or 1
             )
+            if config_service.get_config("g2p.warm_up"):
+                self._tokenizer.warm_up(background=True)
+            self._start_g2p_workers()
             
             # 根据精度调整模型
             if device == "cuda" and precision == "fp16":
@@ -83,6 +122,10 @@ class InferenceService:
             elif device == "cpu":
                 precision = "fp32"  # CPU 必须使用 FP32
             
+            # 声码器冻结图（必须在精度转换之后导出）
+            self._prepare_vocoder_graph()
+            self._prepare_dit_backend()
+            
             logger.info(f"Model prepared on {device} with {precision}")
             
             return {
@@ -99,6 +142,64 @@ class InferenceService:
                 "message": "Failed to load model"
             }
     
+    def _prepare_vocoder_graph(self):
+        """按配置为声码器加载/导出冻结图，失败时回退到 eager 模式"""
+        from backend.services.config_service import get_config_service
+        from backend.utils.inference_utils import prepare_vocoder_graph
+        
+        config_service = get_config_service()
+        vocoder_graph = config_service.get_config("inference.vocoder_graph") or "torchscript"
+        self._vocoder_mode = "eager"
+        if vocoder_graph != "torchscript":
+            return
+        try:
+            self._vocoder_mode = prepare_vocoder_graph(
+                self._decoder,
+                self.base_dir / "cache",
+                quantized=bool(config_service.get_config("inference.vocoder_int8")),
+                max_stft_distance=config_service.get_config("inference.vocoder_int8_max_stft_distance"),
+            )
+            logger.info("Vocoder frozen graph ready")
+        except Exception as e:
+            logger.warning(f"Failed to prepare vocoder frozen graph, using eager decoder: {e}")
+    
+    def set_dit_backend(self, backend: str) -> str:
+        """切换 DiT 单步推理后端（torch / compiled / onnxruntime），返回实际使用的后端"""
+        if self._loaded_model is None:
+            raise RuntimeError("Model not loaded")
+        return self._prepare_dit_backend(backend)
+    
+    def _prepare_dit_backend(self, backend: Optional[str] = None) -> str:
+        """选择 DiT 单步推理后端（默认取配置），失败时回退到 torch"""
+        from backend.services.config_service import get_config_service
+        from backend.utils.inference_utils import prepare_dit_step_backend
+        
+        config_service = get_config_service()
+        self._prepare_attention_backend(config_service.get_config("inference.attention_backend"))
+        if backend is None:
+            backend = config_service.get_config("inference.dit_backend") or "torch"
+        try:
+            backend = prepare_dit_step_backend(self._loaded_model, self.base_dir / "cache", backend)
+            logger.info(f"DiT step backend: {backend}")
+        except Exception as e:
+            self._loaded_model.step_backend = None
+            logger.warning(f"Failed to prepare {backend} DiT backend, using torch: {e}")
+            backend = "torch"
+        self._dit_backend = backend
+        return backend
+    
+    def _prepare_attention_backend(self, backend: Optional[str] = None) -> str:
+        """选择注意力后端（auto 时按主机选择），失败时回退到 sdpa"""
+        from backend.diffrhythm2.backbones.attention_dispatch import set_attention_backend
+        
+        try:
+            backend = set_attention_backend(backend or "auto")
+        except Exception as e:
+            logger.warning(f"Failed to use {backend} attention, using sdpa: {e}")
+            backend = set_attention_backend("sdpa")
+        logger.info(f"Attention backend: {backend}")
+        return backend
+    
     def _check_fp16_support(self) -> bool:
         """检查是否支持 FP16"""
         if not torch.cuda.is_available():
@@ -122,8 +223,18 @@ class InferenceService:
         max_duration: int = 300,
         progress_callback: Optional[Callable[[float, str], None]] = None,
         task_id: Optional[str] = None,
+        seed: Optional[int] = None,
+        n_candidates: int = 1,
+        draft: bool = False,
+        draft_callback: Optional[Callable[[Dict], None]] = None,
     ) -> Dict:
-        """执行推理生成音乐"""
+        """执行推理生成音乐
+        
+        seed: 可选随机种子，固定后相同输入的生成结果确定，并启用结果缓存
+        n_candidates: 同一歌词和风格一次生成的候选数，大于 1 时结果中的 output_paths 列出全部候选
+        draft: 草稿模式，先用少量步数、便宜的求解器和截断的 CFG 快速生成可播放的草稿并交给
+            draft_callback，再用相同的逐块噪声按完整步数精修，完成后替换草稿文件
+        """
         
         try:
             # 确保模型已加载
@@ -170,8 +281,7 @@ class InferenceService:
             print("📝 Processing lyrics...", flush=True)
             
             # 解析歌词
-            from backend.utils.inference_utils import parse_lyrics, run_inference
-            lyrics_tokens = parse_lyrics(lyrics, self._tokenizer)
+            lyrics_tokens = await self._parse_lyrics(lyrics)
             # lyrics_tensor 保持为 long 类型（token IDs），不需要转换精度
             lyrics_tensor = torch.tensor(sum(lyrics_tokens, []), dtype=torch.long, device=self._device)
             
@@ -186,7 +296,8 @@ class InferenceService:
                     prompt_wav, sr = torchaudio.load(style_audio_path)
                     prompt_wav = torchaudio.functional.resample(prompt_wav.to(self._device), sr, 24000)
                     if prompt_wav.shape[1] > 24000 * 10:
-                        start = random.randint(0, prompt_wav.shape[1] - 24000 * 10)
+                        rng = random.Random(seed) if seed is not None else random
+                        start = rng.randint(0, prompt_wav.shape[1] - 24000 * 10)
                         prompt_wav = prompt_wav[:, start:start+24000*10]
                     prompt_wav = prompt_wav.mean(dim=0, keepdim=True)
                     style_prompt_embed = self._mulan(wavs=prompt_wav)
@@ -206,57 +317,462 @@ class InferenceService:
                 progress_callback(0.5, "Generating music...")
             print("🎵 Generating music...", flush=True)
             
-            # 准备输出路径
-            output_filename = f"{song_name}.mp3"
-            output_path = self.output_dir / output_filename
-            self.output_dir.mkdir(parents=True, exist_ok=True)
+            sample_steps = 32
+            cfg_strength = 2.0
+            from backend.services.config_service import get_config_service
             
-            # 创建取消检查函数（如果提供了 task_id）
-            cancel_check = None
-            if task_id:
-                from backend.services.task_service import get_task_service, TaskStatus
-                task_service = get_task_service()
-                def check_cancelled():
-                    task = task_service.tasks.get(task_id)
-                    return task and task.status == TaskStatus.CANCELLED
-                cancel_check = check_cancelled
+            # 固定 seed 时结果是确定的：命中结果缓存直接返回已有文件，相同的并发请求只生成一次
+            from backend.services.result_cache_service import get_result_cache_service
+            result_cache = get_result_cache_service(self.base_dir / "cache")
+            cache_key = None
+            if seed is not None and get_config_service().get_config("inference.result_cache") is not False:
+                cache_key = result_cache.make_key(
+                    lyric_tokens=lyrics_tensor.tolist(),
+                    style_embedding=style_prompt_embed.float().cpu().numpy().tobytes(),
+                    seed=seed,
+                    steps=sample_steps,
+                    cfg_strength=cfg_strength,
+                    solver=self._solver_key(sample_steps),
+                    duration=min(max_duration, 300),
+                    n_candidates=n_candidates,
+                    config=self._config_fingerprint(precision),
+                )
+                cached = result_cache.get(cache_key)
+                if cached is not None:
+                    logger.info(f"Result cache hit: {cached['output_path']}")
+                    if progress_callback:
+                        progress_callback(1.0, "Generation completed (cached)")
+                    return {**cached, "success": True, "cached": True, "message": "Music generated successfully"}
+            
+            if draft and seed is None:
+                # 草稿和精修必须使用同一组逐块噪声
+                seed = random.getrandbits(63)
             
-            # 执行推理
-            run_inference(
-                model=self._loaded_model,
-                decoder=self._decoder,
-                text=lyrics_tensor,
-                style_prompt=style_prompt_embed,
-                duration=min(max_duration, 300),  # 限制最大时长
-                output_path=output_path,
-                cfg_strength=2.0,
-                sample_steps=32,
-                fake_stereo=True,
-                cancel_check=cancel_check,
+            async def generate() -> Dict:
+                if draft and not self._has_checkpoint(task_id):
+                    draft_result = await self._generate(
+                        lyrics_tensor, style_prompt_embed, song_name, max_duration, seed,
+                        sample_steps, cfg_strength, _scaled_progress(progress_callback, 0.5, 0.7),
+                        task_id, n_candidates, mode="draft"
+                    )
+                    if draft_callback:
+                        draft_callback(draft_result)
+                    progress = _scaled_progress(progress_callback, 0.7, 1.0)
+                else:
+                    progress = progress_callback
+                result = await self._generate(
+                    lyrics_tensor, style_prompt_embed, song_name, max_duration, seed,
+                    sample_steps, cfg_strength, progress, task_id, n_candidates,
+                    mode="refine" if draft else "full"
+                )
+                if cache_key is not None:
+                    result_cache.put(cache_key, result)
+                return result
+            
+            if cache_key is None:
+                return await generate()
+            return await result_cache.run_once(cache_key, generate)
+        except Exception as e:
+            logger.error(f"Inference failed: {e}", exc_info=True)
+            return {
+                "success": False,
+                "error": str(e),
+                "message": "Generation failed"
+            }
+    
+    async def _generate(
+        self,
+        lyrics_tensor: torch.Tensor,
+        style_prompt_embed: torch.Tensor,
+        song_name: str,
+        max_duration: int,
+        seed: Optional[int],
+        sample_steps: int,
+        cfg_strength: float,
+        progress_callback: Optional[Callable[[float, str], None]],
+        task_id: Optional[str],
+        n_candidates: int = 1,
+        mode: str = "full",
+    ) -> Dict:
+        """采样、解码并保存音频
+        
+        mode: full 正常生成；draft 为草稿（不写检查点、不保留重新生成记录）；
+            refine 为草稿之后的精修，先写到暂存目录，完成后替换草稿文件
+        """
+        from backend.services.config_service import get_config_service
+        from backend.utils.inference_utils import run_inference
+        config_service = get_config_service()
+        
+        # 准备输出路径
+        output_filename = f"{song_name}.mp3"
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        output_path = self.output_dir / output_filename
+        if mode == "refine":
+            output_path = self.output_dir / ".refine" / output_filename
+            output_path.parent.mkdir(exist_ok=True)
+        
+        solver = None
+        cfg_cutoff = 1.0
+        if mode == "draft":
+            sample_steps = int(config_service.get_config("inference.draft_steps") or sample_steps)
+            solver = config_service.get_config("inference.draft_solver")
+            cfg_cutoff = float(config_service.get_config("inference.draft_cfg_cutoff") or 1.0)
+        
+        # 自适应步数：按嵌入式误差估计逐块分配 NFE，各块实际步数写入结果
+        step_controller = None
+        if mode != "draft" and config_service.get_config("inference.adaptive_steps"):
+            from backend.diffrhythm2.step_control import AdaptiveStepController
+            step_controller = AdaptiveStepController(
+                nfe_per_block=int(config_service.get_config("inference.adaptive_nfe_per_block") or 0) or sample_steps - 1,
+                tol=float(config_service.get_config("inference.adaptive_step_tol") or 0.02),
             )
+        
+        # 创建取消检查函数（如果提供了 task_id）
+        cancel_check = None
+        if task_id:
+            from backend.services.task_service import get_task_service, TaskStatus
+            task_service = get_task_service()
+            def check_cancelled():
+                task = task_service.tasks.get(task_id)
+                return task and task.status == TaskStatus.CANCELLED
+            cancel_check = check_cancelled
+        
+        # 可选：保存 latent 作为 int8 声码器的校准数据
+        latent_save_path = None
+        if mode != "draft" and config_service.get_config("inference.save_calibration_latents"):
+            latent_save_path = self.base_dir / "cache" / "vocoder_calib" / f"{song_name}.pt"
+        
+        # 采样检查点：任务中断（崩溃、重启）后从最后一个检查点继续
+        checkpointer, resume_checkpoint = None, None
+        if mode != "draft":
+            checkpointer, resume_checkpoint = self._prepare_checkpoint(
+                task_id, lyrics_tensor, style_prompt_embed, n_candidates, solver, cfg_cutoff, step_controller
+            )
+        if resume_checkpoint is not None:
+            lyrics_tensor = resume_checkpoint["text"].to(self._device)
+            style_prompt_embed = resume_checkpoint["style_prompt"].to(self._device, style_prompt_embed.dtype)
+            n_candidates = resume_checkpoint.get("n_candidates", 1)
+            # 剩余块沿用中断前的采样设置，自适应步数从已用的 NFE 继续分配预算
+            solver = resume_checkpoint["solver"]
+            cfg_cutoff = resume_checkpoint["cfg_cutoff"]
+            if step_controller is not None and resume_checkpoint["step_controller"] is not None:
+                step_controller.load_state_dict(resume_checkpoint["step_controller"])
+        
+        # 重新生成（reroll）只支持单个候选的任务
+        record_callback = None
+        if task_id and mode != "draft" and n_candidates == 1 and self._max_sampling_records() > 0:
+            def record_callback(record):
+                self._remember_record(task_id, record, song_name, max_duration)
+        
+        # 执行推理
+        try:
+            async with self._get_sampling_lock():
+                output_paths = await asyncio.to_thread(
+                    run_inference,
+                    model=self._loaded_model,
+                    decoder=self._decoder,
+                    text=lyrics_tensor,
+                    style_prompt=style_prompt_embed,
+                    duration=min(max_duration, 300),  # 限制最大时长
+                    output_path=output_path,
+                    cfg_strength=cfg_strength,
+                    sample_steps=sample_steps,
+                    fake_stereo=True,
+                    cancel_check=cancel_check,
+                    latent_save_path=latent_save_path,
+                    seed=seed,
+                    record_callback=record_callback,
+                    block_callback=checkpointer,
+                    resume_checkpoint=resume_checkpoint,
+                    n_candidates=n_candidates,
+                    solver=solver,
+                    cfg_cutoff=cfg_cutoff,
+                    step_controller=step_controller,
+                )
+        except Exception:
+            # 取消或失败的任务不会再恢复；进程被杀或服务关闭时检查点保留在磁盘上
+            if checkpointer is not None:
+                checkpointer.close(remove=True)
+            raise
+        if checkpointer is not None:
+            checkpointer.close(remove=True)
+        if not isinstance(output_paths, list):
+            output_paths = [output_paths]
+        if mode == "refine":
+            # 原子替换，播放中的草稿要么是旧文件要么是完整的新文件
+            final_paths = [self.output_dir / path.name for path in output_paths]
+            for path, final_path in zip(output_paths, final_paths):
+                os.replace(path, final_path)
+            output_paths = final_paths
+        output_path = output_paths[0]
+        
+        if progress_callback:
+            progress_callback(0.9, "Finalizing output...")
+        
+        logger.info(f"Inference completed: {output_path}")
+        logger.info(f"Output file exists: {output_path.exists()}, size: {output_path.stat().st_size if output_path.exists() else 0}")
+        
+        if progress_callback:
+            progress_callback(1.0, "Generation completed")
+        print(f"✅ Generation completed: {output_path}", flush=True)
+        
+        return {
+            "success": True,
+            "output_path": str(output_path),
+            "output_paths": [str(path) for path in output_paths],
+            "song_name": song_name,
+            "draft": mode == "draft",
+            "message": "Draft generated, refining..." if mode == "draft" else "Music generated successfully",
+            **({"rerollable": False} if mode == "draft" else self._record_info(task_id)),
+            **({"adaptive_steps": step_controller.stats()} if step_controller is not None else {})
+        }
+    
+    def _g2p_session_options(self) -> Dict[str, Any]:
+        """配置中的多音字模型 ONNX 会话选项（值为 None 的项保持默认）"""
+        from backend.services.config_service import get_config_service
+        g2p_config = get_config_service().get_config("g2p") or {}
+        return {
+            "intra_op_num_threads": g2p_config.get("ort_intra_op_threads"),
+            "inter_op_num_threads": g2p_config.get("ort_inter_op_threads"),
+            "execution_mode": g2p_config.get("ort_execution_mode"),
+            "enable_cpu_mem_arena": g2p_config.get("ort_cpu_mem_arena"),
+            "io_binding": g2p_config.get("ort_io_binding"),
+            "quantized": g2p_config.get("ort_quantized"),
+            "pool_size": g2p_config.get("ort_pool_size"),
+        }
+    
+    def _configure_g2p_sessions(self):
+        """多音字模型的会话在第一次使用时创建（加载模型后的后台预热或第一次请求），需在此之前配置"""
+        from g2p.g2p.onnx_session import configure_sessions
+        configure_sessions(**self._g2p_session_options())
+    
+    def _start_g2p_workers(self):
+        """g2p.workers > 0 时启动进程池 G2P 服务，与分词器共享行缓存"""
+        from backend.services.config_service import get_config_service
+        from backend.services.g2p_service import G2PService
+        self._stop_g2p_workers()
+        config_service = get_config_service()
+        num_workers = config_service.get_config("g2p.workers") or 0
+        if num_workers <= 0:
+            return
+        self._g2p_service = G2PService(
+            num_workers,
+            cache=self._tokenizer.cache,
+            # 每个 worker 只处理自己的一组歌词行，一个会话即可
+            session_options={**self._g2p_session_options(), "pool_size": 1},
+            espeak_njobs=config_service.get_config("g2p.espeak_njobs") or 1,
+        )
+        logger.info(f"G2P worker pool started with {num_workers} workers")
+    
+    def _stop_g2p_workers(self):
+        if self._g2p_service is not None:
+            self._g2p_service.shutdown()
+            self._g2p_service = None
+    
+    async def _parse_lyrics(self, lyrics: str) -> list:
+        """解析歌词；启用 G2P 进程池时歌词行在各 worker 中并行处理，不阻塞事件循环"""
+        from backend.utils.inference_utils import parse_lyrics, split_lyrics, fill_lyrics
+        if self._g2p_service is None:
+            return parse_lyrics(lyrics, self._tokenizer)
+        lyrics_with_time, text_lines = split_lyrics(lyrics)
+        encoded = await self._g2p_service.encode_many(text_lines) if text_lines else []
+        return fill_lyrics(lyrics_with_time, encoded)
+    
+    def get_g2p_cache_stats(self) -> Optional[Dict]:
+        """歌词行 G2P 缓存的命中统计，模型未加载或未启用缓存时返回 None"""
+        if self._tokenizer is None:
+            return None
+        return self._tokenizer.cache_stats()
+    
+    def _solver_key(self, sample_steps: int) -> str:
+        """结果缓存键中的求解器描述，自适应步数的设置也会影响结果"""
+        from backend.services.config_service import get_config_service
+        config_service = get_config_service()
+        method = self._loaded_model.odeint_kwargs.get("method")
+        if not config_service.get_config("inference.adaptive_steps"):
+            return method
+        nfe_per_block = int(config_service.get_config("inference.adaptive_nfe_per_block") or 0) or sample_steps - 1
+        return f"adaptive-euler(tol={config_service.get_config('inference.adaptive_step_tol')},nfe={nfe_per_block})"
+    
+    def _config_fingerprint(self, precision: str) -> Dict[str, Any]:
+        """结果缓存键中影响输出的推理配置：模型权重、设备与精度、KV 缓存、注意力与 DiT 后端、声码器图、提前结束"""
+        from backend.diffrhythm2.backbones.attention_dispatch import get_attention_backend
+        from backend.services.config_service import get_config_service
+        from backend.utils.path_utils import file_digest
+        config_service = get_config_service()
+        return {
+            "dit_checkpoint": file_digest(self._loaded_model.ckpt_path),
+            "vocoder_checkpoint": file_digest(self._decoder.ckpt_path),
+            "device": self._device.type,
+            "precision": precision,
+            "model_precision": self._precision,
+            "num_history_block": config_service.get_config("inference.num_history_block"),
+            "kv_cache_dtype": config_service.get_config("inference.kv_cache_dtype"),
+            "attention_backend": get_attention_backend(),
+            "dit_backend": self._dit_backend,
+            "vocoder": self._vocoder_mode,
+            "eos_early_exit_from": config_service.get_config("inference.eos_early_exit_from") or 0,
+        }
+    
+    def _has_checkpoint(self, task_id: Optional[str]) -> bool:
+        """任务已有精修阶段的采样检查点（重启恢复）时跳过草稿"""
+        from backend.utils.sampler_checkpoint import checkpoint_path
+        return bool(task_id) and checkpoint_path(self.base_dir / "cache", task_id).exists()
+    
+    def _prepare_checkpoint(
+        self,
+        task_id: Optional[str],
+        lyrics_tensor: torch.Tensor,
+        style_prompt_embed: torch.Tensor,
+        n_candidates: int = 1,
+        solver: Optional[str] = None,
+        cfg_cutoff: float = 1.0,
+        step_controller=None,
+    ):
+        """返回 (检查点写入器, 已有的检查点)；未启用或没有 task_id 时为 (None, None)"""
+        from backend.services.config_service import get_config_service
+        from backend.utils.sampler_checkpoint import SamplerCheckpointer, checkpoint_path, load_checkpoint
+        
+        every_blocks = int(get_config_service().get_config("inference.checkpoint_every_blocks") or 0)
+        if not task_id or every_blocks <= 0:
+            return None, None
+        path = checkpoint_path(self.base_dir / "cache", task_id)
+        resume_checkpoint = load_checkpoint(path)
+        if resume_checkpoint is not None:
+            lyrics_tensor = resume_checkpoint["text"]
+            style_prompt_embed = resume_checkpoint["style_prompt"]
+            n_candidates = resume_checkpoint.get("n_candidates", 1)
+            solver = resume_checkpoint["solver"]
+            cfg_cutoff = resume_checkpoint["cfg_cutoff"]
+            logger.info(f"Resuming task {task_id} from block {resume_checkpoint['num_blocks_done']}")
+        checkpointer = SamplerCheckpointer(
+            path,
+            {
+                "text": lyrics_tensor,
+                "style_prompt": style_prompt_embed,
+                "n_candidates": n_candidates,
+                "solver": solver,
+                "cfg_cutoff": cfg_cutoff,
+            },
+            every_blocks=every_blocks,
+            step_controller=step_controller,
+        )
+        return checkpointer, resume_checkpoint
+    
+    def _get_sampling_lock(self) -> asyncio.Lock:
+        """采样锁，在协程中第一次调用时创建"""
+        if self._sampling_lock is None:
+            self._sampling_lock = asyncio.Lock()
+        return self._sampling_lock
+    
+    def _max_sampling_records(self) -> int:
+        from backend.services.config_service import get_config_service
+        return int(get_config_service().get_config("inference.reroll_records") or 0)
+    
+    def _remember_record(self, task_id: str, record, song_name: str, max_duration: float):
+        """保存任务的采样记录，超出数量上限时丢弃最旧的（记录持有模型设备上的 KV cache）"""
+        self._sampling_records[task_id] = {
+            "record": record,
+            "song_name": song_name,
+            "duration": min(max_duration, 300),
+        }
+        self._sampling_records.move_to_end(task_id)
+        while len(self._sampling_records) > self._max_sampling_records():
+            self._sampling_records.popitem(last=False)
+    
+    def _record_info(self, task_id: Optional[str]) -> Dict:
+        """可重新生成时，返回块数和每块时长，便于客户端选择起始块"""
+        entry = self._sampling_records.get(task_id) if task_id else None
+        if entry is None:
+            return {"rerollable": False}
+        return {
+            "rerollable": True,
+            "num_blocks": entry["record"].num_sampled_blocks,
+            "block_seconds": self._loaded_model.block_size / 5,
+        }
+    
+    async def reroll(
+        self,
+        source_task_id: str,
+        from_block: Optional[int] = None,
+        from_seconds: Optional[float] = None,
+        seed: Optional[int] = None,
+        lyrics: Optional[str] = None,
+        sample_steps: Optional[int] = None,
+        song_name: Optional[str] = None,
+        progress_callback: Optional[Callable[[float, str], None]] = None,
+        task_id: Optional[str] = None,
+    ) -> Dict:
+        """从某块开始重新生成已完成任务的歌曲，之前的块直接复用快照，不重新计算"""
+        try:
+            entry = self._sampling_records.get(source_task_id)
+            if entry is None or self._loaded_model is None:
+                return {
+                    "success": False,
+                    "error": f"No sampling record for task {source_task_id}",
+                    "message": "Task is not rerollable (record expired or model reloaded)"
+                }
+            record = entry["record"]
+            if from_block is None:
+                from_block = int((from_seconds or 0) * 5) // self._loaded_model.block_size
+            if not 0 <= from_block < record.num_sampled_blocks:
+                return {
+                    "success": False,
+                    "error": f"from_block must be in [0, {record.num_sampled_blocks})",
+                    "message": "Invalid reroll position"
+                }
+            
+            text = None
+            if lyrics:
+                lyrics_tokens = await self._parse_lyrics(lyrics)
+                text = torch.tensor(sum(lyrics_tokens, []), dtype=torch.long, device=self._device)
             
+            song_name = song_name or f"{entry['song_name']}_reroll_b{from_block}"
+            output_path = self.output_dir / f"{song_name}.mp3"
+            self.output_dir.mkdir(parents=True, exist_ok=True)
             if progress_callback:
-                progress_callback(0.9, "Finalizing output...")
+                progress_callback(0.5, f"Regenerating from block {from_block}...")
             
-            logger.info(f"Inference completed: {output_path}")
-            logger.info(f"Output file exists: {output_path.exists()}, size: {output_path.stat().st_size if output_path.exists() else 0}")
+            record_callback = None
+            if task_id:
+                def record_callback(new_record):
+                    self._remember_record(task_id, new_record, song_name, entry["duration"])
+            
+            from backend.utils.inference_utils import run_inference
+            async with self._get_sampling_lock():
+                await asyncio.to_thread(
+                    run_inference,
+                    model=self._loaded_model,
+                    decoder=self._decoder,
+                    text=text,
+                    style_prompt=None,
+                    duration=entry["duration"],
+                    output_path=output_path,
+                    cfg_strength=record.cfg_strength,
+                    sample_steps=sample_steps or record.steps,
+                    fake_stereo=True,
+                    seed=seed,
+                    record_callback=record_callback,
+                    resume_from=(record, from_block),
+                )
             
             if progress_callback:
                 progress_callback(1.0, "Generation completed")
-            print(f"✅ Generation completed: {output_path}", flush=True)
-            
             return {
                 "success": True,
                 "output_path": str(output_path),
                 "song_name": song_name,
-                "message": "Music generated successfully"
+                "source_task_id": source_task_id,
+                "from_block": from_block,
+                "message": "Music regenerated successfully",
+                **self._record_info(task_id)
             }
         except Exception as e:
-            logger.error(f"Inference failed: {e}", exc_info=True)
+            logger.error(f"Reroll failed: {e}", exc_info=True)
             return {
                 "success": False,
                 "error": str(e),
-                "message": "Generation failed"
+                "message": "Regeneration failed"
             }
     
     def unload_model(self):
@@ -264,6 +780,8 @@ class InferenceService:
         if self._loaded_model is not None:
             del self._loaded_model
             self._loaded_model = None
+        self._sampling_records.clear()
+        self._stop_g2p_workers()
         
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
@@ -283,4 +801,3 @@ def get_inference_service(base_dir: Optional[Path] = None) -> InferenceService:
             base_dir = Path(__file__).parent.parent.parent / "Build"
         _inference_service = InferenceService(base_dir)
     return _inference_service
-
@@ -0,0 +1,161 @@
+"""
+结果缓存服务 - 按生成输入做内容寻址的结果缓存，以及相同请求的单飞（single-flight）合并
+
+只有固定 seed 的请求结果是确定的，才会被缓存；键由歌词 token、风格向量哈希、seed、
+采样步数、cfg 强度、ODE 求解器、时长、候选数以及影响输出的推理配置指纹组成。
+命中的结果文件复制到缓存目录下按键命名（cache/results/{key}.mp3），
+不会被之后同名（默认 "generated"）的生成覆盖。
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# 缓存键格式或条目布局变化、或新增影响输出的配置项时递增，使旧的索引失效
+CACHE_KEY_VERSION = 4
+
+
+class ResultCacheService:
+    """结果缓存服务"""
+    
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = Path(cache_dir) / "results"
+        self._inflight: Dict[str, asyncio.Future] = {}
+    
+    @staticmethod
+    def make_key(
+        lyric_tokens: Sequence[int],
+        style_embedding: bytes,
+        seed: int,
+        steps: int,
+        cfg_strength: float,
+        solver: Optional[str],
+        duration: float,
+        n_candidates: int = 1,
+        config: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        计算生成输入的内容哈希（style_embedding 为 float32 风格向量的原始字节）
+        config: 影响输出的推理配置指纹（权重、设备与精度、KV 缓存、注意力/DiT/声码器后端等），需可 JSON 序列化
+        """
+        style_hash = hashlib.sha256(style_embedding).hexdigest()
+        payload = json.dumps({
+            "version": CACHE_KEY_VERSION,
+            "lyric_tokens": list(lyric_tokens),
+            "style": style_hash,
+            "seed": seed,
+            "steps": steps,
+            "cfg_strength": cfg_strength,
+            "solver": solver,
+            "duration": duration,
+            "n_candidates": n_candidates,
+            "config": config or {},
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def _index_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+    
+    def _result_paths(self, key: str, output_paths: List[str]) -> List[Path]:
+        """缓存自有的结果文件：单个结果为 {key}.mp3，多候选为 {key}_{i}.mp3"""
+        if len(output_paths) == 1:
+            return [self.cache_dir / f"{key}{Path(output_paths[0]).suffix}"]
+        return [self.cache_dir / f"{key}_{i}{Path(path).suffix}" for i, path in enumerate(output_paths, 1)]
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """返回已缓存的结果（路径指向缓存自有的文件）；文件已被删除时视为未命中"""
+        index_path = self._index_path(key)
+        if not index_path.exists():
+            return None
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Dropping unreadable result cache entry {index_path}: {e}")
+            index_path.unlink(missing_ok=True)
+            return None
+        output_paths = entry.get("output_paths") or [entry["output_path"]]
+        if not all(Path(path).exists() for path in output_paths):
+            self._drop(key, output_paths)
+            return None
+        return entry
+    
+    def _drop(self, key: str, output_paths: Sequence[str]):
+        """删除索引和残留的结果文件"""
+        index_path = self._index_path(key)
+        index_path.unlink(missing_ok=True)
+        for path in output_paths:
+            Path(path).unlink(missing_ok=True)
+    
+    def put(self, key: str, result: Dict[str, Any]):
+        """缓存成功的生成结果：输出文件复制到缓存目录（输出目录中的文件之后可能被同名生成覆盖）"""
+        if not result.get("success"):
+            return
+        source_paths = result.get("output_paths") or [result["output_path"]]
+        cached_paths = self._result_paths(key, source_paths)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            for source, cached in zip(source_paths, cached_paths):
+                # 复制而不是硬链接：输出文件可能被原地重写；先写临时文件再替换，读者看不到半个文件
+                tmp_path = cached.with_name(f".{cached.name}.tmp")
+                shutil.copyfile(source, tmp_path)
+                os.replace(tmp_path, cached)
+            entry = {
+                "output_path": str(cached_paths[0]),
+                "output_paths": [str(path) for path in cached_paths],
+                "song_name": result.get("song_name"),
+                "created_at": datetime.now().isoformat(),
+            }
+            with open(self._index_path(key), "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+        except OSError as e:
+            logger.warning(f"Failed to write result cache entry: {e}")
+    
+    async def run_once(self, key: str, func: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """相同 key 的并发调用只执行一次 func，其余调用等待并共享结果"""
+        while (inflight := self._inflight.get(key)) is not None:
+            logger.info(f"Coalescing identical generation request {key[:12]}")
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # 执行中的那次调用被取消（而不是当前调用），由当前调用重新执行
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await func()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有等待者时也标记为已读取，避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+
+# 全局实例
+_result_cache_service: Optional[ResultCacheService] = None
+
+
+def get_result_cache_service(cache_dir: Optional[Path] = None) -> ResultCacheService:
+    """获取结果缓存服务单例"""
+    global _result_cache_service
+    if _result_cache_service is None:
+        if cache_dir is None:
+            cache_dir = Path(__file__).parent.parent.parent / "Build" / "cache"
+        _result_cache_service = ResultCacheService(cache_dir)
+    return _result_cache_service
@@ -2,8 +2,10 @@
 任务队列管理服务
 """
 import asyncio
+import json
 import uuid
 import logging
+from pathlib import Path
 from typing import Dict, Any, Callable, Coroutine, Optional, List
 from enum import Enum
 from datetime import datetime
@@ -51,16 +53,71 @@ class Task:
         }
 
 
+# 这些类型的任务会持久化到磁盘，服务重启后重新排队（配合采样检查点从中断处继续）；
+# 重新生成（reroll）依赖只在内存中的源任务采样记录，重启后无法完成，不持久化
+RESUMABLE_TASK_TYPES = ("generate",)
+
+
 class TaskService:
     """任务队列管理服务"""
     
-    def __init__(self, max_concurrent: int = 1):
+    def __init__(self, max_concurrent: int = 1, state_dir: Optional[Path] = None):
         self.max_concurrent = max_concurrent
         self.tasks: Dict[str, Task] = {}
         self.task_queue: asyncio.Queue = asyncio.Queue()
         self.running_tasks: Dict[str, asyncio.Task] = {}
         self._worker_running = False
         self._worker_task: Optional[asyncio.Task] = None
+        if state_dir is None:
+            state_dir = Path(__file__).parent.parent.parent / "Build" / "cache" / "tasks"
+        self.state_dir = Path(state_dir)
+    
+    def _state_path(self, task_id: str) -> Path:
+        return self.state_dir / f"{task_id}.json"
+    
+    def save_task_state(self, task: Task):
+        """持久化未完成的任务，进程崩溃或重启后由 recover_tasks 重新排队"""
+        if task.type not in RESUMABLE_TASK_TYPES:
+            return
+        try:
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+            with open(self._state_path(task.id), "w", encoding="utf-8") as f:
+                json.dump({"id": task.id, "type": task.type, "params": task.params, "created_at": task.created_at}, f)
+        except (OSError, TypeError) as e:
+            logger.warning(f"Failed to persist task {task.id}: {e}")
+    
+    def clear_task_state(self, task_id: str):
+        """任务结束（完成、失败或被用户取消）后删除持久化状态"""
+        self._state_path(task_id).unlink(missing_ok=True)
+    
+    def recover_tasks(self) -> List[str]:
+        """重新排队上次运行中未完成的任务（需在事件循环中调用）"""
+        if not self.state_dir.exists():
+            return []
+        recovered = []
+        for path in sorted(self.state_dir.glob("*.json"), key=lambda p: p.stat().st_mtime):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Dropping unreadable task state {path}: {e}")
+                path.unlink(missing_ok=True)
+                continue
+            if state["id"] in self.tasks:
+                continue
+            if state.get("type") not in RESUMABLE_TASK_TYPES:
+                # 旧版本留下的不可恢复任务（如 reroll）
+                logger.warning(f"Dropping non-resumable {state.get('type')} task state {path}")
+                path.unlink(missing_ok=True)
+                continue
+            self.create_task(state["type"], state["params"], task_id=state["id"])
+            task = self.tasks[state["id"]]
+            task.created_at = state.get("created_at", task.created_at)
+            task.message = "Recovered after restart"
+            recovered.append(state["id"])
+        if recovered:
+            logger.info(f"Recovered {len(recovered)} unfinished task(s): {recovered}")
+        return recovered
     
     async def add_task(
         self,
@@ -193,11 +250,23 @@ class TaskService:
             status_msg = f"[{task_id[:8]}] {progress_percent}% - {message or 'Processing...'}"
             print(status_msg, flush=True)
     
-    def create_task(self, task_type: str, params: Dict[str, Any]) -> str:
-        """创建任务（同步方法，返回 task_id）"""
-        task_id = str(uuid.uuid4())
+    def set_partial_result(self, task_id: str, result: Dict[str, Any], message: Optional[str] = None):
+        """任务仍在运行时发布中间结果（如草稿模式的草稿），完成时被最终结果替换"""
+        task = self.tasks.get(task_id)
+        if task is None or task.status != TaskStatus.RUNNING:
+            return
+        task.result = result
+        self.update_task_progress(task_id, task.progress, message)
+    
+    def create_task(self, task_type: str, params: Dict[str, Any], task_id: Optional[str] = None) -> str:
+        """创建任务（同步方法，返回 task_id）
+        
+        task_id 用于恢复重启前的任务，使其沿用原来的采样检查点。
+        """
+        task_id = task_id or str(uuid.uuid4())
         task = Task(task_id, task_type, params)
         self.tasks[task_id] = task
+        self.save_task_state(task)
         
         # 根据任务类型创建对应的异步任务函数
         async def task_executor():
@@ -231,6 +300,10 @@ class TaskService:
                         max_duration=params.get("max_duration", 300),
                         progress_callback=progress_callback,
                         task_id=task_id,  # 传递 task_id 以便检查取消状态
+                        seed=params.get("seed"),
+                        n_candidates=params.get("n_candidates", 1),
+                        draft=params.get("draft", False),
+                        draft_callback=lambda result: self.set_partial_result(task_id, result, "Draft ready, refining..."),
                     )
                     
                     if result.get("success"):
@@ -246,13 +319,49 @@ class TaskService:
                         task.message = result.get("message", "Generation failed")
                         task.updated_at = datetime.now().isoformat()
                         logger.error(f"Task {task_id} failed: {task.error}")
+                    self.clear_task_state(task_id)
+                elif task_type == "reroll":
+                    from backend.services.inference_service import get_inference_service
+                    from pathlib import Path
+                    
+                    base_dir = Path(__file__).parent.parent.parent / "Build"
+                    inference_service = get_inference_service(base_dir)
+                    
+                    def progress_callback(progress: float, message: str):
+                        if task_id in self.tasks and self.tasks[task_id].status == TaskStatus.CANCELLED:
+                            raise asyncio.CancelledError("Task cancelled by user")
+                        self.update_task_progress(task_id, progress, message)
+                    
+                    result = await inference_service.reroll(
+                        progress_callback=progress_callback,
+                        task_id=task_id,
+                        **params,
+                    )
+                    
+                    if result.get("success"):
+                        task.result = result
+                        task.status = TaskStatus.COMPLETED
+                        task.progress = 1.0
+                        task.message = "Reroll completed"
+                        logger.info(f"Task {task_id} completed successfully")
+                    else:
+                        task.status = TaskStatus.FAILED
+                        task.error = result.get("error", "Unknown error")
+                        task.message = result.get("message", "Reroll failed")
+                        logger.error(f"Task {task_id} failed: {task.error}")
+                    task.updated_at = datetime.now().isoformat()
+                    self.clear_task_state(task_id)
                 else:
                     task.status = TaskStatus.FAILED
                     task.error = f"Unknown task type: {task_type}"
                     task.message = f"Unsupported task type: {task_type}"
                     task.updated_at = datetime.now().isoformat()
                     logger.error(f"Task {task_id} failed: Unknown task type {task_type}")
+                    self.clear_task_state(task_id)
             except asyncio.CancelledError:
+                # 用户取消时状态已是 CANCELLED；否则是服务关闭，保留持久化状态以便重启后恢复
+                if task.status == TaskStatus.CANCELLED:
+                    self.clear_task_state(task_id)
                 task.status = TaskStatus.CANCELLED
                 task.message = "Task cancelled"
                 task.updated_at = datetime.now().isoformat()
@@ -264,6 +373,7 @@ class TaskService:
                 task.message = f"Task failed: {str(e)}"
                 task.updated_at = datetime.now().isoformat()
                 logger.error(f"Task {task_id} failed: {e}", exc_info=True)
+                self.clear_task_state(task_id)
                 raise
         
         # 在 FastAPI 的异步环境中，直接创建任务
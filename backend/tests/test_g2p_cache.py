@@ -0,0 +1,87 @@
+"""
+G2P 行缓存测试
+"""
+import os
+
+import pytest
+
+from backend.utils.g2p_cache import G2PLineCache, frontend_version, normalize_line
+
+
+def test_lru_eviction_and_stats():
+    """测试 LRU 淘汰与命中率统计"""
+    cache = G2PLineCache(max_size=2)
+    cache.put("a", [1, 2])
+    cache.put("b", [3])
+    assert cache.get("a") == [1, 2]
+    cache.put("c", [4])  # 淘汰最久未用的 "b"
+    assert cache.get("b") is None
+    assert cache.get("c") == [4]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (2, 1, 2)
+    assert stats["hit_rate"] == 2 / 3
+
+
+def test_returned_tokens_are_copies():
+    """测试调用方修改返回的列表不会污染缓存"""
+    cache = G2PLineCache()
+    cache.put("a", [1, 2])
+    cache.get("a").append(511)
+    assert cache.get("a") == [1, 2]
+
+
+def test_persistent_tier_shared_and_versioned(tmp_path):
+    """测试 SQLite 层跨实例共享，且版本不同时不命中"""
+    db_path = tmp_path / "g2p_lines.sqlite"
+    writer = G2PLineCache(db_path=db_path, version="v")
+    writer.put(normalize_line("  我们一起  "), [5, 6])
+    
+    reader = G2PLineCache(db_path=db_path, version="v")
+    assert reader.get("我们一起") == [5, 6]
+    assert reader.stats()["disk_hits"] == 1
+    
+    other = G2PLineCache(db_path=db_path, version="w")
+    assert other.get("我们一起") is None
+    for cache in (writer, reader, other):
+        cache.close()
+
+
+def test_frontend_version_tracks_sources(tmp_path):
+    """测试前端源码或词典内容变化时版本串随之变化，无关文件不影响"""
+    (tmp_path / "g2p_generation.py").write_text("a = 1\n", encoding="utf-8")
+    (tmp_path / "polydict.json").write_text("{}", encoding="utf-8")
+    (tmp_path / "model.onnx").write_bytes(b"0")
+    version = frontend_version([tmp_path])
+    assert "jieba=" in version and "espeak=" in version
+    
+    (tmp_path / "model.onnx").write_bytes(b"1")
+    assert frontend_version([tmp_path]) == version
+    
+    source = tmp_path / "polydict.json"
+    source.write_text('{"x": 1}', encoding="utf-8")
+    stat = source.stat()
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert frontend_version([tmp_path]) != version
+
+
+def test_tokenizer_keys_on_normalized_line_but_runs_g2p_on_original():
+    """测试规范化后的行只作缓存键：G2P 用原文计算，等价的行命中同一条缓存"""
+    inference_utils = pytest.importorskip("backend.utils.inference_utils")
+    tokenizer = inference_utils.CNENTokenizer.__new__(inference_utils.CNENTokenizer)
+    seen = []
+
+    def g2p(text):
+        seen.append(text)
+        return None, [len(text)]
+
+    tokenizer.tokenizer = g2p
+    tokenizer.batch_tokenizer = lambda texts, njobs=1: [g2p(text) for text in texts]
+    tokenizer.espeak_njobs = 1
+    tokenizer.cache = G2PLineCache()
+
+    assert tokenizer.encode(" 我们 ") == [5]
+    assert tokenizer.encode("我们") == [5]
+    assert seen == [" 我们 "]
+    # NFD 与 NFC 形式的同一行只做一次 G2P
+    assert tokenizer.encode_many(["cafe\u0301 ", "caf\u00e9", "b"]) == [[7], [7], [2]]
+    assert seen == [" 我们 ", "cafe\u0301 ", "b"]
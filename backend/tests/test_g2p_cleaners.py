@@ -0,0 +1,80 @@
+"""
+语言清洗函数测试 - 预编译的正则与替换表和逐条替换的原实现逐字节一致
+"""
+import random
+import re
+
+import pytest
+
+
+def reference_special_map(special_map, text):
+    """原实现：每条规则反复 re.sub 直到不再匹配"""
+    for regex, replacement in special_map:
+        regex = regex.replace("|", "\\|")
+        while re.search(r"(^|[_|]){}([_|]|$)".format(regex), text):
+            text = re.sub(r"(^|[_|]){}([_|]|$)".format(regex), r"\1{}\2".format(replacement), text)
+    return text
+
+
+def reference_expand_abbreviations(abbreviations, text):
+    for regex, replacement in abbreviations:
+        text = re.sub(regex, replacement, text)
+    return text
+
+
+def reference_text_normalize(module, text, symbols):
+    """原实现的 french/german text_normalize（french 另有缩写展开）"""
+    if hasattr(module, "expand_abbreviations"):
+        text = module.expand_abbreviations(text)
+    pattern = re.compile("|".join(re.escape(p) for p in module.rep_map.keys()))
+    text = pattern.sub(lambda x: module.rep_map[x.group()], text)
+    for symbol, replacement in symbols:
+        text = text.replace(symbol, replacement)
+    text = re.sub(r"[\<\>\(\)\[\]\"\«\»]+", "", text)
+    text = re.sub(r"^[,.!?]+", "", text)
+    text = re.sub(re.compile(r"\s+"), " ", text).strip()
+    text = re.sub(r"([^\.,!\?\-…])$", r"\1", text)
+    return text
+
+
+def random_lines(pieces, count, rng, max_pieces=12):
+    return ["".join(rng.choice(pieces) for _ in range(rng.randint(1, max_pieces))) for _ in range(count)]
+
+
+def test_special_map():
+    """测试由音素、规则两侧与分隔符随机拼接的音素串"""
+    pytest.importorskip("inflect")
+    pytest.importorskip("unidecode")
+    from g2p.g2p import english
+
+    phones = sorted({p for rule in english._special_map for side in rule for p in side.split("|")})
+    pieces = phones + [key for key, _ in english._special_map] + ["|", "_", "|", "ə", "ɹ", "s", "oː"]
+    for text in random_lines(pieces, 5000, random.Random(0)):
+        assert english.special_map(text) == reference_special_map(english._special_map, text), text
+
+
+def test_english_abbreviations():
+    pytest.importorskip("inflect")
+    pytest.importorskip("unidecode")
+    from g2p.g2p import english
+
+    words = [regex.pattern[2:-2] for regex, _ in english._abbreviations]
+    pieces = words + [w.upper() for w in words] + [w.title() for w in words] + list(" .,'-s") + ["ſt", "dr's"]
+    for text in random_lines(pieces, 5000, random.Random(0)):
+        expected = reference_expand_abbreviations(english._abbreviations, text)
+        assert english.expand_abbreviations(text) == expected, text
+
+
+@pytest.mark.parametrize(
+    "language, symbols",
+    [
+        ("french", [(";", ","), ("-", " "), (":", ","), ("&", " et ")]),
+        ("german", [(";", ","), ("-", " "), (":", ",")]),
+    ],
+)
+def test_text_normalize(language, symbols):
+    module = getattr(__import__("g2p.g2p", fromlist=[language]), language)
+    pieces = list(module.rep_map) + [s for s, _ in symbols] + list("<>()[]\"«» \t\n,.!?ab") + ["Mme.", "M. "]
+    for text in random_lines(pieces, 5000, random.Random(0)):
+        assert module.text_normalize(text) == reference_text_normalize(module, text, symbols), text
+
@@ -0,0 +1,35 @@
+"""
+中英分段测试 - 正则分段与逐字符分类的原实现结果一致
+"""
+import random
+
+from g2p.utils.script_segment import get_segment, is_alphabet, is_chinese
+
+
+def reference_segment(text):
+    """原实现：逐字符分类，其他字符并入前一段，开头的其他字符并入第一段"""
+    segments = []
+    temp_seg, temp_lang = "", ""
+    for i, ch in enumerate(text):
+        lang = "zh" if is_chinese(ch) else "en" if is_alphabet(ch) else "other"
+        if i == 0 or temp_lang == "other":
+            temp_seg += ch
+            temp_lang = lang
+        elif lang == temp_lang or lang == "other":
+            temp_seg += ch
+        else:
+            segments.append((temp_seg, temp_lang))
+            temp_seg, temp_lang = ch, lang
+    segments.append((temp_seg, temp_lang))
+    return segments
+
+
+def test_matches_reference():
+    """测试空串、只有其他字符的串，以及中英文与标点、数字、假名等随机混排"""
+    pieces = ["你", "好", "龥", "一", "a", "Z", "hello", " ", "，", ",", "1", "\n", "の", "é", "Ｚ", "[", "`"]
+    rng = random.Random(0)
+    lines = ["", " ", "，。", "123"] + [
+        "".join(rng.choice(pieces) for _ in range(rng.randint(1, 20))) for _ in range(5000)
+    ]
+    for text in lines:
+        assert get_segment(text) == reference_segment(text), text
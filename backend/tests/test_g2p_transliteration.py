@@ -0,0 +1,70 @@
+"""
+普通话 IPA 转写测试 - 单遍编译转写与逐条 re.sub 的原实现逐字节一致
+"""
+import itertools
+import random
+import re
+
+import pytest
+
+pytest.importorskip("jieba")
+pytest.importorskip("cn2an")
+pytest.importorskip("pypinyin")
+
+from g2p.g2p import mandarin
+
+
+def reference_to_ipa(text):
+    """原实现：latin_to_bopomofo、bopomofo_to_ipa 逐条替换，之后再做五遍正则"""
+    text = mandarin.latin_to_bopomofo(text)
+    text = mandarin.bopomofo_to_ipa(text)
+    text = re.sub("([sɹ]`[⁼ʰ]?)([→↓↑ ]+|$)", r"\1ɹ\2", text)
+    text = re.sub("([s][⁼ʰ]?)([→↓↑ ]+|$)", r"\1ɹ\2", text)
+    text = re.sub(r"^\||[^\w\s_,\.\?!;:\'…\|→↓↑⁼ʰ`]", "", text)
+    text = re.sub(r"([,\.\?!;:\'…])", r"|\1|", text)
+    text = re.sub(r"\|+", "|", text)
+    return text.rstrip("|")
+
+
+def compiled_to_ipa(text):
+    return mandarin._finish_ipa(mandarin.latin_bopomofo_to_ipa(text))
+
+
+def inventory():
+    """规则中出现的全部注音符号与声调、大小写字母、IGNORECASE 额外匹配的字符，以及后处理相关的符号"""
+    symbols = {c for regex, _ in mandarin._bopomofo_to_ipa for c in regex.pattern}
+    letters = {regex.pattern for regex, _ in mandarin._latin_to_bopomofo}
+    letters |= {c.upper() for c in letters} | set("İıſK")
+    return sorted(symbols | letters | set("|`sɹ⁼ʰ→↓↑ _,.?!'…x中1"))
+
+
+def syllables():
+    with open(mandarin.os.path.join(mandarin.resource_path, "sources", "pinyin_2_bpmf.txt"), encoding="utf-8") as f:
+        finals = [line.strip().split("\t")[1] for line in f if line.strip()]
+    return [bopomofo + tone for bopomofo in finals for tone in "ˉˊˇˋ˙"]
+
+
+def test_all_strings_up_to_two_symbols():
+    """测试字符表上所有长度不超过 2 的串"""
+    chars = inventory()
+    for n in (1, 2):
+        for text in map("".join, itertools.product(chars, repeat=n)):
+            assert compiled_to_ipa(text) == reference_to_ipa(text), text
+
+
+def test_every_syllable_and_tone():
+    """测试每个注音音节与每个声调，单独以及与字母、前一音节相连"""
+    chars = inventory()
+    rng = random.Random(0)
+    for syllable in syllables():
+        for text in (syllable, "ㄨ" + syllable, syllable + rng.choice(chars), "|" + syllable + "|ㄧ"):
+            assert compiled_to_ipa(text) == reference_to_ipa(text), text
+
+
+def test_random_lines():
+    """测试随机拼接的音节、字母与标点"""
+    pieces = inventory() + syllables()
+    rng = random.Random(0)
+    for _ in range(3000):
+        text = "".join(rng.choice(pieces) for _ in range(rng.randint(1, 16)))
+        assert compiled_to_ipa(text) == reference_to_ipa(text), text
@@ -0,0 +1,86 @@
+"""
+语种分段测试 - 批量语种识别、结果缓存与多线程并发
+"""
+import random
+import threading
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("py3langid")
+
+from g2p.language_segmentation import LangSegment
+
+FILTERS = ["en", "zh", "ja", "ko", "fr", "de"]
+PIECES = [
+    "你好", "世界", "，", "。", "！", "？", "hello ", "World", "iPhone 15", "こんにちは", "佐々木", "오빠",
+    "「", "」", "“", "”", "(", ")", "bonjour ", "123", " ", "\n", "夜空中最亮的星", "Let's sing together, ",
+    "<ja>佐々木</ja>", "<number>123</number>", "Guten Tag ", "の", "…",
+]
+
+
+def segmenter(cache_size=1024):
+    segment = LangSegment()
+    segment.setfilters(FILTERS)
+    segment.cacheSize = cache_size
+    return segment
+
+
+def texts(count, seed=0):
+    rng = random.Random(seed)
+    return ["".join(rng.choice(PIECES) for _ in range(rng.randint(1, 12))) for _ in range(count)]
+
+
+def segments(result):
+    return [(d["lang"], d["text"]) for d in result]
+
+
+def test_batch_classify_matches_classify():
+    """测试批量打分与 langid.classify 逐条结果一致"""
+    segment = segmenter()
+    spans = ["hello world", "你好世界", "こんにちは", "bonjour", "", "Guten Tag", "오빠"]
+    expected = [segment._lang_score(*segment.langid.classify(t)) for t in spans]
+    assert segment._lang_classify_many(spans) == expected
+
+
+def test_cache_returns_copies():
+    """测试命中缓存时结果不变，且调用方修改结果不影响缓存"""
+    segment = segmenter()
+    text = "我爱你 I love you"
+    first = segment.getTexts(text)
+    first[0]["text"] = "changed"
+    fresh = segmenter(cache_size=0)
+    assert segments(segment.getTexts(text)) == segments(fresh.getTexts(text))
+    assert segment.getCounts() == fresh.getCounts()
+
+
+
+def test_cache_key_is_normalized():
+    """测试只在 NFC/NFD 形式和首尾空白上不同的文本命中同一条缓存"""
+    segment = segmenter()
+    segment.getTexts("café 你好")
+    segment.getTexts(" cafe\u0301 你好\n")
+    assert len(segment._results) == 1
+
+
+def test_concurrent_get_texts():
+    """测试多线程共用一个实例（缓存很小，反复淘汰）时与单线程结果相同"""
+    lines = texts(300)
+    reference = segmenter(cache_size=0)
+    expected = {line: segments(reference.getTexts(line)) for line in lines}
+    shared = segmenter(cache_size=16)
+    errors = []
+
+    def work(seed):
+        rng = random.Random(seed)
+        for _ in range(300):
+            line = rng.choice(lines)
+            if segments(shared.getTexts(line)) != expected[line]:
+                errors.append(line)
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
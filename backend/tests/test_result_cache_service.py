@@ -0,0 +1,95 @@
+"""
+结果缓存服务测试
+"""
+import asyncio
+import struct
+from pathlib import Path
+
+import pytest
+from backend.services.result_cache_service import ResultCacheService
+
+
+@pytest.fixture
+def result_cache(tmp_path):
+    return ResultCacheService(tmp_path)
+
+
+def make_key(seed=42, steps=32, n_candidates=1, config=None):
+    return ResultCacheService.make_key(
+        lyric_tokens=[1, 2, 3],
+        style_embedding=struct.pack("512f", *([1.0] * 512)),
+        seed=seed,
+        steps=steps,
+        cfg_strength=2.0,
+        solver="euler",
+        duration=120,
+        n_candidates=n_candidates,
+        config=config or {"kv_cache_dtype": None, "attention_backend": "sdpa", "eos_early_exit_from": 0},
+    )
+
+
+def test_make_key_depends_on_inputs():
+    """测试缓存键随输入变化"""
+    assert make_key() == make_key()
+    assert make_key() != make_key(seed=43)
+    assert make_key() != make_key(steps=16)
+    assert make_key() != make_key(n_candidates=2)
+    assert make_key() != make_key(config={"kv_cache_dtype": "fp8", "attention_backend": "sdpa", "eos_early_exit_from": 0})
+    assert make_key() != make_key(config={"kv_cache_dtype": None, "attention_backend": "flex", "eos_early_exit_from": 0})
+
+
+def test_put_and_get(result_cache, tmp_path):
+    """测试命中返回缓存自有的文件，不受输出目录中同名文件被覆盖影响，缓存文件删除后失效"""
+    output_path = tmp_path / "generated.mp3"
+    output_path.write_bytes(b"first")
+    key = make_key()
+    assert result_cache.get(key) is None
+    
+    result_cache.put(key, {"success": True, "output_path": str(output_path), "song_name": "generated"})
+    output_path.write_bytes(b"second")  # 之后同名的请求覆盖了输出文件
+    cached = result_cache.get(key)
+    assert cached["output_path"] == str(tmp_path / "results" / f"{key}.mp3")
+    assert cached["song_name"] == "generated"
+    assert Path(cached["output_path"]).read_bytes() == b"first"
+    
+    output_path.unlink()
+    assert result_cache.get(key) is not None
+    Path(cached["output_path"]).unlink()
+    assert result_cache.get(key) is None
+
+
+def test_get_requires_every_candidate(result_cache, tmp_path):
+    """测试多候选结果逐个复制，任一缓存文件缺失时整条失效"""
+    output_paths = [tmp_path / "song_1.mp3", tmp_path / "song_2.mp3"]
+    for i, path in enumerate(output_paths):
+        path.write_bytes(b"mp3 %d" % i)
+    key = make_key(n_candidates=2)
+    result_cache.put(key, {
+        "success": True,
+        "output_path": str(output_paths[0]),
+        "output_paths": [str(path) for path in output_paths],
+    })
+    cached_paths = [Path(path) for path in result_cache.get(key)["output_paths"]]
+    assert [path.read_bytes() for path in cached_paths] == [b"mp3 0", b"mp3 1"]
+
+    cached_paths[1].unlink()
+    assert result_cache.get(key) is None
+    assert not cached_paths[0].exists()
+
+
+def test_run_once_coalesces_concurrent_calls(result_cache):
+    """测试相同 key 的并发调用只执行一次"""
+    calls = 0
+    
+    async def generate():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"success": True, "output_path": "song.mp3"}
+    
+    async def submit_identical():
+        return await asyncio.gather(*(result_cache.run_once("key", generate) for _ in range(3)))
+    
+    results = asyncio.run(submit_identical())
+    assert calls == 1
+    assert all(result == results[0] for result in results)
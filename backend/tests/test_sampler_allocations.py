@@ -0,0 +1,83 @@
+"""
+采样器分配测试 - 统计 sample_block_cache 每个采样步在 DiT 之外新分配的张量数
+"""
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("torchdiffeq")
+
+from torch.utils._python_dispatch import TorchDispatchMode
+from torch.utils._pytree import tree_flatten
+
+from backend.diffrhythm2.backbones.dit import DiT
+from backend.diffrhythm2.cfm import CFM
+
+
+class AllocationCounter(TorchDispatchMode):
+    """统计输出不与任何输入共享存储的算子调用（即新分配的张量）"""
+
+    def __init__(self):
+        super().__init__()
+        self.enabled = True
+        self.count = 0
+
+    def __torch_dispatch__(self, func, types, args=(), kwargs=None):
+        kwargs = kwargs or {}
+        out = func(*args, **kwargs)
+        if self.enabled:
+            inputs = {
+                t.untyped_storage().data_ptr()
+                for t in tree_flatten((args, kwargs))[0] if isinstance(t, torch.Tensor)
+            }
+            self.count += sum(
+                1 for t in tree_flatten(out)[0]
+                if isinstance(t, torch.Tensor) and t.numel() > 0 and t.untyped_storage().data_ptr() not in inputs
+            )
+        return out
+
+
+class FixedVelocityStep:
+    """DiT 单步后端：返回常数速度场，计算本身不计入统计"""
+
+    def __init__(self, counter):
+        self.counter = counter
+
+    def __call__(self, x, time, attn_mask, position_ids, style_prompt, past_key_value):
+        self.counter.enabled = False
+        try:
+            return torch.full_like(x, 0.1)
+        finally:
+            self.counter.enabled = True
+
+    def commit(self, x, time, attn_mask, position_ids, style_prompt, past_key_value):
+        pass
+
+
+def count_allocations(steps, num_blocks=2):
+    torch.manual_seed(0)
+    transformer = DiT(dim=32, depth=1, heads=2, mel_dim=8, text_num_embeds=16)
+    model = CFM(transformer, num_channels=8, block_size=4).eval()
+    counter = AllocationCounter()
+    model.step_backend = FixedVelocityStep(counter)
+    text = torch.randint(1, 16, (1, 3))
+    style_prompt = torch.randn(1, 512)
+    with torch.inference_mode(), counter:
+        model.sample_block_cache(
+            text=text,
+            duration=num_blocks * model.block_size,
+            style_prompt=style_prompt,
+            steps=steps,
+            cfg_strength=2.0,
+            seed=0,
+            process_bar=False,
+        )
+    return counter.count
+
+
+def test_sampling_step_allocates_nothing():
+    """测试采样步数增加时 DiT 之外的分配数不变（每步零分配）"""
+    num_blocks = 2
+    few, many = count_allocations(4, num_blocks), count_allocations(12, num_blocks)
+    per_step = (many - few) / ((12 - 4) * num_blocks)
+    assert per_step == 0, f"{per_step} tensor allocations per sampling step"
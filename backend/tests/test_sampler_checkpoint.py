@@ -0,0 +1,174 @@
+"""
+采样检查点测试 - 检查点读写往返，以及从检查点恢复的采样与不中断的采样结果一致
+"""
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("torchdiffeq")
+
+from backend.diffrhythm2.backbones.attention_dispatch import set_attention_backend
+from backend.diffrhythm2.backbones.dit import DiT
+from backend.diffrhythm2.cfm import CFM
+from backend.diffrhythm2.step_control import AdaptiveStepController
+from backend.utils.sampler_checkpoint import CHECKPOINT_VERSION, SamplerCheckpointer, load_checkpoint
+
+
+class Interrupted(Exception):
+    pass
+
+
+class ScriptedStep:
+    """DiT 单步后端：把每个候选每块推向给定的目标帧（euler 步结束时正好到达）"""
+
+    def __init__(self, block_size, targets):
+        self.block_size = block_size
+        self.targets = targets  # targets[candidate][block]
+
+    def __call__(self, x, time, attn_mask, position_ids, style_prompt, past_key_value):
+        block = int(position_ids[0, 0]) // self.block_size
+        target = torch.tensor([row[block] for row in self.targets], dtype=x.dtype)[:, None, None]
+        return (target - x) / (1 - time[:, :1, None])
+
+    def commit(self, x, time, attn_mask, position_ids, style_prompt, past_key_value):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def sdpa_attention():
+    set_attention_backend("sdpa")
+
+
+def tiny_model(seed=0):
+    torch.manual_seed(seed)
+    transformer = DiT(dim=32, depth=2, heads=2, mel_dim=8, text_num_embeds=16)
+    return CFM(transformer, num_channels=8, block_size=4).eval()
+
+
+def sample_with_crash(model, checkpointer, crash_after, **kwargs):
+    """采样到第 crash_after 块后模拟进程崩溃，返回磁盘上的检查点"""
+    def block_callback(bid, *state):
+        checkpointer(bid, *state)
+        if bid == crash_after:
+            raise Interrupted
+    with pytest.raises(Interrupted):
+        model.sample_block_cache(block_callback=block_callback, process_bar=False, **kwargs)
+    checkpointer.close()
+    return load_checkpoint(checkpointer.path)
+
+
+def test_checkpoint_round_trip(tmp_path):
+    """测试检查点按 every_blocks 写盘，读回的内容与写入时一致"""
+    text = torch.randint(1, 16, (1, 3))
+    style_prompt = torch.randn(1, 512)
+    checkpointer = SamplerCheckpointer(
+        tmp_path / "task.pt", {"text": text, "style_prompt": style_prompt, "steps": 8}, every_blocks=2
+    )
+    stream = torch.randn(2, 8, 8)
+    end_pos = torch.tensor([3, -1])
+    checkpointer(0, stream[:, :4], [11, 12, 13], end_pos)
+    assert not (tmp_path / "task.pt").exists()  # 第 1 块不写盘
+    checkpointer(1, stream, [11, 12, 13], end_pos)
+    end_pos[1] = 5  # 写盘用的是拷贝
+    checkpointer.close()
+    state = load_checkpoint(tmp_path / "task.pt")
+    assert state["version"] == CHECKPOINT_VERSION
+    assert state["num_blocks_done"] == 2
+    assert state["block_seeds"] == [11, 12, 13]
+    assert state["steps"] == 8
+    assert torch.equal(state["clean_emb_stream"], stream)
+    assert torch.equal(state["end_pos"], torch.tensor([3, -1]))
+    assert state["step_controller"] is None
+    assert torch.equal(state["text"], text) and torch.equal(state["style_prompt"], style_prompt)
+
+    checkpointer = SamplerCheckpointer(tmp_path / "task.pt", {})
+    checkpointer.close(remove=True)
+    assert load_checkpoint(tmp_path / "task.pt") is None
+
+
+def test_resume_matches_uninterrupted_run(tmp_path):
+    """测试中途崩溃后从检查点恢复（一次前向重建 KV cache）得到与不中断相同的 latent"""
+    model = tiny_model()
+    text = torch.randint(1, 16, (1, 3))
+    style_prompt = torch.randn(1, 512)
+    kwargs = dict(text=text, duration=5 * model.block_size, style_prompt=style_prompt, steps=4, cfg_strength=2.0)
+    with torch.inference_mode():
+        expected, expected_lengths = model.sample_block_cache(
+            seed=7, process_bar=False, return_lengths=True, **kwargs
+        )
+        state = sample_with_crash(
+            model, SamplerCheckpointer(tmp_path / "task.pt", {}, every_blocks=1), 2, seed=7, **kwargs
+        )
+        assert state["num_blocks_done"] == 3
+        resumed, lengths = model.resume_sampling(
+            clean_emb_stream=state["clean_emb_stream"],
+            block_seeds=state["block_seeds"],
+            end_pos=state["end_pos"],
+            process_bar=False,
+            return_lengths=True,
+            **kwargs,
+        )
+    assert torch.equal(lengths, expected_lengths)
+    torch.testing.assert_close(resumed, expected, atol=1e-5, rtol=1e-5)
+
+
+def test_resume_keeps_ended_candidates(tmp_path):
+    """测试已结束的候选在恢复后不会被之后的块延长（end_pos 随检查点保存）"""
+    model = tiny_model()
+    # 候选 0 在第 1 块整块是 EOS（全 1）帧，之后的块又不是；候选 1 一直不结束
+    model.step_backend = ScriptedStep(model.block_size, [[0.5, 1.0, 0.5, 0.5], [0.5, 0.5, 0.5, 0.5]])
+    text = torch.randint(1, 16, (1, 3))
+    style_prompt = torch.randn(1, 512)
+    kwargs = dict(text=text, duration=4 * model.block_size, style_prompt=style_prompt, steps=4, cfg_strength=0.0)
+    with torch.inference_mode():
+        expected, expected_lengths = model.sample_block_cache(
+            seed=7, n_candidates=2, process_bar=False, return_lengths=True, **kwargs
+        )
+        assert expected_lengths.tolist() == [model.block_size - 1, 4 * model.block_size]
+        state = sample_with_crash(
+            model, SamplerCheckpointer(tmp_path / "task.pt", {}, every_blocks=1), 2, seed=7, n_candidates=2, **kwargs
+        )
+        resumed, lengths = model.resume_sampling(
+            clean_emb_stream=state["clean_emb_stream"],
+            block_seeds=state["block_seeds"],
+            end_pos=state["end_pos"],
+            process_bar=False,
+            return_lengths=True,
+            **kwargs,
+        )
+    assert torch.equal(lengths, expected_lengths)
+    torch.testing.assert_close(resumed, expected)
+
+
+@pytest.mark.parametrize("solver", ["euler", "midpoint"])
+def test_resume_keeps_sampling_settings(tmp_path, solver):
+    """测试恢复后剩余块沿用中断前的求解器、CFG 截止时间和自适应步数的预算记账"""
+    model = tiny_model()
+    text = torch.randint(1, 16, (1, 3))
+    style_prompt = torch.randn(1, 512)
+    kwargs = dict(
+        text=text, duration=6 * model.block_size, style_prompt=style_prompt, steps=4, cfg_strength=2.0,
+        solver=solver, cfg_cutoff=0.5,
+    )
+    with torch.inference_mode():
+        controller = AdaptiveStepController(nfe_per_block=3, tol=1e-3) if solver == "euler" else None
+        expected = model.sample_block_cache(seed=7, process_bar=False, step_controller=controller, **kwargs)
+        interrupted = AdaptiveStepController(nfe_per_block=3, tol=1e-3) if controller is not None else None
+        checkpointer = SamplerCheckpointer(tmp_path / "task.pt", {}, every_blocks=1, step_controller=interrupted)
+        state = sample_with_crash(model, checkpointer, 2, seed=7, step_controller=interrupted, **kwargs)
+        resumed_controller = None
+        if controller is not None:
+            resumed_controller = AdaptiveStepController(nfe_per_block=3, tol=1e-3)
+            resumed_controller.load_state_dict(state["step_controller"])
+            assert resumed_controller.nfe_used > 0
+        resumed = model.resume_sampling(
+            clean_emb_stream=state["clean_emb_stream"],
+            block_seeds=state["block_seeds"],
+            end_pos=state["end_pos"],
+            process_bar=False,
+            step_controller=resumed_controller,
+            **kwargs,
+        )
+    torch.testing.assert_close(resumed, expected, atol=1e-5, rtol=1e-5)
+    if controller is not None:
+        assert resumed_controller.stats() == controller.stats()
@@ -0,0 +1,16 @@
+"""
+自适应步数测试 - 每块的 Euler 步数不少于 min_steps
+"""
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from backend.diffrhythm2.step_control import AdaptiveStepController
+
+
+def test_smooth_block_still_takes_min_steps():
+    """测试误差估计为 0（步长一直增大）的块也至少走 min_steps 步"""
+    controller = AdaptiveStepController(nfe_per_block=4, min_steps=4)
+    x = controller.integrate(lambda t, x: torch.ones_like(x), torch.zeros(1, 2), 0, 2)
+    assert controller.block_steps[0] == 4
+    torch.testing.assert_close(x, torch.ones(1, 2))
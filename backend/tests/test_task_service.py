@@ -0,0 +1,132 @@
+"""
+任务服务测试
+"""
+import asyncio
+import json
+import sys
+import types
+
+import pytest
+from backend.services.task_service import TaskService, Task, TaskStatus
+
+
+@pytest.fixture
+def task_service(tmp_path):
+    return TaskService(state_dir=tmp_path / "tasks")
+
+
+def test_save_and_clear_task_state(task_service):
+    """测试生成任务的持久化状态"""
+    task = Task("task-1", "generate", {"song_name": "demo", "lyrics": "[00:01.00]hello"})
+    task_service.save_task_state(task)
+    assert (task_service.state_dir / "task-1.json").exists()
+    
+    task_service.clear_task_state("task-1")
+    assert not (task_service.state_dir / "task-1.json").exists()
+
+
+def test_non_resumable_task_not_persisted(task_service):
+    """测试非生成任务不会持久化"""
+    task_service.save_task_state(Task("task-2", "download", {}))
+    assert not (task_service.state_dir / "task-2.json").exists()
+
+
+def fake_inference_module(monkeypatch, service):
+    module = types.ModuleType("backend.services.inference_service")
+    module.get_inference_service = lambda base_dir=None: service
+    monkeypatch.setitem(sys.modules, "backend.services.inference_service", module)
+
+
+def run_recovery(task_service):
+    async def recover():
+        recovered = task_service.recover_tasks()
+        await asyncio.gather(*list(task_service.running_tasks.values()))
+        return recovered
+    return asyncio.run(recover())
+
+
+def test_recover_tasks_resumes_from_checkpoint(task_service, monkeypatch, tmp_path):
+    """测试重启后恢复的生成任务沿用原 task_id，能找到并读到中断前写下的采样检查点"""
+    torch = pytest.importorskip("torch")
+    from backend.utils.sampler_checkpoint import SamplerCheckpointer, checkpoint_path, load_checkpoint
+    
+    cache_dir = tmp_path / "cache"
+    checkpointer = SamplerCheckpointer(
+        checkpoint_path(cache_dir, "task-4"),
+        {"text": torch.tensor([[1, 2, 3]]), "style_prompt": torch.ones(1, 512), "steps": 32},
+        every_blocks=2,
+    )
+    for block in range(3):
+        checkpointer(block, torch.randn(1, (block + 1) * 10, 64), [5, 6, 7, 8], torch.tensor([-1]))
+    checkpointer.close()
+    params = {"song_name": "demo", "lyrics": "[00:01.00]hello", "seed": 3}
+    task_service.save_task_state(Task("task-4", "generate", params))
+    
+    resumed = []
+    
+    class FakeInferenceService:
+        async def inference(self, task_id=None, progress_callback=None, draft_callback=None, **kwargs):
+            state = load_checkpoint(checkpoint_path(cache_dir, task_id))
+            resumed.append((task_id, kwargs["seed"], state["num_blocks_done"], state["clean_emb_stream"].shape))
+            return {"success": True, "output_path": "demo.mp3"}
+    
+    fake_inference_module(monkeypatch, FakeInferenceService())
+    assert run_recovery(task_service) == ["task-4"]
+    assert resumed == [("task-4", 3, 2, (1, 20, 64))]
+    assert task_service.tasks["task-4"].status == TaskStatus.COMPLETED
+    assert not (task_service.state_dir / "task-4.json").exists()
+
+
+def test_reroll_task_runs_but_is_not_persisted(task_service, monkeypatch):
+    """测试重新生成任务经由 create_task 执行，但不持久化（源任务的采样记录重启后不存在）"""
+    calls = []
+    
+    class FakeInferenceService:
+        async def reroll(self, progress_callback=None, task_id=None, **params):
+            calls.append((task_id, params))
+            return {"success": True, "output_path": "song_reroll_b2.mp3"}
+    
+    fake_inference_module(monkeypatch, FakeInferenceService())
+    
+    params = {"source_task_id": "task-1", "from_block": 2, "from_seconds": None, "seed": 7,
+              "sample_steps": None, "lyrics": None, "song_name": None}
+    
+    async def run():
+        task_id = task_service.create_task("reroll", params)
+        assert not (task_service.state_dir / f"{task_id}.json").exists()
+        await asyncio.gather(*list(task_service.running_tasks.values()))
+        return task_id
+    
+    task_id = asyncio.run(run())
+    assert calls == [(task_id, params)]
+    assert task_service.tasks[task_id].status == TaskStatus.COMPLETED
+
+
+def test_recover_drops_non_resumable_state(task_service):
+    """测试旧版本留下的 reroll 持久化状态在恢复时被丢弃，不会重新执行"""
+    task_service.state_dir.mkdir(parents=True)
+    state_path = task_service.state_dir / "reroll-1.json"
+    state_path.write_text(
+        json.dumps({"id": "reroll-1", "type": "reroll", "params": {"source_task_id": "task-1"}}), encoding="utf-8"
+    )
+    assert task_service.recover_tasks() == []
+    assert "reroll-1" not in task_service.tasks
+    assert not state_path.exists()
+
+
+def test_recover_tasks_without_state(task_service):
+    """测试没有持久化状态时不恢复任何任务"""
+    assert task_service.recover_tasks() == []
+
+
+def test_set_partial_result_only_while_running(task_service):
+    """测试草稿等中间结果只在任务运行中发布"""
+    task = Task("task-3", "generate", {})
+    task_service.tasks[task.id] = task
+    task_service.set_partial_result(task.id, {"draft": True})
+    assert task.result is None
+    
+    task.status = TaskStatus.RUNNING
+    task_service.set_partial_result(task.id, {"draft": True}, "Draft ready, refining...")
+    assert task.result == {"draft": True}
+    assert task.message == "Draft ready, refining..."
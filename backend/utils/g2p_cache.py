@@ -0,0 +1,187 @@
+"""
+G2P 行缓存 - 以规范化后的歌词行为键缓存 CNENTokenizer.encode 的结果
+
+一行歌词的 G2P 要经过语种切分、jieba、多音字 BERT 和 espeak，而副歌在一首歌内、
+不同歌之间都会大量重复。内存层是线程安全的 LRU；可选的 SQLite 层落盘，
+多个 worker 进程共享同一个数据库文件（WAL 模式）。
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from importlib import metadata
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+from backend.utils.path_utils import file_digest
+
+logger = logging.getLogger(__name__)
+
+# 缓存格式或键的组成变化时递增，使两层缓存中的旧结果失效；
+# 前端源码、词典与依赖版本的变化由 frontend_version 自动体现在版本串里
+G2P_CACHE_VERSION = 2
+
+# 影响 G2P 结果的第三方依赖
+G2P_FRONTEND_PACKAGES = (
+    "jieba", "pypinyin", "cn2an", "phonemizer", "py3langid", "inflect", "unidecode", "transformers", "onnxruntime",
+)
+# 前端目录中参与版本哈希的文件（源码与词典）
+G2P_FRONTEND_SUFFIXES = (".py", ".json", ".txt")
+
+
+def package_versions(packages: Iterable[str] = G2P_FRONTEND_PACKAGES) -> str:
+    """已安装依赖的版本，未安装的记为 none"""
+    versions = []
+    for name in packages:
+        try:
+            version = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            version = "none"
+        versions.append(f"{name}={version}")
+    return ",".join(versions)
+
+
+def espeak_version() -> str:
+    """espeak 的版本（英文等语言的音素来自系统的 espeak-ng），不可用时为 none"""
+    try:
+        from phonemizer.backend import EspeakBackend
+
+        return ".".join(str(part) for part in EspeakBackend.version())
+    except Exception:
+        return "none"
+
+
+def frontend_version(sources: Iterable[Union[str, Path]]) -> str:
+    """
+    G2P 前端的版本串：前端源码与词典的内容哈希 + 依赖与 espeak 的版本
+    sources: 前端文件或目录（目录下取 G2P_FRONTEND_SUFFIXES 的文件）
+    """
+    files = []
+    for source in sources:
+        source = Path(source)
+        if source.is_dir():
+            files += [
+                f for f in source.rglob("*")
+                if f.suffix in G2P_FRONTEND_SUFFIXES and "__pycache__" not in f.parts
+            ]
+        elif source.exists():
+            files.append(source)
+    digests = "".join(f"{f.name}:{file_digest(f)}\n" for f in sorted(set(files)))
+    source_hash = hashlib.sha256(digests.encode("utf-8")).hexdigest()[:16]
+    return f"src={source_hash};{package_versions()};espeak={espeak_version()}"
+
+
+def normalize_line(text: str) -> str:
+    """
+    缓存键使用的行文本：NFC 规范化并去掉首尾空白。只用于缓存键，G2P 仍以原文计算；
+    仅在规范化上不同的行共享一条缓存，取第一次计算时的结果
+    """
+    return unicodedata.normalize("NFC", text).strip()
+
+
+class G2PLineCache:
+    """两级 G2P 行缓存：内存 LRU + 可选的 SQLite"""
+
+    def __init__(self, max_size: int = 4096, db_path: Optional[Union[str, Path]] = None, version: str = ""):
+        """
+        max_size: 内存层最多保留的行数，0 表示不使用内存层
+        db_path: SQLite 文件路径，None 表示只用内存层
+        version: 附加到 G2P_CACHE_VERSION 的版本信息（词表哈希与 frontend_version）
+        """
+        self.max_size = max_size
+        self.version = f"{G2P_CACHE_VERSION}:{version}"
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        if db_path is not None:
+            try:
+                Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+                self._db = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS g2p_lines (key TEXT PRIMARY KEY, tokens TEXT NOT NULL)"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"G2P line cache database {db_path} unavailable, using memory only: {e}")
+                self._db = None
+
+    def _key(self, line: str) -> str:
+        return hashlib.sha256(f"{self.version}\0{line}".encode("utf-8")).hexdigest()
+
+    def get(self, line: str) -> Optional[List[int]]:
+        """返回缓存的 token 列表（调用方可自由修改），未命中返回 None"""
+        key = self._key(line)
+        with self._lock:
+            tokens = self._entries.get(key)
+            if tokens is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(tokens)
+            if self._db is not None:
+                try:
+                    row = self._db.execute("SELECT tokens FROM g2p_lines WHERE key = ?", (key,)).fetchone()
+                except sqlite3.Error as e:
+                    logger.warning(f"G2P line cache read failed: {e}")
+                    row = None
+                if row is not None:
+                    tokens = tuple(json.loads(row[0]))
+                    self._remember(key, tokens)
+                    self.disk_hits += 1
+                    return list(tokens)
+            self.misses += 1
+            return None
+
+    def put(self, line: str, tokens: Sequence[int]):
+        key = self._key(line)
+        tokens = tuple(tokens)
+        with self._lock:
+            self._remember(key, tokens)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO g2p_lines (key, tokens) VALUES (?, ?)",
+                        (key, json.dumps(tokens)),
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"G2P line cache write failed: {e}")
+
+    def _remember(self, key: str, tokens: tuple):
+        if self.max_size <= 0:
+            return
+        self._entries[key] = tokens
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """清空内存层并重置统计（不删除 SQLite 中的记录）"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "persistent": self._db is not None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
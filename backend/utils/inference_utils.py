@@ -4,19 +4,25 @@
 import os
 import re
 import json
+import hashlib
 import random
 import numpy as np
 import torch
 import torchaudio
 import pedalboard
 from pathlib import Path
-from typing import Optional, Tuple, Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple, Callable, List, Union
 from huggingface_hub import hf_hub_download
 
 from muq import MuQMuLan
 from backend.diffrhythm2.cfm import CFM
+from backend.diffrhythm2.sampling_state import SamplingRecord
+from backend.diffrhythm2.step_control import AdaptiveStepController
 from backend.diffrhythm2.backbones.dit import DiT
 from backend.bigvgan.model import Generator
+from backend.utils.g2p_cache import G2PLineCache, frontend_version, normalize_line
+from backend.utils.path_utils import file_digest
 
 # 结构标记信息
 STRUCT_INFO = {
@@ -37,33 +43,123 @@ STRUCT_INFO = {
 
 STRUCT_PATTERN = re.compile(r'^\[.*?\]$')
 
+# 声码器分块解码参数（冻结图按 DECODE_CHUNK_SIZE 做形状特化）
+DECODE_CHUNK_SIZE = 20
+DECODE_OVERLAP = 5
+# 每个 latent 帧对应的采样点数（声码器的下采样倍率）
+SAMPLES_PER_LATENT = 9600
+
 
 class CNENTokenizer:
-    """中英文分词器"""
-    def __init__(self, vocab_path: Optional[Path] = None):
+    """中英文分词器
+
+    cache_size / cache_db: 行级 G2P 缓存（见 g2p_cache），cache_size 为 0 且没有
+        cache_db 时不缓存；缓存版本包含词表内容的哈希和前端版本（源码、词典与依赖版本）。
+    espeak_njobs: encode_many 批量调用 espeak 时的并行进程数。
+    """
+    def __init__(
+        self,
+        vocab_path: Optional[Path] = None,
+        cache_size: int = 4096,
+        cache_db: Optional[Path] = None,
+        espeak_njobs: int = 1,
+    ):
         if vocab_path is None:
             # 从项目根目录查找 vocab.json
             project_root = Path(__file__).parent.parent.parent
             vocab_path = project_root / "backend" / "g2p" / "g2p" / "vocab.json"
         
-        with open(vocab_path, 'r') as file:
-            self.phone2id: dict = json.load(file)['vocab']
+        with open(vocab_path, 'rb') as file:
+            vocab_bytes = file.read()
+        self.phone2id: dict = json.loads(vocab_bytes)['vocab']
         self.id2phone = {v: k for (k, v) in self.phone2id.items()}
         
-        from backend.g2p.g2p_generation import chn_eng_g2p
+        import g2p
+        from backend.g2p import g2p_generation
+        from backend.g2p.g2p_generation import chn_eng_g2p, chn_eng_g2p_many
         self.tokenizer = chn_eng_g2p
+        self.batch_tokenizer = chn_eng_g2p_many
+        self.espeak_njobs = max(int(espeak_njobs), 1)
+        
+        self.cache = None
+        if cache_size > 0 or cache_db is not None:
+            vocab_hash = hashlib.sha256(vocab_bytes).hexdigest()[:16]
+            frontend = frontend_version([g2p_generation.__file__, Path(g2p.__file__).parent])
+            self.cache = G2PLineCache(
+                max_size=cache_size,
+                db_path=cache_db,
+                version=f"{vocab_hash}:{frontend}",
+            )
     
     def encode(self, text):
+        if self.cache is None:
+            return self._encode(text)
+        key = normalize_line(text)
+        token = self.cache.get(key)
+        if token is None:
+            token = self._encode(text)
+            self.cache.put(key, token)
+        return token
+    
+    def encode_many(self, texts: List[str]) -> List[List[int]]:
+        """批量编码多行：缓存未命中的行一起做 G2P，同语种的 espeak 片段只调用一次后端"""
+        # 规范化后的行只作缓存键，G2P 用原文计算
+        keys = [normalize_line(text) for text in texts] if self.cache is not None else texts
+        tokens: List[Optional[List[int]]] = [None] * len(texts)
+        missing = {}
+        for i, key in enumerate(keys):
+            if self.cache is not None and key not in missing:
+                tokens[i] = self.cache.get(key)
+            if tokens[i] is None:
+                missing.setdefault(key, []).append(i)
+        if missing:
+            lines = [texts[indices[0]] for indices in missing.values()]
+            for key, (phone, token) in zip(missing, self.batch_tokenizer(lines, njobs=self.espeak_njobs)):
+                token = [x + 1 for x in token]
+                if self.cache is not None:
+                    self.cache.put(key, token)
+                for i in missing[key]:
+                    tokens[i] = list(token)
+        return tokens
+    
+    def _encode(self, text):
         phone, token = self.tokenizer(text)
         token = [x + 1 for x in token]
         return token
     
+    def warm_up(self, languages: Tuple[str, ...] = ("zh", "en"), background: bool = True):
+        """提前初始化 g2p 前端（各语言后端在第一次使用时才加载），默认在后台线程中进行"""
+        from backend.g2p.g2p_generation import warm_up
+        return warm_up(languages=languages, background=background)
+    
+    def cache_stats(self) -> Optional[dict]:
+        """行缓存命中统计，未启用缓存时返回 None"""
+        return self.cache.stats() if self.cache is not None else None
+    
     def decode(self, token):
         return "|".join([self.id2phone[x - 1] for x in token])
 
 
-def prepare_models(repo_id: str, ckpt_dir: Path, device: torch.device) -> Tuple:
-    """准备所有模型（diffrhythm2, mulan, tokenizer, decoder）"""
+def prepare_models(
+    repo_id: str,
+    ckpt_dir: Path,
+    device: torch.device,
+    num_history_block: Optional[int] = None,
+    kv_cache_dtype: Optional[str] = None,
+    eos_early_exit_from: Optional[float] = None,
+    g2p_cache_size: int = 4096,
+    g2p_cache_db: Optional[Path] = None,
+    espeak_njobs: int = 1,
+) -> Tuple:
+    """准备所有模型（diffrhythm2, mulan, tokenizer, decoder）
+
+    num_history_block: 采样时只保留最近的若干个历史块（文本前缀始终保留），
+        使每个块的 KV 显存和注意力开销恒定；None 或 <= 0 表示保留全部历史。
+    kv_cache_dtype: 文本/历史 KV cache 的量化存储格式（"int8"、"fp8"），None 表示不量化。
+    eos_early_exit_from: 从该 t 起检查 x1 估计，整块都是结束帧时跳过剩余步数；None 或 <= 0 关闭。
+    g2p_cache_size / g2p_cache_db: 歌词行 G2P 缓存的内存行数与 SQLite 文件（None 表示不落盘）。
+    espeak_njobs: 整份歌词批量音素化时 espeak 的并行进程数。
+    """
     # 下载并加载 DiffRhythm2 模型
     diffrhythm2_ckpt_path = hf_hub_download(
         repo_id=repo_id,
@@ -86,6 +182,9 @@ def prepare_models(repo_id: str, ckpt_dir: Path, device: torch.device) -> Tuple:
         transformer=DiT(**model_config),
         num_channels=model_config['mel_dim'],
         block_size=model_config['block_size'],
+        num_history_block=num_history_block,
+        kv_cache_dtype=kv_cache_dtype,
+        eos_early_exit_from=eos_early_exit_from if eos_early_exit_from and eos_early_exit_from > 0 else None,
     )
     
     diffrhythm2 = diffrhythm2.to(device)
@@ -95,12 +194,14 @@ def prepare_models(repo_id: str, ckpt_dir: Path, device: torch.device) -> Tuple:
     else:
         ckpt = torch.load(diffrhythm2_ckpt_path, map_location='cpu')
     diffrhythm2.load_state_dict(ckpt)
+    # 导出的 ONNX 单步图按权重文件的哈希缓存（见 prepare_dit_step_backend）
+    diffrhythm2.ckpt_path = diffrhythm2_ckpt_path
     
     # 加载 Mulan
     mulan = MuQMuLan.from_pretrained("OpenMuQ/MuQ-MuLan-large", cache_dir=str(ckpt_dir)).to(device)
     
     # 加载分词器
-    lrc_tokenizer = CNENTokenizer()
+    lrc_tokenizer = CNENTokenizer(cache_size=g2p_cache_size, cache_db=g2p_cache_db, espeak_njobs=espeak_njobs)
     
     # 加载解码器
     decoder_ckpt_path = hf_hub_download(
@@ -121,11 +222,113 @@ def prepare_models(repo_id: str, ckpt_dir: Path, device: torch.device) -> Tuple:
     return diffrhythm2, mulan, lrc_tokenizer, decoder
 
 
-def parse_lyrics(lyrics: str, tokenizer: CNENTokenizer) -> list:
-    """解析歌词"""
+def prepare_vocoder_graph(
+    decoder: Generator,
+    cache_dir: Path,
+    chunk_size: int = DECODE_CHUNK_SIZE,
+    quantized: bool = False,
+    max_stft_distance: Optional[float] = None,
+) -> str:
+    """加载或导出声码器的冻结 TorchScript 图，decode_audio 会自动使用；返回使用的图（"int8" 或 "torchscript"）
+
+    图按设备、精度和分块大小特化，缓存到 cache_dir 中，服务重启后直接加载；
+    文件名和图中都带有 decoder 权重文件的哈希，更换权重后不会加载旧图。
+    quantized=True 时优先加载通过质量门控的 int8 图（仅 CPU FP32），否则回退到浮点图。
+    """
+    param = next(decoder.decoder.parameters())
+    checkpoint_id = file_digest(decoder.ckpt_path)
+    if quantized and param.device.type == "cpu" and param.dtype == torch.float32:
+        from backend.utils.vocoder_quant import DEFAULT_MAX_STFT_DISTANCE, load_int8_vocoder
+        if load_int8_vocoder(
+            decoder,
+            cache_dir,
+            chunk_size=chunk_size,
+            max_stft_distance=max_stft_distance or DEFAULT_MAX_STFT_DISTANCE,
+        ):
+            return "int8"
+    dtype_name = str(param.dtype).replace("torch.", "")
+    graph_path = Path(cache_dir) / (
+        f"bigvgan_frozen_{param.device.type}_{dtype_name}_c{chunk_size}_{checkpoint_id}.pt"
+    )
+    if graph_path.exists() and decoder.load_frozen(graph_path, chunk_size=chunk_size, checkpoint_id=checkpoint_id):
+        return "torchscript"
+    decoder.freeze(chunk_size=chunk_size, save_path=graph_path, checkpoint_id=checkpoint_id)
+    return "torchscript"
+
+
+def load_compile_cache(cache_dir: Path):
+    """让 torch.compile 的编译产物持久化到 cache_dir，并加载上次保存的产物"""
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", str(cache_dir / "inductor"))
+    import torch._inductor.config
+    torch._inductor.config.fx_graph_cache = True
+    
+    artifacts_path = cache_dir / "compile_artifacts.bin"
+    if artifacts_path.exists() and hasattr(torch.compiler, "load_cache_artifacts"):
+        torch.compiler.load_cache_artifacts(artifacts_path.read_bytes())
+
+
+def save_compile_cache(cache_dir: Path):
+    """保存当前进程中 torch.compile 的编译产物，供服务重启后复用"""
+    if not hasattr(torch.compiler, "save_cache_artifacts"):
+        return
+    artifacts = torch.compiler.save_cache_artifacts()
+    if artifacts is not None:
+        artifact_bytes, _ = artifacts
+        (Path(cache_dir) / "compile_artifacts.bin").write_bytes(artifact_bytes)
+
+
+def _checkpoint_id(model: CFM) -> str:
+    """模型权重的短哈希：有权重文件时对文件取哈希，否则（例如基准测试中的随机模型）对 state_dict 取哈希"""
+    ckpt_path = getattr(model, "ckpt_path", None)
+    if ckpt_path is not None:
+        return file_digest(ckpt_path)
+    digest = hashlib.sha256()
+    for name, tensor in model.state_dict().items():
+        digest.update(name.encode("utf-8"))
+        digest.update(tensor.detach().float().cpu().numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+def prepare_dit_step_backend(model: CFM, cache_dir: Path, backend: str = "torch") -> str:
+    """为 CFM 选择单步 DiT 推理后端（torch / compiled / onnxruntime），返回实际使用的后端
+
+    compiled 后端按 KV 长度分桶编译，编译产物保存在 cache_dir/torch_compile 中；
+    onnxruntime 后端仅支持 CPU FP32，首次使用时导出 ONNX 图并缓存到 cache_dir，
+    文件名包含导出格式版本和 DiT 权重的哈希，权重或导出代码变化后会重新导出。
+    """
+    model.step_backend = None
+    if backend == "compiled":
+        from backend.diffrhythm2.step_backends import CompiledDiTStep
+        compile_dir = Path(cache_dir) / "torch_compile"
+        load_compile_cache(compile_dir)
+        model.step_backend = CompiledDiTStep(
+            model.transformer, on_compile=lambda: save_compile_cache(compile_dir)
+        )
+        return "compiled"
+    if backend != "onnxruntime":
+        return "torch"
+    param = next(model.transformer.parameters())
+    if param.device.type != "cpu" or param.dtype != torch.float32:
+        raise ValueError("onnxruntime DiT backend requires a CPU FP32 model")
+    
+    from backend.diffrhythm2.step_backends import DIT_STEP_EXPORT_VERSION, OnnxDiTStep, export_dit_step
+    onnx_path = Path(cache_dir) / (
+        f"dit_step_v{DIT_STEP_EXPORT_VERSION}_b{model.block_size}_{_checkpoint_id(model)}.onnx"
+    )
+    if not onnx_path.exists():
+        onnx_path.parent.mkdir(parents=True, exist_ok=True)
+        export_dit_step(model.transformer, onnx_path, block_size=model.block_size)
+    model.step_backend = OnnxDiTStep(onnx_path)
+    return "onnxruntime"
+
+
+def split_lyrics(lyrics: str) -> Tuple[list, List[str]]:
+    """拆分歌词：结构标记直接转为 token，歌词行在返回的列表中以 None 占位，按顺序交给 fill_lyrics"""
     lyrics_with_time = []
     lyrics_lines = lyrics.split("\n")
-    get_start = False
+    text_lines = []
     
     for line in lyrics_lines:
         line = line.strip()
@@ -135,15 +338,24 @@ def parse_lyrics(lyrics: str, tokenizer: CNENTokenizer) -> list:
         if struct_flag:
             struct_idx = STRUCT_INFO.get(line.lower(), None)
             if struct_idx is not None:
-                if struct_idx == STRUCT_INFO['[start]']:
-                    get_start = True
                 lyrics_with_time.append([struct_idx, STRUCT_INFO['[stop]']])
             else:
                 continue
         else:
-            tokens = tokenizer.encode(line.strip())
-            tokens = tokens + [STRUCT_INFO['[stop]']]
-            lyrics_with_time.append(tokens)
+            text_lines.append(line)
+            lyrics_with_time.append(None)
+    
+    return lyrics_with_time, text_lines
+
+
+def fill_lyrics(lyrics_with_time: list, encoded: List[List[int]]) -> list:
+    """把各歌词行的 token 填回占位，并在没有 [start] 时补上"""
+    get_start = [STRUCT_INFO['[start]'], STRUCT_INFO['[stop]']] in lyrics_with_time
+    encoded = iter(encoded)
+    lyrics_with_time = [
+        next(encoded) + [STRUCT_INFO['[stop]']] if tokens is None else tokens
+        for tokens in lyrics_with_time
+    ]
     
     if len(lyrics_with_time) != 0 and not get_start:
         lyrics_with_time = [[STRUCT_INFO['[start]'], STRUCT_INFO['[stop]']]] + lyrics_with_time
@@ -151,6 +363,13 @@ def parse_lyrics(lyrics: str, tokenizer: CNENTokenizer) -> list:
     return lyrics_with_time
 
 
+def parse_lyrics(lyrics: str, tokenizer: CNENTokenizer) -> list:
+    """解析歌词（整份歌词的歌词行一起做 G2P，同语种的 espeak 片段合并为一次调用）"""
+    lyrics_with_time, text_lines = split_lyrics(lyrics)
+    encoded = tokenizer.encode_many(text_lines) if text_lines else []
+    return fill_lyrics(lyrics_with_time, encoded)
+
+
 def make_fake_stereo(audio: np.ndarray, sampling_rate: int) -> np.ndarray:
     """创建伪立体声"""
     left_channel = audio
@@ -166,19 +385,41 @@ def make_fake_stereo(audio: np.ndarray, sampling_rate: int) -> np.ndarray:
 def run_inference(
     model: CFM,
     decoder: Generator,
-    text: torch.Tensor,
-    style_prompt: torch.Tensor,
+    text: Optional[torch.Tensor],
+    style_prompt: Optional[torch.Tensor],
     duration: float,
     output_path: Path,
     cfg_strength: float = 2.0,
     sample_steps: int = 32,
     fake_stereo: bool = True,
     cancel_check: Optional[Callable[[], bool]] = None,
-) -> Path:
+    latent_save_path: Optional[Path] = None,
+    seed: Optional[int] = None,
+    record_callback: Optional[Callable[[SamplingRecord], None]] = None,
+    resume_from: Optional[Tuple[SamplingRecord, int]] = None,
+    block_callback: Optional[Callable] = None,
+    resume_checkpoint: Optional[dict] = None,
+    n_candidates: int = 1,
+    solver: Optional[str] = None,
+    cfg_cutoff: float = 1.0,
+    step_controller: Optional[AdaptiveStepController] = None,
+) -> Union[Path, List[Path]]:
     """执行推理生成音频
     
     Args:
         cancel_check: 可选的取消检查函数，如果返回 True，则中断推理
+        latent_save_path: 可选，保存声码器输入 latent，用作 int8 声码器的校准数据
+        seed: 可选，逐块噪声的随机种子
+        record_callback: 可选，接收采样记录（各块边界的快照），用于之后从某块重新生成
+        resume_from: 可选，(采样记录, 起始块)，保留之前的块，只重新生成之后的部分；
+            此时 text / style_prompt 为 None 表示沿用记录中的歌词和风格
+        block_callback: 可选，每生成完一个块调用一次，用于写采样检查点
+        resume_checkpoint: 可选，采样检查点（见 sampler_checkpoint），从中断处继续生成
+        n_candidates: 同一歌词和风格一次生成的候选数，共享歌词前缀的 KV cache，作为一个 batch
+            采样和声码；大于 1 时返回各候选的输出路径列表（{stem}_1{suffix}, {stem}_2{suffix} ...）
+        solver: 可选，覆盖 ODE 求解器（草稿模式用更便宜的求解器）
+        cfg_cutoff: 只在 t <= cfg_cutoff 时计算无条件分支做 CFG，小于 1 可省去后段一半的 DiT 计算
+        step_controller: 可选，逐块自适应步数（见 step_control），采样后可从中读取各块步数
     """
     with torch.inference_mode():
         # 在开始推理前检查取消状态
@@ -187,34 +428,103 @@ def run_inference(
         
         # 启用进度条以在 stdout 显示进度
         print(f"Starting inference: {int(duration * 5)} blocks, {sample_steps} steps", flush=True)
-        latent = model.sample_block_cache(
-            text=text.unsqueeze(0),
-            duration=int(duration * 5),
-            style_prompt=style_prompt.unsqueeze(0),
-            steps=sample_steps,
-            cfg_strength=cfg_strength,
-            process_bar=True,  # 启用进度条
-        )
+        record = None
+        if resume_from is not None:
+            record, start_block = resume_from
+            latent, lengths, record = model.resample_from_block(
+                record,
+                start_block,
+                text=None if text is None else text.unsqueeze(0),
+                style_prompt=None if style_prompt is None else style_prompt.unsqueeze(0),
+                duration=int(duration * 5),
+                steps=sample_steps,
+                cfg_strength=cfg_strength,
+                seed=seed,
+                process_bar=True,
+                return_lengths=True,
+            )
+        elif resume_checkpoint is not None:
+            print(f"Resuming from block {resume_checkpoint['num_blocks_done']}", flush=True)
+            latent, lengths = model.resume_sampling(
+                text=text.unsqueeze(0),
+                duration=int(duration * 5),
+                style_prompt=style_prompt.unsqueeze(0),
+                clean_emb_stream=resume_checkpoint["clean_emb_stream"],
+                block_seeds=resume_checkpoint["block_seeds"],
+                steps=sample_steps,
+                cfg_strength=cfg_strength,
+                process_bar=True,
+                block_callback=block_callback,
+                return_lengths=True,
+                step_controller=step_controller,
+                end_pos=resume_checkpoint["end_pos"],
+                solver=solver,
+                cfg_cutoff=cfg_cutoff,
+            )
+        else:
+            outputs = model.sample_block_cache(
+                text=text.unsqueeze(0),
+                duration=int(duration * 5),
+                style_prompt=style_prompt.unsqueeze(0),
+                steps=sample_steps,
+                cfg_strength=cfg_strength,
+                seed=seed,
+                process_bar=True,  # 启用进度条
+                return_record=record_callback is not None,
+                block_callback=block_callback,
+                n_candidates=n_candidates,
+                return_lengths=True,
+                solver=solver,
+                cfg_cutoff=cfg_cutoff,
+                step_controller=step_controller,
+            )
+            latent, lengths = outputs[:2]
+            if record_callback is not None:
+                record = outputs[2]
+        if record_callback is not None and record is not None:
+            record_callback(record)
         print("Inference completed, decoding audio...", flush=True)
         
         # 在解码前再次检查取消状态
         if cancel_check and cancel_check():
             raise RuntimeError("Inference cancelled")
         latent = latent.transpose(1, 2)
+        if latent_save_path is not None:
+            Path(latent_save_path).parent.mkdir(parents=True, exist_ok=True)
+            torch.save(latent.float().cpu(), latent_save_path)
         print("Decoding audio...", flush=True)
-        audio = decoder.decode_audio(latent, overlap=5, chunk_size=20)
-        
-        num_channels = 1
-        audio = audio.float().cpu().numpy().squeeze()[None, :]
-        if fake_stereo:
-            print("Creating fake stereo...", flush=True)
-            audio = make_fake_stereo(audio, decoder.h.sampling_rate)
-            num_channels = 2
-        
-        print(f"Saving audio to {output_path}...", flush=True)
-        with pedalboard.io.AudioFile(str(output_path), "w", decoder.h.sampling_rate, num_channels) as f:
-            f.write(audio)
-        print(f"Audio saved successfully: {output_path}", flush=True)
-    
+        # 所有候选一次声码，各自再裁到自己的结束帧
+        audio = decoder.decode_audio(latent, overlap=DECODE_OVERLAP, chunk_size=DECODE_CHUNK_SIZE)
+        audio = audio.float().cpu().numpy()
+        clips = [audio[i, 0, :int(length) * SAMPLES_PER_LATENT] for i, length in enumerate(lengths)]
+
+        if len(clips) == 1:
+            return _save_audio(clips[0], output_path, decoder.h.sampling_rate, fake_stereo)
+
+    output_path = Path(output_path)
+    output_paths = [
+        output_path.with_name(f"{output_path.stem}_{i + 1}{output_path.suffix}") for i in range(len(clips))
+    ]
+    # 编码和写盘不依赖 GPU，各候选并行
+    with ThreadPoolExecutor(max_workers=len(clips)) as executor:
+        return list(executor.map(
+            lambda item: _save_audio(item[0], item[1], decoder.h.sampling_rate, fake_stereo),
+            zip(clips, output_paths),
+        ))
+
+
+def _save_audio(audio: np.ndarray, output_path: Path, sampling_rate: int, fake_stereo: bool) -> Path:
+    """保存单声道波形，可选伪立体声"""
+    num_channels = 1
+    audio = audio[None, :]
+    if fake_stereo:
+        print("Creating fake stereo...", flush=True)
+        audio = make_fake_stereo(audio, sampling_rate)
+        num_channels = 2
+
+    print(f"Saving audio to {output_path}...", flush=True)
+    with pedalboard.io.AudioFile(str(output_path), "w", sampling_rate, num_channels) as f:
+        f.write(audio)
+    print(f"Audio saved successfully: {output_path}", flush=True)
     return output_path
 
@@ -1,6 +1,8 @@
 """
 路径工具函数 - 统一管理项目路径
 """
+import hashlib
+from functools import lru_cache
 from pathlib import Path
 
 
@@ -15,3 +17,18 @@ def get_debug_log_path() -> Path:
     project_root = get_project_root()
     return project_root / ".cursor" / "debug.log"
 
+
+
+@lru_cache(maxsize=None)
+def _file_digest(path: str, size: int, mtime_ns: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def file_digest(path: Path) -> str:
+    """文件内容的短 sha256，用于标识缓存的导出图对应的模型权重（同一进程内按大小和修改时间复用）"""
+    stat = Path(path).stat()
+    return _file_digest(str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns)
@@ -0,0 +1,93 @@
+"""
+采样检查点 - 周期性保存逐块采样状态，进程崩溃或重启后从最后一个检查点继续生成
+
+检查点只包含重建采样器所需的最少状态：已生成的 clean latent、逐块随机种子、
+各候选的结束位置、歌词 token 和风格向量（KV cache 由 CFM.rebuild_caches 一次前向重建），
+以及剩余块必须沿用的采样设置（求解器、CFG 截止时间、自适应步数的预算记账）。
+写盘在后台线程完成，采样线程只负责把很小的 latent 拷贝到 CPU。
+"""
+import logging
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# 检查点内容变化时递增（2: 增加 end_pos；3: 增加 solver、cfg_cutoff 和 step_controller），
+# 旧版本的检查点被忽略
+CHECKPOINT_VERSION = 3
+
+
+def checkpoint_path(cache_dir: Path, task_id: str) -> Path:
+    return Path(cache_dir) / "checkpoints" / f"{task_id}.pt"
+
+
+def load_checkpoint(path: Path) -> Optional[Dict[str, Any]]:
+    """读取检查点，不存在或损坏时返回 None"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        state = torch.load(path, map_location="cpu")
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable checkpoint {path}: {e}")
+        return None
+    if state.get("version") != CHECKPOINT_VERSION:
+        logger.warning(f"Ignoring checkpoint {path} with version {state.get('version')}")
+        return None
+    return state
+
+
+class SamplerCheckpointer:
+    """作为 CFM 的 block_callback，每 every_blocks 个块异步写一次检查点
+
+    step_controller: 可选，采样用的 AdaptiveStepController，其预算记账随每个检查点保存
+    """
+
+    def __init__(self, path: Path, meta: Dict[str, Any], every_blocks: int = 4, step_controller=None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 歌词 token、风格向量、采样参数等不随块变化的状态
+        self.meta = {key: value.detach().cpu() if torch.is_tensor(value) else value for key, value in meta.items()}
+        self.every_blocks = max(int(every_blocks), 1)
+        self.step_controller = step_controller
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sampler-checkpoint")
+        self._pending: Optional[Future] = None
+
+    def __call__(self, block: int, clean_emb_stream: torch.Tensor, block_seeds: List[int], end_pos: torch.Tensor):
+        if (block + 1) % self.every_blocks != 0:
+            return
+        state = dict(self.meta)
+        state.update({
+            "version": CHECKPOINT_VERSION,
+            "num_blocks_done": block + 1,
+            "clean_emb_stream": clean_emb_stream.detach().to("cpu", copy=True),
+            "block_seeds": list(block_seeds),
+            # 已结束候选的结束帧（-1 表示未结束），恢复后不再被之后的块延长
+            "end_pos": end_pos.detach().to("cpu", copy=True),
+            # 已用的 NFE 和各块步数，恢复后剩余块按原预算继续分配
+            "step_controller": self.step_controller.state_dict() if self.step_controller is not None else None,
+        })
+        # 上一次写盘通常早已完成，等待它保证检查点按顺序落盘
+        if self._pending is not None:
+            self._pending.result()
+        self._pending = self._executor.submit(self._write, state)
+
+    def _write(self, state: Dict[str, Any]):
+        tmp_path = self.path.with_suffix(".tmp")
+        try:
+            torch.save(state, tmp_path)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"Failed to write checkpoint {self.path}: {e}")
+
+    def close(self, remove: bool = False):
+        """等待未完成的写盘；remove=True 时删除检查点（任务已完成）"""
+        if self._pending is not None:
+            self._pending.result()
+        self._executor.shutdown(wait=True)
+        if remove:
+            self.path.unlink(missing_ok=True)
@@ -14,6 +14,9 @@ class GenerateRequest(BaseModel):
     style_audio_path: Optional[str] = Field(None, description="风格音频文件路径")
     precision: str = Field("fp16", pattern="^(fp32|fp16|int8)$", description="模型精度")
     batch_size: int = Field(1, ge=1, le=8, description="批处理大小")
+    seed: Optional[int] = Field(None, ge=0, le=2**63 - 1, description="随机种子，固定后结果可复现")
+    n_candidates: int = Field(1, ge=1, le=8, description="同一歌词和风格一次生成的候选数")
+    draft: bool = Field(False, description="先快速生成草稿，再后台按完整步数精修并替换")
 
     @validator('lyrics')
     def validate_lyrics(cls, v):
@@ -0,0 +1,201 @@
+"""
+声码器 int8 量化工具 - 用校准 latent 离线构建量化 BigVGAN，并在留出的 latent 上用多分辨率 STFT 距离做质量门控
+
+用法:
+    python -m backend.utils.vocoder_quant --latents Build/cache/vocoder_calib/*.pt
+"""
+import argparse
+import copy
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+import torch
+
+from backend.bigvgan.model import Generator, save_frozen
+from backend.bigvgan.quantize import quantize_bigvgan, multi_resolution_stft_distance
+from backend.utils.inference_utils import DECODE_CHUNK_SIZE
+from backend.utils.path_utils import file_digest
+
+logger = logging.getLogger(__name__)
+
+# 超过该距离即认为量化后音质退化，拒绝启用 int8 模式
+DEFAULT_MAX_STFT_DISTANCE = 0.15
+# 留作质量评估、不参与校准的 latent 比例
+DEFAULT_HOLDOUT_FRACTION = 0.2
+
+
+def int8_vocoder_paths(
+    cache_dir: Path, checkpoint_id: str, chunk_size: int = DECODE_CHUNK_SIZE
+) -> Tuple[Path, Path]:
+    """返回 int8 冻结图和质量报告的路径，按 decoder 权重文件的哈希区分"""
+    graph_path = Path(cache_dir) / f"bigvgan_int8_cpu_c{chunk_size}_{checkpoint_id}.pt"
+    return graph_path, graph_path.with_suffix(".json")
+
+
+def iter_latent_chunks(
+    latents: List[torch.Tensor],
+    in_channels: int,
+    chunk_size: int = DECODE_CHUNK_SIZE,
+) -> Iterator[torch.Tensor]:
+    """把 [C, T] / [B, C, T] / [B, T, C] 的 latent 切成 [1, C, chunk_size] 的解码块"""
+    for latent in latents:
+        if latent.dim() == 2:
+            latent = latent.unsqueeze(0)
+        if latent.shape[1] != in_channels and latent.shape[2] == in_channels:
+            latent = latent.transpose(1, 2)
+        latent = latent.float().cpu()
+        for b in range(latent.shape[0]):
+            for start in range(0, latent.shape[2] - chunk_size + 1, chunk_size):
+                yield latent[b:b + 1, :, start:start + chunk_size]
+
+
+def split_holdout(
+    latents: List[torch.Tensor],
+    in_channels: int,
+    chunk_size: int = DECODE_CHUNK_SIZE,
+    holdout_fraction: float = DEFAULT_HOLDOUT_FRACTION,
+) -> Tuple[List[torch.Tensor], List[torch.Tensor]]:
+    """把解码块分成校准集和留出的评估集
+
+    有多个 latent 时按 latent 整体留出最后若干个（同一首歌相邻的块高度相关）；
+    只有一个 latent 时留出它的最后若干个块。
+    """
+    if len(latents) > 1:
+        num_holdout = min(max(1, round(len(latents) * holdout_fraction)), len(latents) - 1)
+        calibration = list(iter_latent_chunks(latents[:-num_holdout], in_channels, chunk_size))
+        holdout = list(iter_latent_chunks(latents[-num_holdout:], in_channels, chunk_size))
+    else:
+        chunks = list(iter_latent_chunks(latents, in_channels, chunk_size))
+        num_holdout = min(max(1, round(len(chunks) * holdout_fraction)), len(chunks) - 1)
+        calibration, holdout = chunks[:len(chunks) - num_holdout], chunks[len(chunks) - num_holdout:]
+    if not calibration or not holdout:
+        raise ValueError(
+            f"Calibration latents must provide at least two chunks of {chunk_size} frames "
+            "(one to calibrate, one held out for the quality gate)"
+        )
+    return calibration, holdout
+
+
+@torch.no_grad()
+def build_int8_vocoder(
+    decoder: Generator,
+    calibration_latents: List[torch.Tensor],
+    cache_dir: Path,
+    chunk_size: int = DECODE_CHUNK_SIZE,
+    max_stft_distance: float = DEFAULT_MAX_STFT_DISTANCE,
+    holdout_fraction: float = DEFAULT_HOLDOUT_FRACTION,
+) -> Dict:
+    """量化声码器并评估音质，只有通过门控时才保存 int8 冻结图
+
+    质量门控在未参与校准的留出块上计算，避免样本内评估高估音质。
+    无论是否通过，都会写出质量报告，运行时据此决定是否启用 int8 模式。
+    """
+    reference = copy.deepcopy(decoder.decoder).float().cpu().eval()
+    chunks, holdout = split_holdout(calibration_latents, decoder.h.in_channels, chunk_size, holdout_fraction)
+
+    quantized = quantize_bigvgan(reference, chunks)
+
+    def stft_distance(eval_chunks):
+        ref_audio = torch.cat([reference(chunk) for chunk in eval_chunks], dim=-1)
+        int8_audio = torch.cat([quantized(chunk) for chunk in eval_chunks], dim=-1)
+        return multi_resolution_stft_distance(ref_audio, int8_audio)
+
+    distance = stft_distance(holdout)
+    passed = distance <= max_stft_distance
+
+    checkpoint_id = file_digest(decoder.ckpt_path)
+    graph_path, report_path = int8_vocoder_paths(cache_dir, checkpoint_id, chunk_size)
+    graph_path.parent.mkdir(parents=True, exist_ok=True)
+    if passed:
+        frozen = torch.jit.freeze(torch.jit.trace(quantized, chunks[0], check_trace=False))
+        save_frozen(frozen, graph_path, checkpoint_id)
+    elif graph_path.exists():
+        graph_path.unlink()
+
+    report = {
+        "passed": passed,
+        "stft_distance": distance,
+        "calibration_stft_distance": stft_distance(chunks),
+        "max_stft_distance": max_stft_distance,
+        "chunk_size": chunk_size,
+        "calibration_chunks": len(chunks),
+        "holdout_chunks": len(holdout),
+        "checkpoint_id": checkpoint_id,
+        "engine": torch.backends.quantized.engine,
+        "created_at": datetime.now().isoformat(),
+    }
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    if passed:
+        logger.info(f"Int8 vocoder passed quality gate (held-out stft distance {distance:.4f}): {graph_path}")
+    else:
+        logger.warning(
+            f"Int8 vocoder rejected: held-out stft distance {distance:.4f} > {max_stft_distance:.4f}"
+        )
+    return report
+
+
+def load_int8_vocoder(
+    decoder: Generator,
+    cache_dir: Path,
+    chunk_size: int = DECODE_CHUNK_SIZE,
+    max_stft_distance: float = DEFAULT_MAX_STFT_DISTANCE,
+) -> bool:
+    """加载已通过质量门控的 int8 冻结图，未构建（或是用其他权重构建的）、未通过时返回 False"""
+    checkpoint_id = file_digest(decoder.ckpt_path)
+    graph_path, report_path = int8_vocoder_paths(cache_dir, checkpoint_id, chunk_size)
+    if not report_path.exists() or not graph_path.exists():
+        logger.info(
+            "Int8 vocoder not built for this decoder checkpoint, run `python -m backend.utils.vocoder_quant` first"
+        )
+        return False
+
+    with open(report_path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    if not report.get("passed") or report.get("stft_distance", float("inf")) > max_stft_distance:
+        logger.warning(
+            f"Int8 vocoder disabled by quality gate: stft distance "
+            f"{report.get('stft_distance')} > {max_stft_distance}"
+        )
+        return False
+
+    return decoder.load_frozen(graph_path, chunk_size=chunk_size, checkpoint_id=checkpoint_id)
+
+
+def main():
+    build_dir = Path(__file__).parent.parent.parent / "Build"
+    ckpt_dir = build_dir / "models" / "ckpt"
+    parser = argparse.ArgumentParser(description="Build an int8 BigVGAN vocoder with a quality gate")
+    parser.add_argument("--latents", nargs="+", required=True, help="torch.save 保存的校准 latent 文件")
+    parser.add_argument("--config", default=str(ckpt_dir / "decoder.json"))
+    parser.add_argument("--ckpt", default=str(ckpt_dir / "decoder.bin"))
+    parser.add_argument("--cache-dir", default=str(build_dir / "cache"))
+    parser.add_argument("--chunk-size", type=int, default=DECODE_CHUNK_SIZE)
+    parser.add_argument("--max-stft-distance", type=float, default=DEFAULT_MAX_STFT_DISTANCE)
+    parser.add_argument(
+        "--holdout-fraction", type=float, default=DEFAULT_HOLDOUT_FRACTION, help="留作质量评估的 latent 比例"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    decoder = Generator(args.config, args.ckpt)
+    latents = [torch.load(path, map_location="cpu") for path in args.latents]
+    report = build_int8_vocoder(
+        decoder,
+        latents,
+        Path(args.cache_dir),
+        chunk_size=args.chunk_size,
+        max_stft_distance=args.max_stft_distance,
+        holdout_fraction=args.holdout_fraction,
+    )
+    print(json.dumps(report, indent=2))
+    if not report["passed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,24 @@
 # LICENSE file in the root directory of this source tree.
 
 from g2p.g2p import cleaners
-from tokenizers import Tokenizer
-from g2p.g2p.text_tokenizers import TextTokenizer
-from g2p.language_segmentation import LangSegment as LS
 import json
 import re
+import threading
 
-LangSegment = LS()
+# 语种切分器依赖 numpy 和 py3langid，第一次创建 PhonemeBpeTokenizer 时才导入并创建，
+# 只用到 cleaners、french、german 等纯文本函数时不需要这些依赖
+LangSegment = None
+_lang_segment_lock = threading.Lock()
+
+
+def _get_lang_segment():
+    global LangSegment
+    with _lang_segment_lock:
+        if LangSegment is None:
+            from g2p.language_segmentation import LangSegment as LS
+
+            LangSegment = LS()
+    return LangSegment
 
 class PhonemeBpeTokenizer:
     def __init__(self, vacab_path="./f5_tts/g2p/g2p/vocab.json"):
@@ -23,13 +34,14 @@ class PhonemeBpeTokenizer:
             "de": "de",
         }
         self.text_tokenizers = {}
+        self._init_lock = threading.Lock()
         self.int_text_tokenizers()
 
         with open(vacab_path, "r") as f:
             json_data = f.read()
         data = json.loads(json_data)
         self.vocab = data["vocab"]
-        LangSegment.setfilters(["en", "zh", "ja", "ko", "fr", "de"])
+        _get_lang_segment().setfilters(["en", "zh", "ja", "ko", "fr", "de"])
 
     def int_text_tokenizers(self):
         """延迟初始化 text tokenizers，只在需要时创建"""
@@ -49,15 +61,25 @@ class PhonemeBpeTokenizer:
                 self.text_tokenizers[key] = None  # 标记为特殊处理
                 continue
             
-            try:
-                self.text_tokenizers[key] = TextTokenizer(language=value)
-            except RuntimeError as e:
-                # 如果 espeak 不支持该语言，延迟到实际使用时再报错
-                # 先存储语言配置，实际使用时再创建
-                self.text_tokenizers[key] = {"language": value, "error": str(e)}
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f"Failed to initialize TextTokenizer for {key}: {e}. Will retry when needed.")
+            # 占位符，第一次用到该语言（或 warm_up）时才创建 espeak 后端
+            self.text_tokenizers[key] = {"language": value}
+
+    # warm_up 时每种语言跑一遍的样例
+    _warm_up_texts = {
+        "zh": "你好",
+        "en": "hello",
+        "fr": "bonjour",
+        "de": "hallo",
+        "ja": "こんにちは",
+        "ko": "안녕하세요",
+    }
+
+    def warm_up(self, languages=("zh", "en")):
+        """提前完成各语言后端的延迟初始化（espeak、jieba、多音字模型、语种识别模型）"""
+        LangSegment.warm_up()
+        for language in languages:
+            text = self._warm_up_texts[language]
+            self.tokenize(text, text, language)
 
     def tokenize(self, text, sentence, language):
 
@@ -87,6 +109,34 @@ class PhonemeBpeTokenizer:
 
         return phonemes, phoneme_tokens
 
+    def tokenize_many(self, segments, njobs=1):
+        """
+        segments: [(text, sentence, language)] -> [(phonemes, tokens)], the same as calling
+        `tokenize` on each segment, but same-language espeak segments are phonemized together.
+        """
+        flat = []
+        owners = []
+        for index, (text, sentence, language) in enumerate(segments):
+            if language == "auto":
+                parts = [(seg["text"], sentence, seg["lang"]) for seg in LangSegment.getTexts(text)]
+            else:
+                parts = [(text, sentence, language)]
+            flat.extend(parts)
+            owners.append(len(parts))
+
+        for language in {language for _, _, language in flat}:
+            if language in self.text_tokenizers and language not in ["ja", "ko"]:
+                self.text_tokenizers[language] = self._get_text_tokenizer(language)
+        phonemes = cleaners.cjekfd_cleaners_batch(flat, self.text_tokenizers, njobs=njobs)
+
+        results = []
+        start = 0
+        for count, (text, sentence, language) in zip(owners, segments):
+            phoneme = "|_|".join(phonemes[start:start + count]) if language == "auto" else phonemes[start]
+            start += count
+            results.append((phoneme, self.phoneme2token(phoneme)))
+        return results
+
     def _get_text_tokenizer(self, language: str):
         """获取指定语言的 text tokenizer，如果未初始化则延迟初始化"""
         # 日语和韩语使用特殊处理，不需要 TextTokenizer
@@ -104,12 +154,15 @@ class PhonemeBpeTokenizer:
         
         tokenizer = self.text_tokenizers.get(language)
         
-        # 如果是延迟初始化的占位符
+        # 如果是延迟初始化的占位符（warm_up 线程与请求可能同时初始化，加锁）
         if isinstance(tokenizer, dict):
             try:
-                # 尝试初始化
-                tokenizer = TextTokenizer(language=tokenizer["language"])
-                self.text_tokenizers[language] = tokenizer
+                with self._init_lock:
+                    tokenizer = self.text_tokenizers.get(language)
+                    if isinstance(tokenizer, dict):
+                        from g2p.g2p.text_tokenizers import TextTokenizer
+                        tokenizer = TextTokenizer(language=tokenizer["language"])
+                        self.text_tokenizers[language] = tokenizer
             except RuntimeError as e:
                 raise RuntimeError(
                     f"Failed to initialize TextTokenizer for language '{language}': {e}. "
@@ -3,29 +3,63 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import importlib
 import re
-from g2p.g2p.japanese import japanese_to_ipa
-from g2p.g2p.mandarin import chinese_to_ipa
-from g2p.g2p.english import english_to_ipa
-from g2p.g2p.french import french_to_ipa
-from g2p.g2p.korean import korean_to_ipa
-from g2p.g2p.german import german_to_ipa
+
+# language front ends are imported on first use: japanese pulls in pyopenjtalk and
+# mandarin jieba / pypinyin, which most lyric sheets never need all of
+_cleaner_paths = {
+    "zh": ("g2p.g2p.mandarin", "chinese_to_ipa"),
+    "ja": ("g2p.g2p.japanese", "japanese_to_ipa"),
+    "en": ("g2p.g2p.english", "english_to_ipa"),
+    "fr": ("g2p.g2p.french", "french_to_ipa"),
+    "ko": ("g2p.g2p.korean", "korean_to_ipa"),
+    "de": ("g2p.g2p.german", "german_to_ipa"),
+}
+
+
+def get_cleaner(language):
+    module, name = _cleaner_paths[language]
+    return getattr(importlib.import_module(module), name)
 
 
 def cjekfd_cleaners(text, sentence, language, text_tokenizers):
 
     if language == "zh":
-        return chinese_to_ipa(text, sentence, text_tokenizers["zh"])
-    elif language == "ja":
-        return japanese_to_ipa(text, text_tokenizers["ja"])
-    elif language == "en":
-        return english_to_ipa(text, text_tokenizers["en"])
-    elif language == "fr":
-        return french_to_ipa(text, text_tokenizers["fr"])
-    elif language == "ko":
-        return korean_to_ipa(text, text_tokenizers["ko"])
-    elif language == "de":
-        return german_to_ipa(text, text_tokenizers["de"])
+        return get_cleaner("zh")(text, sentence, text_tokenizers["zh"])
+    elif language in _cleaner_paths:
+        return get_cleaner(language)(text, text_tokenizers[language])
     else:
         raise Exception("Unknown language: %s" % language)
         return None
+
+
+# languages phonemized by espeak, whose segments can share one backend call
+_espeak_languages = ("en", "fr", "de")
+
+
+def cjekfd_cleaners_batch(segments, text_tokenizers, njobs=1):
+    """
+    segments: [(text, sentence, language)] -> [phonemes], in order. All segments of one
+    espeak language go through a single backend call; the others are cleaned one by one.
+    """
+    results = [None] * len(segments)
+    groups = {}
+    for i, (text, sentence, language) in enumerate(segments):
+        if language in _espeak_languages:
+            groups.setdefault(language, []).append(i)
+        else:
+            results[i] = cjekfd_cleaners(text, sentence, language, text_tokenizers)
+    for language, indices in groups.items():
+        phonemes = get_cleaner(language)(
+            [segments[i][0] for i in indices], text_tokenizers[language], njobs=njobs
+        )
+        if len(phonemes) != len(indices):
+            # the backend dropped or merged lines, fall back to one call per segment
+            phonemes = [
+                cjekfd_cleaners(segments[i][0], segments[i][1], language, text_tokenizers)
+                for i in indices
+            ]
+        for i, phone in zip(indices, phonemes):
+            results[i] = phone
+    return results
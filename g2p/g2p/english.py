@@ -64,10 +64,26 @@ _special_map = [
 ]
 
 
+# all abbreviations in one scan; replacements contain no abbreviation and "\b" keeps
+# e.g. "dr" from matching inside "drs", so this equals substituting them one by one
+_abbreviations_re = re.compile(
+    "\\b(?:%s)\\b" % "|".join(regex.pattern[2:-2] for regex, _ in _abbreviations),
+    re.IGNORECASE,
+)
+_abbreviations_dict = {regex.pattern[2:-2]: replacement for regex, replacement in _abbreviations}
+
+
+def _expand_abbreviation(m):
+    word = m.group()
+    replacement = _abbreviations_dict.get(word.lower())
+    if replacement is None:
+        # IGNORECASE also matches e.g. "ſt" for "st"
+        replacement = next(r for regex, r in _abbreviations if regex.fullmatch(word))
+    return replacement
+
+
 def expand_abbreviations(text):
-    for regex, replacement in _abbreviations:
-        text = re.sub(regex, replacement, text)
-    return text
+    return _abbreviations_re.sub(_expand_abbreviation, text)
 
 
 def _remove_commas(m):
@@ -172,31 +188,30 @@ def _english_to_ipa(text):
     return text
 
 
-# special map
+# special map: each rule rewrites whole phones, delimited by "_" / "|" or the ends of the
+# string. The delimiters are lookarounds, so adjacent matches need no re-scan, and no rule's
+# output is matched by a later rule, so one scan over all rules equals applying them in order.
+_special_map_re = re.compile(
+    r"(?:^|(?<=[_|]))(?:%s)(?=[_|]|$)" % "|".join(re.escape(regex) for regex, _ in _special_map)
+)
+_special_map_dict = dict(_special_map)
+
+
 def special_map(text):
-    for regex, replacement in _special_map:
-        regex = regex.replace("|", "\|")
-        while re.search(r"(^|[_|]){}([_|]|$)".format(regex), text):
-            text = re.sub(
-                r"(^|[_|]){}([_|]|$)".format(regex), r"\1{}\2".format(replacement), text
-            )
     # text = re.sub(r'([,.!?])', r'|\1', text)
-    return text
+    return _special_map_re.sub(lambda m: _special_map_dict[m.group()], text)
 
 
-# Add some special operation
-def english_to_ipa(text, text_tokenizer):
-    if type(text) == str:
-        text = _english_to_ipa(text)
-    else:
-        text = [_english_to_ipa(t) for t in text]
-    phonemes = text_tokenizer(text)
+def _finish_phonemes(phonemes):
     if phonemes[-1] in "p⁼ʰmftnlkxʃs`ɹaoəɛɪeɑʊŋiuɥwæjː":
         phonemes += "|_"
+    return special_map(phonemes)
+
+
+# Add some special operation
+def english_to_ipa(text, text_tokenizer, njobs=1):
+    """A list of texts is phonemized in one backend call, each item as if passed alone."""
     if type(text) == str:
-        return special_map(phonemes)
-    else:
-        result_ph = []
-        for phone in phonemes:
-            result_ph.append(special_map(phone))
-        return result_ph
+        return _finish_phonemes(text_tokenizer(_english_to_ipa(text)))
+    phonemes = text_tokenizer([_english_to_ipa(t) for t in text], njobs=njobs)
+    return [_finish_phonemes(phone) for phone in phonemes]
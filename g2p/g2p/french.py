@@ -92,18 +92,24 @@ rep_map = {
 }
 
 
+# Regular expression matching whitespace:
+_whitespace_re = re.compile(r"\s+")
+_punctuation_at_begin_re = re.compile(r"^[,.!?]+")
+_aux_symbols_re = re.compile(r"[\<\>\(\)\[\]\"\«\»]+")
+# rep_map in one scan, compiled once
+_punctuation_re = re.compile("|".join(re.escape(p) for p in rep_map.keys()))
+
+
 def collapse_whitespace(text):
-    # Regular expression matching whitespace:
-    _whitespace_re = re.compile(r"\s+")
-    return re.sub(_whitespace_re, " ", text).strip()
+    return _whitespace_re.sub(" ", text).strip()
 
 
 def remove_punctuation_at_begin(text):
-    return re.sub(r"^[,.!?]+", "", text)
+    return _punctuation_at_begin_re.sub("", text)
 
 
 def remove_aux_symbols(text):
-    text = re.sub(r"[\<\>\(\)\[\]\"\«\»]+", "", text)
+    text = _aux_symbols_re.sub("", text)
     return text
 
 
@@ -122,9 +128,7 @@ def expand_abbreviations(text):
 
 
 def replace_punctuation(text):
-    pattern = re.compile("|".join(re.escape(p) for p in rep_map.keys()))
-    replaced_text = pattern.sub(lambda x: rep_map[x.group()], text)
-    return replaced_text
+    return _punctuation_re.sub(lambda x: rep_map[x.group()], text)
 
 
 def text_normalize(text):
@@ -134,11 +138,10 @@ def text_normalize(text):
     text = remove_aux_symbols(text)
     text = remove_punctuation_at_begin(text)
     text = collapse_whitespace(text)
-    text = re.sub(r"([^\.,!\?\-…])$", r"\1", text)
     return text
 
 
-def french_to_ipa(text, text_tokenizer):
+def french_to_ipa(text, text_tokenizer, njobs=1):
     if type(text) == str:
         text = text_normalize(text)
         phonemes = text_tokenizer(text)
@@ -146,4 +149,4 @@ def french_to_ipa(text, text_tokenizer):
     else:
         for i, t in enumerate(text):
             text[i] = text_normalize(t)
-        return text_tokenizer(text)
+        return text_tokenizer(text, njobs=njobs)
@@ -48,12 +48,15 @@ english_dictionary = {
     "Z": "제트",
 }
 
+_cjk_ideographs_re = re.compile(
+    "[⺀-⺙⺛-⻳⼀-⿕々〇〡-〩〸-〺〻㐀-䶵一-鿃豈-鶴侮-頻並-龎]"
+)
+_latin_words_re = re.compile("([A-Za-z]+)")
+
 
 def normalize(text):
     text = text.strip()
-    text = re.sub(
-        "[⺀-⺙⺛-⻳⼀-⿕々〇〡-〩〸-〺〻㐀-䶵一-鿃豈-鶴侮-頻並-龎]", "", text
-    )
+    text = _cjk_ideographs_re.sub("", text)
     text = normalize_english(text)
     text = text.lower()
     return text
@@ -66,7 +69,7 @@ def normalize_english(text):
             return english_dictionary.get(word)
         return word
 
-    text = re.sub("([A-Za-z]+)", fn, text)
+    text = _latin_words_re.sub(fn, text)
     return text
 
 
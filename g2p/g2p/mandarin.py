@@ -4,11 +4,11 @@
 # LICENSE file in the root directory of this source tree.
 
 import re
+import threading
 import jieba
 import cn2an
 from pypinyin import lazy_pinyin, BOPOMOFO
 from typing import List
-from g2p.g2p.chinese_model_g2p import BertPolyPredict
 from g2p.utils.front_utils import *
 import os
 
@@ -64,9 +64,23 @@ if not os.path.exists(jsonr_file_path):
     )
     exit()
 
-g2pw_poly_predict = BertPolyPredict(
-    g2pw_poly_model_path, jsonr_file_path, json_file_path
-)
+# The polyphone model (BERT tokenizer, onnxruntime session, and the torch / transformers
+# imports behind them) and the lexicons are loaded on first use, see warm_up.
+_g2pw_poly_predict = None
+_init_lock = threading.Lock()
+
+
+def get_poly_predictor():
+    global _g2pw_poly_predict
+    if _g2pw_poly_predict is None:
+        with _init_lock:
+            if _g2pw_poly_predict is None:
+                from g2p.g2p.chinese_model_g2p import BertPolyPredict
+
+                _g2pw_poly_predict = BertPolyPredict(
+                    g2pw_poly_model_path, jsonr_file_path, json_file_path
+                )
+    return _g2pw_poly_predict
 
 
 """
@@ -182,24 +196,48 @@ _bopomofo_to_ipa = [
 must_not_er_words = {"女儿", "老儿", "男儿", "少儿", "小儿"}
 
 word_pinyin_dict = {}
-with open(
-    os.path.join(resource_path, "sources", "chinese_lexicon.txt"), "r", encoding="utf-8"
-) as fread:
-    txt_list = fread.readlines()
-    for txt in txt_list:
-        word, pinyin = txt.strip().split("\t")
-        word_pinyin_dict[word] = pinyin
-    fread.close()
-
 pinyin_2_bopomofo_dict = {}
-with open(
-    os.path.join(resource_path, "sources", "pinyin_2_bpmf.txt"), "r", encoding="utf-8"
-) as fread:
-    txt_list = fread.readlines()
-    for txt in txt_list:
-        pinyin, bopomofo = txt.strip().split("\t")
-        pinyin_2_bopomofo_dict[pinyin] = bopomofo
-    fread.close()
+bopomofos2pinyin_dict = {}
+_lexicons_loaded = False
+
+
+def _load_lexicons():
+    """Fills the lexicon dicts in place on first use."""
+    global _lexicons_loaded
+    if _lexicons_loaded:
+        return
+    with _init_lock:
+        if _lexicons_loaded:
+            return
+        with open(
+            os.path.join(resource_path, "sources", "chinese_lexicon.txt"), "r", encoding="utf-8"
+        ) as fread:
+            for txt in fread.readlines():
+                word, pinyin = txt.strip().split("\t")
+                word_pinyin_dict[word] = pinyin
+
+        with open(
+            os.path.join(resource_path, "sources", "pinyin_2_bpmf.txt"), "r", encoding="utf-8"
+        ) as fread:
+            for txt in fread.readlines():
+                pinyin, bopomofo = txt.strip().split("\t")
+                pinyin_2_bopomofo_dict[pinyin] = bopomofo
+
+        with open(
+            os.path.join(resource_path, "sources", "bpmf_2_pinyin.txt"), "r", encoding="utf-8"
+        ) as fread:
+            for txt in fread.readlines():
+                v, k = txt.strip().split("\t")
+                bopomofos2pinyin_dict[k] = v
+        _lexicons_loaded = True
+
+
+def warm_up():
+    """Loads the lexicons, jieba's dictionary and the polyphone model ahead of the first call."""
+    _load_lexicons()
+    jieba.initialize()
+    get_poly_predictor()
+
 
 tone_dict = {
     "0": "˙",
@@ -210,18 +248,9 @@ tone_dict = {
     "4": "ˋ",
 }
 
-bopomofos2pinyin_dict = {}
-with open(
-    os.path.join(resource_path, "sources", "bpmf_2_pinyin.txt"), "r", encoding="utf-8"
-) as fread:
-    txt_list = fread.readlines()
-    for txt in txt_list:
-        v, k = txt.strip().split("\t")
-        bopomofos2pinyin_dict[k] = v
-    fread.close()
-
 
 def bpmf_to_pinyin(text):
+    _load_lexicons()
     bopomofo_list = text.split("|")
     pinyin_list = []
     for info in bopomofo_list:
@@ -478,12 +507,24 @@ def merge_yi(seg: List) -> List:
 # Word Segmentation, and convert Chinese pronunciation to pinyin (bopomofo)
 def chinese_to_bopomofo(text_short, sentence):
     # bopomofos = conv(text_short)
+    _load_lexicons()
     words = jieba.lcut(text_short, cut_all=False)
     words = merge_yi(words)
     words = merge_bu(words)
     words = merge_er(words)
     text = ""
 
+    # all polyphones of the sentence are disambiguated by one model run
+    char_index = 0
+    poly_positions = []
+    for word in words:
+        if not (word in word_pinyin_dict and word not in poly_dict):
+            poly_positions += [char_index + i for i, c in enumerate(word) if c in poly_dict]
+        char_index += len(word)
+    poly_pinyins = dict(
+        zip(poly_positions, get_poly_predictor().predict_positions(text_short, poly_positions))
+    )
+
     char_index = 0
     for word in words:
         bopomofos = []
@@ -505,9 +546,7 @@ def chinese_to_bopomofo(text_short, sentence):
             for i in range(len(word)):
                 c = word[i]
                 if c in poly_dict:
-                    poly_pinyin = g2pw_poly_predict.predict_process(
-                        [text_short, char_index + i]
-                    )[0]
+                    poly_pinyin = poly_pinyins[char_index + i]
                     py = poly_pinyin[2:-1]
                     bopomofos.append(
                         pinyin_2_bopomofo_dict[py[:-1]] + tone_dict[py[-1]]
@@ -567,6 +606,77 @@ def bopomofo_to_ipa(text):
     return text
 
 
+def _compile_transliteration():
+    """
+    Folds latin_to_bopomofo and bopomofo_to_ipa into one alternation regex (longest keys
+    first) and a dispatch table built from the rules themselves. No replacement contains a
+    key of a later rule and no two two-symbol keys overlap, so one leftmost-longest scan
+    equals the sequential passes. The one exception is a letter whose expansion completes a
+    two-symbol key with the symbol before it ("ㄨ" + "a" -> "ㄨㄟˉ" -> "|ueɪ→|"); those
+    pairs get keys of their own.
+    """
+    letters = {regex.pattern: bopomofo for regex, bopomofo in _latin_to_bopomofo}
+    keys = [regex.pattern for regex, _ in _bopomofo_to_ipa]
+    table = {key: bopomofo_to_ipa(key) for key in keys}
+    table.update({letter: bopomofo_to_ipa(bopomofo) for letter, bopomofo in letters.items()})
+    pairs = []
+    for first in sorted({key[0] for key in keys if len(key) == 2}):
+        for letter, bopomofo in letters.items():
+            ipa = bopomofo_to_ipa(first + bopomofo)
+            if ipa != table[first] + table[letter]:
+                table[first + letter] = ipa
+                pairs.append(re.escape(first) + "(?i:%s)" % letter)
+    alternatives = (
+        [re.escape(key) for key in keys if len(key) == 2]
+        + pairs
+        + ["[%s]" % "".join(re.escape(key) for key in keys if len(key) == 1)]
+        + ["(?i:[%s])" % "".join(letters)]
+    )
+    return re.compile("|".join(alternatives)), table
+
+
+_transliteration_re, _transliteration_table = _compile_transliteration()
+# matched character -> rule letter; IGNORECASE also matches e.g. "ſ" (s) and "K" (Kelvin, k)
+_latin_letters = {}
+
+
+def _latin_letter(char):
+    letter = _latin_letters.get(char)
+    if letter is None:
+        letter = next(
+            regex.pattern for regex, _ in _latin_to_bopomofo if regex.fullmatch(char)
+        )
+        _latin_letters[char] = letter
+    return letter
+
+
+def _transliterate(match):
+    key = match.group()
+    ipa = _transliteration_table.get(key)
+    if ipa is None:
+        ipa = _transliteration_table[key[:-1] + _latin_letter(key[-1])]
+    return ipa
+
+
+# latin_to_bopomofo followed by bopomofo_to_ipa, in one scan
+def latin_bopomofo_to_ipa(text):
+    return _transliteration_re.sub(_transliterate, text)
+
+
+# the two retroflex / dental "-i" passes are disjoint ("s`" vs "s" without a backtick)
+_apical_vowel_re = re.compile("([sɹ]`[⁼ʰ]?|s[⁼ʰ]?)([→↓↑ ]+|$)")
+# drop a leading "|" and unknown symbols, and fence punctuation with "|"
+_clean_re = re.compile(r"^\||[^\w\s_,\.\?!;:\'…\|→↓↑⁼ʰ`]|([,\.\?!;:\'…])")
+_separators_re = re.compile(r"\|+")
+
+
+def _finish_ipa(text):
+    text = _apical_vowel_re.sub(r"\1ɹ\2", text)
+    text = _clean_re.sub(lambda m: "|%s|" % m.group(1) if m.group(1) else "", text)
+    text = _separators_re.sub("|", text)
+    return text.rstrip("|")
+
+
 def _chinese_to_ipa(text, sentence):
     text = re.sub(r"\s", "_", text)
 
@@ -574,15 +684,8 @@ def _chinese_to_ipa(text, sentence):
     text = normalization(text)
     text = chinese_to_bopomofo(text, sentence)
     # pinyin = bpmf_to_pinyin(text)
-    text = latin_to_bopomofo(text)
-    text = bopomofo_to_ipa(text)
-    text = re.sub("([sɹ]`[⁼ʰ]?)([→↓↑ ]+|$)", r"\1ɹ\2", text)
-    text = re.sub("([s][⁼ʰ]?)([→↓↑ ]+|$)", r"\1ɹ\2", text)
-    text = re.sub(r"^\||[^\w\s_,\.\?!;:\'…\|→↓↑⁼ʰ`]", "", text)
-    text = re.sub(r"([,\.\?!;:\'…])", r"|\1|", text)
-    text = re.sub(r"\|+", "|", text)
-    text = text.rstrip("|")
-    return text
+    text = latin_bopomofo_to_ipa(text)
+    return _finish_ipa(text)
 
 
 # Convert Chinese to IPA
@@ -0,0 +1,185 @@
+# Copyright (c) 2024 Amphion.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+ONNX Runtime sessions for the polyphone model.
+
+The session options (threads, execution mode, memory arena, providers, IO binding,
+int8 model variant, pool size) come from `configure_sessions`. Call it before the
+model's first use (mandarin.get_poly_predictor), which creates the sessions. Settings
+can also come from G2P_ORT_* environment variables, e.g. G2P_ORT_INTRA_OP_THREADS=2.
+"""
+
+import os
+import queue
+from collections import OrderedDict
+
+import numpy as np
+from onnxruntime import (
+    ExecutionMode,
+    GraphOptimizationLevel,
+    InferenceSession,
+    SessionOptions,
+    get_available_providers,
+)
+
+DEFAULT_SESSION_CONFIG = {
+    # None: CUDA when onnxruntime-gpu is installed, else CPU
+    "providers": None,
+    # 0 lets onnxruntime use every core; set it on hosts shared with torch
+    "intra_op_num_threads": 0,
+    "inter_op_num_threads": 1,
+    "execution_mode": "sequential",  # sequential, parallel
+    "enable_cpu_mem_arena": True,
+    "enable_mem_pattern": True,
+    # bind inputs / outputs to preallocated buffers instead of copying per run
+    "io_binding": False,
+    # use poly_bert_model.int8.onnx (see quantize_model) when it exists
+    "quantized": False,
+    # sessions shared by concurrent callers, each with its own IO binding
+    "pool_size": 1,
+}
+
+_ENV_PREFIX = "G2P_ORT_"
+_ENV_KEYS = {
+    "INTRA_OP_THREADS": ("intra_op_num_threads", int),
+    "INTER_OP_THREADS": ("inter_op_num_threads", int),
+    "EXECUTION_MODE": ("execution_mode", str),
+    "CPU_MEM_ARENA": ("enable_cpu_mem_arena", lambda v: v.lower() in ("1", "true", "yes")),
+    "IO_BINDING": ("io_binding", lambda v: v.lower() in ("1", "true", "yes")),
+    "QUANTIZED": ("quantized", lambda v: v.lower() in ("1", "true", "yes")),
+    "POOL_SIZE": ("pool_size", int),
+    "PROVIDERS": ("providers", lambda v: [p.strip() for p in v.split(",") if p.strip()]),
+}
+
+_session_config = dict(DEFAULT_SESSION_CONFIG)
+
+
+def configure_sessions(**options):
+    """Updates the options of sessions created from now on, returns the full config."""
+    unknown = set(options) - set(DEFAULT_SESSION_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown onnxruntime session options: {sorted(unknown)}")
+    _session_config.update({key: value for key, value in options.items() if value is not None})
+    return dict(_session_config)
+
+
+def get_session_config():
+    config = dict(_session_config)
+    for suffix, (key, parse) in _ENV_KEYS.items():
+        value = os.environ.get(_ENV_PREFIX + suffix)
+        if value not in (None, ""):
+            config[key] = parse(value)
+    return config
+
+
+def quantized_model_path(model_path):
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.int8{ext}"
+
+
+def quantize_model(model_path, output_path=None):
+    """Writes a dynamically int8-quantized copy of `model_path` next to it."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    output_path = output_path or quantized_model_path(model_path)
+    quantize_dynamic(model_path, output_path, weight_type=QuantType.QInt8)
+    return output_path
+
+
+def resolve_model_path(model_path, config):
+    if config["quantized"]:
+        int8_path = quantized_model_path(model_path)
+        if os.path.exists(int8_path):
+            return int8_path
+        print(f"int8 polyphone model {int8_path} not found, using {model_path}")
+    return model_path
+
+
+def create_session(model_path, config=None):
+    config = config or get_session_config()
+    options = SessionOptions()
+    options.graph_optimization_level = GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = config["intra_op_num_threads"]
+    options.inter_op_num_threads = config["inter_op_num_threads"]
+    options.execution_mode = (
+        ExecutionMode.ORT_PARALLEL if config["execution_mode"] == "parallel" else ExecutionMode.ORT_SEQUENTIAL
+    )
+    options.enable_cpu_mem_arena = config["enable_cpu_mem_arena"]
+    options.enable_mem_pattern = config["enable_mem_pattern"]
+
+    providers = config["providers"]
+    if providers is None:
+        providers = [
+            provider
+            for provider in ("CUDAExecutionProvider", "CPUExecutionProvider")
+            if provider in get_available_providers()
+        ]
+    session = InferenceSession(resolve_model_path(model_path, config), sess_options=options, providers=providers)
+    # disable session.run() fallback mechanism, it prevents for a reset of the execution provider
+    session.disable_fallback()
+    return session
+
+
+class SessionRunner:
+    """One session; with IO binding, outputs go to buffers preallocated per input length."""
+
+    def __init__(self, session, io_binding=False, max_buffers=32):
+        self.session = session
+        self.io_binding = io_binding
+        self.output_name = session.get_outputs()[0].name
+        self.max_buffers = max_buffers
+        self._buffers = OrderedDict()
+        self._binding = session.io_binding() if io_binding else None
+
+    def run(self, input_ids):
+        if not self.io_binding:
+            return self.session.run(output_names=[self.output_name], input_feed={"input_ids": input_ids})[0]
+
+        key = input_ids.shape
+        output = self._buffers.get(key)
+        if output is None:
+            # the first run of a length learns the output shape, later runs write into its buffer
+            output = self.session.run(output_names=[self.output_name], input_feed={"input_ids": input_ids})[0]
+            self._buffers[key] = np.empty_like(output)
+            if len(self._buffers) > self.max_buffers:
+                self._buffers.popitem(last=False)
+            return output
+        self._buffers.move_to_end(key)
+        binding = self._binding
+        binding.bind_cpu_input("input_ids", input_ids)
+        binding.bind_output(
+            self.output_name, "cpu", 0, output.dtype.type, list(output.shape), output.ctypes.data
+        )
+        self.session.run_with_iobinding(binding)
+        binding.clear_binding_inputs()
+        binding.clear_binding_outputs()
+        # valid until the next run of this length, see SessionPool.run
+        return output
+
+
+class SessionPool:
+    """`pool_size` runners shared by concurrent callers, each call borrows one."""
+
+    def __init__(self, model_path, config=None):
+        config = config or get_session_config()
+        self.config = config
+        size = max(int(config["pool_size"]), 1)
+        self._runners = queue.Queue()
+        for _ in range(size):
+            self._runners.put(SessionRunner(create_session(model_path, config), io_binding=config["io_binding"]))
+        self.size = size
+
+    def run(self, input_ids, reduce=None):
+        """
+        Runs the model on `input_ids`. `reduce(output)` is applied while the runner is still
+        borrowed, so a reduction (e.g. argmax) can read a bound output buffer without copying it.
+        """
+        runner = self._runners.get()
+        try:
+            output = runner.run(input_ids)
+            return reduce(output) if reduce is not None else np.array(output, copy=True)
+        finally:
+            self._runners.put(runner)
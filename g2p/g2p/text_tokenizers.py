@@ -33,6 +33,12 @@ from phonemizer.backend.espeak.words_mismatch import WordMismatch
 from phonemizer.punctuation import Punctuation
 from phonemizer.separator import Separator
 
+_unknown_symbols_re = re.compile(r"[^\w\s_,\.\?!;:\'…]")
+_punctuation_spaces_re = re.compile(r"\s*([,\.\?!;:\'…])\s*")
+_whitespace_re = re.compile(r"\s+")
+_punctuation_re = re.compile(r"([,\.\?!;:\'…])")
+_separators_re = re.compile(r"\|+")
+
 
 class TextTokenizer:
     """Phonemize Text."""
@@ -85,27 +91,31 @@ class TextTokenizer:
         text = text.replace("...", "…")
         return text
 
-    def __call__(self, text, strip=True) -> List[str]:
+    def __call__(self, text, strip=True, njobs=1) -> List[str]:
+        """
+        Phonemizes a string, or a list of strings in one backend call. `njobs` > 1 splits a
+        list across that many espeak workers.
+        """
 
         text_type = type(text)
         normalized_text = []
         for line in str2list(text):
             line = self.convert_chinese_punctuation(line.strip())
-            line = re.sub(r"[^\w\s_,\.\?!;:\'…]", "", line)
-            line = re.sub(r"\s*([,\.\?!;:\'…])\s*", r"\1", line)
-            line = re.sub(r"\s+", " ", line)
+            line = _unknown_symbols_re.sub("", line)
+            line = _punctuation_spaces_re.sub(r"\1", line)
+            line = _whitespace_re.sub(" ", line)
             normalized_text.append(line)
         # print("Normalized test: ", normalized_text[0])
         phonemized = self.backend.phonemize(
-            normalized_text, separator=self.separator, strip=strip, njobs=1
+            normalized_text, separator=self.separator, strip=strip, njobs=njobs
         )
         if text_type == str:
-            phonemized = re.sub(r"([,\.\?!;:\'…])", r"|\1|", list2str(phonemized))
-            phonemized = re.sub(r"\|+", "|", phonemized)
+            phonemized = _punctuation_re.sub(r"|\1|", list2str(phonemized))
+            phonemized = _separators_re.sub("|", phonemized)
             phonemized = phonemized.rstrip("|")
         else:
             for i in range(len(phonemized)):
-                phonemized[i] = re.sub(r"([,\.\?!;:\'…])", r"|\1|", phonemized[i])
-                phonemized[i] = re.sub(r"\|+", "|", phonemized[i])
+                phonemized[i] = _punctuation_re.sub(r"|\1|", phonemized[i])
+                phonemized[i] = _separators_re.sub("|", phonemized[i])
                 phonemized[i] = phonemized[i].rstrip("|")
         return phonemized
@@ -4,18 +4,16 @@
 # LICENSE file in the root directory of this source tree.
 
 import os
-import sys
+import threading
+from typing import List
 
 from g2p.g2p import PhonemeBpeTokenizer
-from g2p.utils.g2p import phonemizer_g2p
-import tqdm
-from typing import List
-import json
-import os
-import re
+from g2p.utils.script_segment import get_segment
 
 
 def ph_g2p(text, language):
+    # imports phonemizer, only needed here
+    from g2p.utils.g2p import phonemizer_g2p
 
     return phonemizer_g2p(text=text, language=language)
 
@@ -25,85 +23,13 @@ def g2p(text, sentence, language):
     return text_tokenizer.tokenize(text=text, sentence=sentence, language=language)
 
 
-def is_chinese(char):
-    if char >= "\u4e00" and char <= "\u9fa5":
-        return True
-    else:
-        return False
-
-
-def is_alphabet(char):
-    if (char >= "\u0041" and char <= "\u005a") or (
-        char >= "\u0061" and char <= "\u007a"
-    ):
-        return True
-    else:
-        return False
-
-
-def is_other(char):
-    if not (is_chinese(char) or is_alphabet(char)):
-        return True
-    else:
-        return False
-
-
-def get_segment(text: str) -> List[str]:
-    # sentence --> [ch_part, en_part, ch_part, ...]
-    segments = []
-    types = []
-    flag = 0
-    temp_seg = ""
-    temp_lang = ""
-
-    # Determine the type of each character. type: blank, chinese, alphabet, number, unk and point.
-    for i, ch in enumerate(text):
-        if is_chinese(ch):
-            types.append("zh")
-        elif is_alphabet(ch):
-            types.append("en")
-        else:
-            types.append("other")
-
-    assert len(types) == len(text)
-
-    for i in range(len(types)):
-        # find the first char of the seg
-        if flag == 0:
-            temp_seg += text[i]
-            temp_lang = types[i]
-            flag = 1
-        else:
-            if temp_lang == "other":
-                if types[i] == temp_lang:
-                    temp_seg += text[i]
-                else:
-                    temp_seg += text[i]
-                    temp_lang = types[i]
-            else:
-                if types[i] == temp_lang:
-                    temp_seg += text[i]
-                elif types[i] == "other":
-                    temp_seg += text[i]
-                else:
-                    segments.append((temp_seg, temp_lang))
-                    temp_seg = text[i]
-                    temp_lang = types[i]
-                    flag = 1
-
-    segments.append((temp_seg, temp_lang))
-    return segments
-
-
-def chn_eng_g2p(text: str):
-    # now only en and ch
-    segments = get_segment(text)
+def _join_segments(segments, results):
     all_phoneme = ""
     all_tokens = []
 
     for index in range(len(segments)):
         seg = segments[index]
-        phoneme, token = g2p(seg[0], text, seg[1])
+        phoneme, token = results[index]
         all_phoneme += phoneme + "|"
         all_tokens += token
 
@@ -113,12 +39,53 @@ def chn_eng_g2p(text: str):
     return all_phoneme, all_tokens
 
 
+def chn_eng_g2p(text: str):
+    # now only en and ch
+    segments = get_segment(text)
+    # the line's espeak segments are phonemized in one backend call
+    return _join_segments(
+        segments, text_tokenizer.tokenize_many([(seg[0], text, seg[1]) for seg in segments])
+    )
+
+
+def chn_eng_g2p_many(texts: List[str], njobs: int = 1):
+    """
+    chn_eng_g2p for a whole lyric sheet: the segments of every line are collected and the
+    same-language espeak segments are phonemized in one backend call (`njobs` espeak workers).
+    """
+    segments = [get_segment(text) for text in texts]
+    results = text_tokenizer.tokenize_many(
+        [(seg[0], text, seg[1]) for text, segs in zip(texts, segments) for seg in segs],
+        njobs=njobs,
+    )
+    outputs = []
+    start = 0
+    for segs in segments:
+        outputs.append(_join_segments(segs, results[start:start + len(segs)]))
+        start += len(segs)
+    return outputs
+
+
+def warm_up(languages=("zh", "en"), background=True):
+    """
+    Runs the lazy initialization of the given languages' front ends (espeak backends, jieba,
+    polyphone model, language identifier) ahead of the first request, by default in a daemon
+    thread. Returns the thread, or None when run inline.
+    """
+    if not background:
+        text_tokenizer.warm_up(languages)
+        return None
+    thread = threading.Thread(
+        target=text_tokenizer.warm_up, args=(tuple(languages),), name="g2p-warm-up", daemon=True
+    )
+    thread.start()
+    return thread
+
+
 vocab_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "g2p/vocab.json")
+# language back ends are created on first use, see warm_up
 text_tokenizer = PhonemeBpeTokenizer(vacab_path=vocab_path)
-with open(vocab_path, "r") as f:
-    json_data = f.read()
-data = json.loads(json_data)
-vocab = data["vocab"]
+vocab = text_tokenizer.vocab
 
 if __name__ == '__main__':
     phone, token = chn_eng_g2p("你好，hello world")
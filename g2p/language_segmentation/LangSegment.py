@@ -16,8 +16,11 @@ https://github.com/juntaosun/LangSegment
 import os
 import re
 import sys
+import threading
+import unicodedata
 import numpy as np
 from collections import Counter
+from collections import OrderedDict
 from collections import defaultdict
 
 # import langid
@@ -210,17 +213,31 @@ class LangSSML:
         return chinese_date
 
 
+class _ParseState:
+    """一次 getTexts 解析的中间状态，不放在共享的 LangSegment 实例上，多个线程可以同时解析"""
+
+    def __init__(self, enable_preview):
+        self.text_cache = {}
+        self.text_waits = []
+        self.lang_count = None
+        self.lang_eos = False
+        self.enable_preview = enable_preview
+
+
 class LangSegment:
 
     def __init__(self):
 
-        self.langid = LanguageIdentifier.from_pickled_model(MODEL_FILE, norm_probs=True)
+        # 语种识别模型在第一次使用时才加载（见 langid / warm_up）
+        self._langid = None
+        self._langid_lock = threading.Lock()
 
-        self._text_cache = None
-        self._text_lasts = None
-        self._text_langs = None
-        self._lang_count = None
-        self._lang_eos =   None
+        # 解析结果的 LRU 缓存：(文本, 配置) -> (分段结果, 语种统计)
+        self.cacheSize = 1024
+        self._results = OrderedDict()
+        self._results_lock = threading.Lock()
+        # 每个线程最近一次 getTexts 的结果，仅供 getCounts 使用
+        self._lasts = threading.local()
     
         # 可自定义语言匹配标签：カスタマイズ可能な言語対応タグ:사용자 지정 가능한 언어 일치 태그:
         # Customizable language matching tags: These are supported，이 표현들은 모두 지지합니다
@@ -291,13 +308,23 @@ class LangSegment:
 
         self.LangSSML = LangSSML()
 
+    @property
+    def langid(self):
+        if self._langid is None:
+            with self._langid_lock:
+                if self._langid is None:
+                    self._langid = LanguageIdentifier.from_pickled_model(MODEL_FILE, norm_probs=True)
+        return self._langid
+
+    def warm_up(self):
+        """提前加载语种识别模型"""
+        return self.langid
+
     def _clears(self):
-        self._text_cache = None
-        self._text_lasts = None
-        self._text_langs = None
-        self._text_waits = None
-        self._lang_count = None
-        self._lang_eos   = None
+        with self._results_lock:
+            self._results.clear()
+        self._lasts.words = None
+        self._lasts.counts = None
     
     def _is_english_word(self, word):
         return bool(re.match(r'^[a-zA-Z]+$', word))
@@ -321,15 +348,14 @@ class LangSegment:
     def _split_camel_case(self, word):
         return re.sub(r'(?<!^)(?=[A-Z])', ' ', word)
     
-    def _statistics(self, language, text):
+    def _statistics(self, state, language, text):
         # Language word statistics:
         # Chinese characters usually occupy double bytes
-        if self._lang_count is None or not isinstance(self._lang_count, defaultdict):
-            self._lang_count = defaultdict(int)
-        lang_count = self._lang_count
+        if state.lang_count is None:
+            state.lang_count = defaultdict(int)
+        lang_count = state.lang_count
         if not "|" in language:
             lang_count[language] += int(len(text)*2) if language == "zh" else len(text)
-        self._lang_count = lang_count
     
     def _clear_text_number(self, text):
         if text == "\n":return text,False # Keep Line Breaks
@@ -337,7 +363,7 @@ class LangSegment:
         is_number = len(re.sub(re.compile(r'(\d+)'),'',clear_text)) == 0
         return clear_text,is_number
     
-    def _saveData(self, words,language:str,text:str,score:float,symbol=None):
+    def _saveData(self, state, words,language:str,text:str,score:float,symbol=None):
         # Pre-detection
         clear_text , is_number = self._clear_text_number(text)
         # Merge the same language and save the results
@@ -348,7 +374,7 @@ class LangSegment:
             elif is_number == True:language = preData["lang"]
             _ , pre_is_number = self._clear_text_number(preData["text"])
             if (preData["lang"] == language):
-                self._statistics(preData["lang"],text)
+                self._statistics(state,preData["lang"],text)
                 text = preData["text"] + text
                 preData["text"] = text
                 return preData
@@ -364,17 +390,17 @@ class LangSegment:
             language in filters or language in filters[0] or \
             filters[0] == "*" or filters[0] in "alls-mixs-autos":
             words.append(data)
-            self._statistics(data["lang"],data["text"])
+            self._statistics(state,data["lang"],data["text"])
         return data
 
-    def _addwords(self, words,language,text,score,symbol=None):
+    def _addwords(self, state, words,language,text,score,symbol=None):
         if text == "\n":pass # Keep Line Breaks
         elif text is None or len(text.strip()) == 0:return True
         if language is None:language = ""
         language = language.lower()
         if language == 'en':text = self._insert_english_uppercase(text)
         # text = re.sub(r'[(（）)]', ',' , text) # Keep it.
-        text_waits = self._text_waits
+        text_waits = state.text_waits
         ispre_waits = len(text_waits)>0
         preResult = text_waits.pop() if ispre_waits else None
         if preResult is None:preResult = words[-1] if len(words) > 0 else None
@@ -382,11 +408,11 @@ class LangSegment:
             pre_lang = preResult["lang"]
             if language in pre_lang:preResult["lang"] = language = language.split("|")[0]
             else:preResult["lang"]=pre_lang.split("|")[0]
-            if ispre_waits:preResult = self._saveData(words,preResult["lang"],preResult["text"],preResult["score"],preResult["symbol"])
+            if ispre_waits:preResult = self._saveData(state,words,preResult["lang"],preResult["text"],preResult["score"],preResult["symbol"])
         pre_lang = preResult["lang"] if preResult else None
         if ("|" in language) and (pre_lang and not pre_lang in language and not "…" in language):language = language.split("|")[0]
-        if "|" in language:self._text_waits.append({"lang":language,"text": text,"score":score,"symbol":symbol})
-        else:self._saveData(words,language,text,score,symbol)
+        if "|" in language:text_waits.append({"lang":language,"text": text,"score":score,"symbol":symbol})
+        else:self._saveData(state,words,language,text,score,symbol)
         return False
     
     def _get_prev_data(self, words):
@@ -409,27 +435,43 @@ class LangSegment:
     def _mean_processing(self, text:str):
         if text is None or (text.strip()) == "":return None , 0.0
         arrs = self._split_camel_case(text).split(" ")
-        langs = []
-        for t in arrs:
-            if len(t.strip()) <= 3:continue
-            language, score = self.langid.classify(t)
-            langs.append({"lang":language})
+        langs = [language for language , _ in self._lang_classify_many([t for t in arrs if len(t.strip()) > 3])]
         if len(langs) == 0:return None , 0.0
-        return Counter([item['lang'] for item in langs]).most_common(1)[0][0],1.0
+        return Counter(langs).most_common(1)[0][0],1.0
     
-    def _lang_classify(self, cleans_text):
-        language, score = self.langid.classify(cleans_text)
+    def _lang_score(self, language, score):
         # fix: Huggingface is np.float32
         if score is not None and isinstance(score, np.generic) and hasattr(score,"item"):
             score = score.item()
         score = round(score , 3)
         return language, score
-    
+
+    def _lang_classify(self, cleans_text):
+        return self._lang_classify_many([cleans_text])[0]
+
+    def _lang_classify_many(self, texts):
+        """
+        批量语种识别，与逐条 langid.classify 相同。特征向量非常稀疏，
+        只取这批文本出现过的特征行，用一次矩阵乘法给所有片段打分。
+        """
+        if len(texts) == 0:return []
+        langid = self.langid
+        if not all(hasattr(langid, name) for name in ("instance2fv", "nb_ptc", "nb_pc", "nb_classes")):
+            return [self._lang_score(*langid.classify(t)) for t in texts]
+        fvs = np.stack([langid.instance2fv(t) for t in texts])
+        features = np.flatnonzero(fvs.any(axis=0))
+        pds = np.dot(fvs[:, features].astype(np.float64), langid.nb_ptc[features]) + langid.nb_pc
+        classes = np.argmax(pds, axis=1)
+        # 与 norm_probs=True 时的归一化相同，只算最高类的概率
+        with np.errstate(over='ignore'):
+            probs = 1 / np.exp(pds - pds[np.arange(len(texts)), classes][:, None]).sum(1)
+        return [self._lang_score(str(langid.nb_classes[c]), p) for c, p in zip(classes, probs)]
+
     def _get_filters_string(self):
         filters = self.Langfilters
         return "-".join(filters).lower().strip() if filters is not None else ""
     
-    def _parse_language(self, words , segment):
+    def _parse_language(self, state, words , segment):
         LANG_JA = "ja"
         LANG_ZH = "zh"
         LANG_ZH_JA = f'{LANG_ZH}|{LANG_JA}'
@@ -438,7 +480,10 @@ class LangSegment:
         regex_pattern = re.compile(r'([^\w\s]+)')
         lines = regex_pattern.split(segment)
         lines_max = len(lines)
-        LANG_EOS =self._lang_eos
+        LANG_EOS =state.lang_eos
+        number_tags = re.compile(r'(⑥\d{6,}⑥)')
+        # 先合并标点与过短的片段（与识别结果无关），收集要识别语种的片段，一次批量识别
+        spans = []
         for index, text in enumerate(lines):
             if len(text) == 0:continue
             EOS = index >= (lines_max - 1)
@@ -449,7 +494,6 @@ class LangSegment:
             if not EOS and (textPunc == True or ( len(nextText.strip()) >= 0 and nextPunc == True)):
                 lines[nextId] = f'{text}{nextText}'
                 continue
-            number_tags = re.compile(r'(⑥\d{6,}⑥)')
             cleans_text = re.sub(number_tags, '' ,text)
             cleans_text = re.sub(r'\d+', '' ,cleans_text)
             cleans_text = self._cleans_text(cleans_text)
@@ -457,7 +501,9 @@ class LangSegment:
             if not EOS and len(cleans_text) <= 2:
                 lines[nextId] = f'{text}{nextText}'
                 continue
-            language,score = self._lang_classify(cleans_text)
+            spans.append((text, cleans_text, EOS))
+        scores = self._lang_classify_many([cleans_text for _, cleans_text, _ in spans])
+        for (text, cleans_text, EOS), (language, score) in zip(spans, scores):
             prev_language , prev_text = self._get_prev_data(words)
             if language != LANG_ZH and all('\u4e00' <= c <= '\u9fff' for c in re.sub(r'\s','',cleans_text)):language,score = LANG_ZH,1
             if len(cleans_text) <= 5 and self._is_chinese(cleans_text):
@@ -475,8 +521,8 @@ class LangSegment:
                     referen = prev_language in LANG_UNKNOWN or LANG_UNKNOWN in prev_language if prev_language else False
                     if match_char in "。.": language = prev_language if referen and len(words) > 0 else language
                     else:language = f"{LANG_UNKNOWN}|…"
-            text,*_ = re.subn(number_tags , self._restore_number , text )
-            self._addwords(words,language,text,score)
+            text,*_ = re.subn(number_tags , lambda matche: self._restore_number(state, matche) , text )
+            self._addwords(state,words,language,text,score)
     
     # ----------------------------------------------------------
     # 【SSML】中文数字处理：Chinese Number Processing (SSML support)
@@ -484,7 +530,7 @@ class LangSegment:
     # The default here is Chinese, which is used to process SSML Chinese tags. Of course, any language can be supported, for example:
     # 中文电话号码：<telephone>1234567</telephone>
     # 中文数字号码：<number>1234567</number>
-    def _process_symbol_SSML(self, words,data):
+    def _process_symbol_SSML(self, state, words,data):
         tag , match = data
         language = SSML = match[1]
         text = match[2]
@@ -505,19 +551,19 @@ class LangSegment:
             # 中文-按金额发音
             language = "zh"
             text = self.LangSSML.to_chinese_date(text)
-        self._addwords(words,language,text,score,SSML)
+        self._addwords(state,words,language,text,score,SSML)
         
     # ----------------------------------------------------------
-    def _restore_number(self, matche):
+    def _restore_number(self, state, matche):
         value = matche.group(0)
-        text_cache = self._text_cache
+        text_cache = state.text_cache
         if value in text_cache:
             process , data = text_cache[value]
             tag , match = data
             value = match
         return value
 
-    def _pattern_symbols(self, item , text):
+    def _pattern_symbols(self, state, item , text):
         if text is None:return text
         tag , pattern , process = item
         matches = pattern.findall(text)
@@ -526,27 +572,27 @@ class LangSegment:
         for i , match in enumerate(matches):
             key = f"⑥{tag}{i:06d}⑥"
             text = re.sub(pattern , key , text , count=1)
-            self._text_cache[key] = (process , (tag , match))
+            state.text_cache[key] = (process , (tag , match))
         return text
     
-    def _process_symbol(self, words,data):
+    def _process_symbol(self, state, words,data):
         tag , match = data
         language = match[1]
         text = match[2]
         score = 1.0
         filters = self._get_filters_string()
         if language not in filters:
-            self._process_symbol_SSML(words,data)
+            self._process_symbol_SSML(state,words,data)
         else:
-            self._addwords(words,language,text,score,True)
+            self._addwords(state,words,language,text,score,True)
     
-    def _process_english(self, words,data):
+    def _process_english(self, state, words,data):
         tag , match = data
         text = match[0]
         filters = self._get_filters_string()
         priority_language = filters[:2]
         # Preview feature, other language segmentation processing
-        enablePreview = self.EnablePreview
+        enablePreview = state.enable_preview
         if enablePreview == True:
             # Experimental: Other language support
             regex_pattern = re.compile(r'(.*?[。.?？!！]+[\n]{,1})')
@@ -562,55 +608,55 @@ class LangSegment:
                 elif score >= 0.95:continue # High score, but not in the filter, excluded.
                 elif score <= 0.15 and filters[:2] == "fr":language = priority_language
                 else:language = "en"
-                self._addwords(words,language,text,score)
+                self._addwords(state,words,language,text,score)
         else:
             # Default is English
             language, score = "en", 1.0
-            self._addwords(words,language,text,score)
+            self._addwords(state,words,language,text,score)
     
-    def _process_Russian(self, words,data):
+    def _process_Russian(self, state, words,data):
         tag , match = data
         text = match[0]
         language = "ru"
         score = 1.0
-        self._addwords(words,language,text,score)
+        self._addwords(state,words,language,text,score)
 
-    def _process_Thai(self, words,data):
+    def _process_Thai(self, state, words,data):
         tag , match = data
         text = match[0]
         language = "th"
         score = 1.0
-        self._addwords(words,language,text,score)
+        self._addwords(state,words,language,text,score)
     
-    def _process_korean(self, words,data):
+    def _process_korean(self, state, words,data):
         tag , match = data
         text = match[0]
         language = "ko"
         score = 1.0
-        self._addwords(words,language,text,score)
+        self._addwords(state,words,language,text,score)
     
-    def _process_quotes(self, words,data):
+    def _process_quotes(self, state, words,data):
         tag , match = data
         text = "".join(match)
         childs = self.PARSE_TAG.findall(text)
         if len(childs) > 0:
-            self._process_tags(words , text , False)
+            self._process_tags(state , words , text , False)
         else:
             cleans_text = self._cleans_text(match[1])
             if len(cleans_text) <= 5:
-                self._parse_language(words,text)
+                self._parse_language(state,words,text)
             else:
                 language,score = self._lang_classify(cleans_text)
-                self._addwords(words,language,text,score)
+                self._addwords(state,words,language,text,score)
     
-    def _process_pinyin(self, words,data):
+    def _process_pinyin(self, state, words,data):
         tag , match = data
         text = match
         language = "zh"
         score = 1.0
-        self._addwords(words,language,text,score)
+        self._addwords(state,words,language,text,score)
 
-    def _process_number(self, words,data): # "$0" process only
+    def _process_number(self, state, words,data): # "$0" process only
         """
         Numbers alone cannot accurately identify language.
         Because numbers are universal in all languages.
@@ -620,19 +666,19 @@ class LangSegment:
         language = words[0]["lang"] if len(words) > 0 else "zh"
         text = match
         score = 0.0
-        self._addwords(words,language,text,score)
+        self._addwords(state,words,language,text,score)
     
-    def _process_tags(self, words , text , root_tag):
-        text_cache = self._text_cache
+    def _process_tags(self, state, words , text , root_tag):
+        text_cache = state.text_cache
         segments = re.split(self.PARSE_TAG, text)
         segments_len = len(segments) - 1
         for index , text in enumerate(segments):
-            if root_tag:self._lang_eos = index >= segments_len
+            if root_tag:state.lang_eos = index >= segments_len
             if self.PARSE_TAG.match(text):
                 process , data = text_cache[text]
-                if process:process(words , data)
+                if process:process(state , words , data)
             else:
-                self._parse_language(words , text)
+                self._parse_language(state , words , text)
         return words
     
     def _merge_results(self, words):
@@ -665,7 +711,7 @@ class LangSegment:
         enablePreview = self.EnablePreview
         if "fr" in filters or \
            "vi" in filters:enablePreview = True
-        self.EnablePreview = enablePreview
+        state = _ParseState(enablePreview)
         # 实验性：法语字符支持。Prise en charge des caractères français
         RE_FR = "" if not enablePreview else "àáâãäåæçèéêëìíîïðñòóôõöùúûüýþÿ"
         # 实验性：越南语字符支持。Hỗ trợ ký tự tiếng Việt
@@ -691,11 +737,11 @@ class LangSegment:
         lines = re.findall(r'.*\n*', re.sub(self.PARSE_TAG, '' ,text))
         for index , text in enumerate(lines):
             if len(text.strip()) == 0:continue
-            self._lang_eos = False
-            self._text_cache = {}
+            state.lang_eos = False
+            state.text_cache = {}
             for item in process_list:
-                text = self._pattern_symbols(item , text)
-            cur_word = self._process_tags([] , text , True)
+                text = self._pattern_symbols(state , item , text)
+            cur_word = self._process_tags(state , [] , text , True)
             if len(cur_word) == 0:continue
             cur_data = cur_word[0] if len(cur_word) > 0 else None
             pre_data = words[-1] if len(words) > 0 else None
@@ -704,12 +750,12 @@ class LangSegment:
                 words.pop()
             words += cur_word
         if self.isLangMerge == True:words = self._merge_results(words)
-        lang_count = self._lang_count
+        lang_count = state.lang_count
         if lang_count and len(lang_count) > 0:
             lang_count = dict(sorted(lang_count.items(), key=lambda x: x[1], reverse=True))
             lang_count = list(lang_count.items())
-            self._lang_count = lang_count
-        return words
+        else:lang_count = None
+        return words , lang_count
 
     def setfilters(self, filters):
         # 当过滤器更改时，清除缓存
@@ -730,31 +776,45 @@ class LangSegment:
         return self.LangPriorityThreshold
 
     def getCounts(self):
-        lang_count = self._lang_count
+        # 当前线程最近一次 getTexts 的语种统计
+        lang_count = getattr(self._lasts, "counts", None)
         if lang_count is not None:return lang_count
-        text_langs = self._text_langs
+        text_langs = getattr(self._lasts, "words", None)
         if text_langs is None or len(text_langs) == 0:return [("zh",0)]
         lang_counts = defaultdict(int)
         for d in text_langs:lang_counts[d['lang']] += int(len(d['text'])*2) if d['lang'] == "zh" else len(d['text'])
         lang_counts = dict(sorted(lang_counts.items(), key=lambda x: x[1], reverse=True))
         lang_counts = list(lang_counts.items())
-        self._lang_count = lang_counts
+        self._lasts.counts = lang_counts
         return lang_counts
 
+    def _cache_key(self, text):
+        # 结果取决于文本与全部配置项；文本按 NFC 规范化并去掉首尾空白，
+        # 仅在这些方面不同的文本共享一条缓存（与 G2P 行缓存的键一致）
+        text = unicodedata.normalize("NFC", text).strip()
+        filters = self.Langfilters
+        filters = tuple(filters) if isinstance(filters, list) else filters
+        return (text, filters, self.LangPriorityThreshold, self.isLangMerge, self.keepPinyin, self.EnablePreview)
+
     def getTexts(self, text:str):
         if text is None or len(text.strip()) == 0:
-            self._clears()
+            self._lasts.words = None
+            self._lasts.counts = None
             return []
-        # lasts
-        text_langs = self._text_langs
-        if self._text_lasts == text and text_langs is not None:return text_langs 
-        # parse
-        self._text_waits = []
-        self._lang_count = None
-        self._text_lasts = text
-        text = self._parse_symbols(text)
-        self._text_langs = text
-        return text
+        key = self._cache_key(text)
+        with self._results_lock:
+            result = self._results.get(key)
+            if result is not None:self._results.move_to_end(key)
+        if result is None:
+            result = self._parse_symbols(text)
+            with self._results_lock:
+                self._results[key] = result
+                while len(self._results) > max(self.cacheSize, 0):self._results.popitem(last=False)
+        words , lang_count = result
+        self._lasts.words = words
+        self._lasts.counts = lang_count
+        # 返回副本，调用方修改结果不影响缓存
+        return [dict(d) for d in words]
     
     def classify(self, text:str):
         return self.getTexts(text)
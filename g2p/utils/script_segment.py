@@ -0,0 +1,55 @@
+# Copyright (c) 2024 Amphion.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Chinese / English script runs of a lyric line, used by g2p_generation.
+
+Only the standard library is needed here, the front-end models are not imported.
+"""
+
+import re
+from typing import List
+
+
+def is_chinese(char):
+    if char >= "\u4e00" and char <= "\u9fa5":
+        return True
+    else:
+        return False
+
+
+def is_alphabet(char):
+    if (char >= "\u0041" and char <= "\u005a") or (
+        char >= "\u0061" and char <= "\u007a"
+    ):
+        return True
+    else:
+        return False
+
+
+def is_other(char):
+    if not (is_chinese(char) or is_alphabet(char)):
+        return True
+    else:
+        return False
+
+
+# One script run per match: a Chinese run is a Chinese character followed by anything but
+# letters, an English run a letter followed by anything but Chinese characters. Characters
+# of neither script stay with the run before them; leading ones join the first run.
+_segment_re = re.compile(
+    r"(?:^[^A-Za-z\u4e00-\u9fa5]*)?(?:([\u4e00-\u9fa5])[^A-Za-z]*|([A-Za-z])[^\u4e00-\u9fa5]*)"
+)
+
+
+def get_segment(text: str) -> List[str]:
+    # sentence --> [ch_part, en_part, ch_part, ...]
+    segments = [
+        (m.group(), "zh" if m.group(1) else "en") for m in _segment_re.finditer(text)
+    ]
+    if not segments:
+        # no Chinese character or letter at all
+        segments.append((text, "other" if text else ""))
+    return segments